@@ -1,3 +1,4 @@
 from .license import router as license_router
 from .user import router as user_router
-from .auth import router as auth_router 
\ No newline at end of file
+from .auth import router as auth_router 
+from .admin import router as admin_router
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from app.core.profiling import profile_store
+from app.api.deps import get_current_admin_user
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(get_current_admin_user)])
+
+@router.get("/profiles")
+async def list_profiles():
+    """Request profiles captured by this worker, newest first (admin only)"""
+    return profile_store.list()
+
+@router.get("/profiles/{profile_id}")
+async def read_profile(profile_id: str):
+    """Download a profile: collapsed stacks for speedscope, or a cProfile report"""
+    profile = profile_store.get(profile_id)
+    if not profile:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    extension = "txt" if profile["mode"] == "cprofile" else "collapsed"
+    return Response(
+        content=profile["output"],
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile_id}.{extension}"'}
+    )
+
+@router.delete("/profiles")
+async def clear_profiles():
+    """Drop every stored profile (admin only)"""
+    profile_store.clear()
+    return {"message": "Profiles cleared"}
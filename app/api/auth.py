@@ -27,7 +27,16 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user["username"], "user_id": user["user_id"], "role": user["role"]},
+        data={
+            "sub": user["username"],
+            "user_id": user["user_id"],
+            "role": user["role"],
+            "active": user["is_active"],
+            # Version of the user record the claims were taken from
+            "ver": user.get("update_at"),
+            # Password version: the token is revoked once the password changes
+            "pwd": user.get("password_changed_at")
+        },
         expires_delta=access_token_expires
     )
     
@@ -1,10 +1,37 @@
+import time
+from typing import Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.core.security import decode_access_token
+from app.core.config import settings
 from app.crud.user import user_crud
 
 security = HTTPBearer()
 
+def _principal_from_claims(payload: dict) -> Optional[dict]:
+    """Build the principal from signed claims when the token is recent enough to trust"""
+    window = settings.AUTH_TRUST_TOKEN_CLAIMS_SECONDS
+    issued_at = payload.get("iat")
+    if window <= 0 or issued_at is None or "role" not in payload or "active" not in payload:
+        return None
+    if time.time() - issued_at > window:
+        return None
+    return {
+        "user_id": payload["user_id"],
+        "username": payload["sub"],
+        "role": payload["role"],
+        "is_active": payload["active"],
+        "update_at": payload.get("ver"),
+        "password_changed_at": payload.get("pwd")
+    }
+
+async def _principal(payload: dict) -> Optional[dict]:
+    """User behind a decoded token; None if it is gone or the token predates a password change"""
+    user = _principal_from_claims(payload) or await user_crud.get_principal(payload["user_id"], payload.get("ver"))
+    if user is None or user.get("password_changed_at") != payload.get("pwd"):
+        return None
+    return user
+
 # Get current user from JWT token
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
@@ -25,11 +52,11 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = await user_crud.get(user_id)
+    user = await _principal(payload)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found",
+            detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
@@ -42,4 +69,26 @@ async def get_current_active_user(current_user = Depends(get_current_user)):
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Inactive user"
         )
-    return current_user 
\ No newline at end of file
+    return current_user
+
+# Get current admin user
+async def get_current_admin_user(current_user = Depends(get_current_active_user)):
+    if current_user.get("role") != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return current_user
+
+async def get_admin_from_authorization(authorization: Optional[str]) -> Optional[dict]:
+    """Active admin behind a raw ``Authorization`` header, for code outside route dependencies"""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    payload = decode_access_token(token)
+    if payload is None or payload.get("user_id") is None:
+        return None
+    user = await _principal(payload)
+    if user is None or not user.get("is_active") or user.get("role") != "admin":
+        return None
+    return user
@@ -1,17 +1,95 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
-from typing import List
-from app.schemas.license import License, LicenseCreate, LicenseUpdate
-from app.crud.license import license_crud
-from app.services.s3_service import s3_service
-from app.api.deps import get_current_active_user
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, UploadFile, File, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from app.schemas.license import (
+    License, LicenseCreate, LicenseUpdate, LicenseBatchGetRequest, LicenseBatchGetResponse,
+    LicenseStockChange, CartCheckoutRequest, LicenseStockShardsRequest,
+    ImageUploadRequest, ImageUploadURL, ImageUploadComplete
+)
+from app.crud.license import license_crud, InsufficientStockError
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.http_cache import item_etag, list_etag, etag_matches, not_modified
+from app.core.responses import COMPRESSION_VARY, dump_models, json_response
+from app.core.config import settings
+from app.services.s3_service import s3_service, ImageTooLarge, InvalidImage
+from app.services.license_import import import_licenses
+from app.services.license_export import export_licenses
+from app.services.thumbnails import generate_thumbnails, thumbnail_urls
+from app.api.deps import get_current_active_user, get_current_admin_user
 
 router = APIRouter(prefix="/licenses", tags=["licenses"])
 
+# Sharded stock changes without touching the license's update_at
+STOCK_ATTRIBUTES = ("stock_quantity",)
+
+def _stock_conflict(error: InsufficientStockError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail={
+            "message": "Insufficient stock",
+            # available is null for licenses that do not exist
+            "shortages": [
+                {"license_id": license_id, "available": available}
+                for license_id, available in error.shortages.items()
+            ]
+        }
+    )
+
 @router.get("/", response_model=List[License])
-async def read_licenses(skip: int = 0, limit: int = 10):
-    """Get all licenses with pagination"""
-    licenses = await license_crud.get_multi(skip=skip, limit=limit)
-    return [License(**license) for license in licenses]
+async def read_licenses(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    category: Optional[str] = None,
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort: Optional[str] = Query(None, pattern="^-?price$")
+):
+    """Get all licenses with pagination.
+
+    Filtering by ``category`` and/or a price band, or sorting by ``price``
+    (``-price`` for descending), browses active licenses through the price
+    indexes. Pass the ``X-Next-Cursor`` header of a page as ``cursor`` to get
+    the next one; ``skip`` is kept for compatibility only. Pages carry an
+    ETag and answer ``If-None-Match`` with 304.
+    """
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_price must not be greater than max_price"
+        )
+    filtered = bool(category or min_price is not None or max_price is not None or sort)
+    # Cursors only resume the listing they came from: scan, or the same index query
+    scope = f"licenses:query:{category}:{min_price}:{max_price}:{sort}" if filtered else "licenses"
+    start_key = None
+    if cursor:
+        start_key = decode_cursor(cursor, scope)
+        if start_key is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        skip = 0
+    if filtered:
+        licenses, last_key = await license_crud.query_page(
+            limit=limit,
+            exclusive_start_key=start_key,
+            category=category,
+            min_price=min_price,
+            max_price=max_price,
+            descending=sort == "-price",
+            skip=skip
+        )
+    else:
+        licenses, last_key = await license_crud.get_page(limit=limit, exclusive_start_key=start_key, skip=skip)
+    next_cursor = encode_cursor(last_key, scope)
+    cursor_headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    etag = list_etag((item_etag(license, "license_id", STOCK_ATTRIBUTES) for license in licenses), next_cursor)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, settings.LICENSE_LIST_CACHE_CONTROL, {**cursor_headers, **COMPRESSION_VARY})
+    headers = {**cursor_headers, "ETag": etag, "Cache-Control": settings.LICENSE_LIST_CACHE_CONTROL}
+    return json_response(request, dump_models(License, licenses), headers)
 
 @router.post("/", response_model=License)
 async def create_license(license_in: LicenseCreate):
@@ -19,30 +97,156 @@ async def create_license(license_in: LicenseCreate):
     license_data = await license_crud.create(license_in)
     return License(**license_data)
 
+@router.post("/import")
+async def import_license_catalog(
+    request: Request,
+    fmt: Optional[str] = Query(None, alias="format", pattern="^(ndjson|csv)$"),
+    current_user=Depends(get_current_admin_user)
+):
+    """Bulk import licenses from a streamed NDJSON or CSV body (admin only)"""
+    if fmt is None:
+        fmt = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    return await import_licenses(request.stream(), fmt, license_crud)
+
+@router.get("/export")
+async def export_license_catalog(
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    current_user=Depends(get_current_admin_user)
+):
+    """Stream the whole license catalog as NDJSON or CSV (admin only)"""
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        export_licenses(license_crud, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="licenses.{fmt}"'}
+    )
+
+@router.post("/batch-get", response_model=LicenseBatchGetResponse)
+async def batch_get_licenses(request: LicenseBatchGetRequest):
+    """Get several licenses at once, in request order"""
+    try:
+        items = await license_crud.get_many(request.license_ids)
+    except RuntimeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    return LicenseBatchGetResponse(
+        licenses=[License(**item) if item else None for item in items],
+        missing=[license_id for license_id, item in zip(request.license_ids, items) if item is None]
+    )
+
+@router.post("/checkout")
+async def checkout_cart(cart: CartCheckoutRequest, current_user=Depends(get_current_active_user)):
+    """Reserve the stock of every cart line atomically, all or nothing"""
+    try:
+        reserved = await license_crud.reserve_many([(item.license_id, item.quantity) for item in cart.items])
+    except InsufficientStockError as e:
+        raise _stock_conflict(e)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    return {"reserved": [{"license_id": license_id, "quantity": quantity} for license_id, quantity in reserved.items()]}
+
+@router.get("/search", response_model=List[License])
+async def search_licenses(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """Full-text search over product names, descriptions, platforms and launchers"""
+    licenses = await license_crud.search(q, limit=limit)
+    return json_response(request, dump_models(License, licenses))
+
 @router.get("/{license_id}", response_model=License)
-async def read_license(license_id: str):
-    """Get a specific license by ID"""
+async def read_license(license_id: str, request: Request, response: Response):
+    """Get a specific license by ID; answers ``If-None-Match`` with 304"""
+    # Served from the license cache when possible, so a revalidation of a hot
+    # license needs neither a DynamoDB read nor serialization
     license_data = await license_crud.get(license_id)
     if not license_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="License not found"
         )
+    etag = item_etag(license_data, "license_id", STOCK_ATTRIBUTES)
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag, settings.LICENSE_CACHE_CONTROL)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = settings.LICENSE_CACHE_CONTROL
     return License(**license_data)
 
 @router.put("/{license_id}", response_model=License)
 async def update_license(license_id: str, license_in: LicenseUpdate):
     """Update a license"""
-    # Actualizar la licencia
-    update_result = await license_crud.update(license_id, license_in)
-    if not update_result:
+    # Actualizar la licencia; update devuelve la licencia completa (ALL_NEW)
+    try:
+        license_data = await license_crud.update(license_id, license_in)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
+    if not license_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="License not found"
         )
-    
-    # Obtener la licencia actualizada completa
-    license_data = await license_crud.get(license_id)
+    return License(**license_data)
+
+@router.post("/{license_id}/reserve", response_model=License)
+async def reserve_license(
+    license_id: str,
+    change: LicenseStockChange = LicenseStockChange(),
+    current_user=Depends(get_current_active_user)
+):
+    """Atomically take units from a license's stock"""
+    try:
+        license_data = await license_crud.reserve(license_id, change.quantity)
+    except InsufficientStockError as e:
+        raise _stock_conflict(e)
+    if not license_data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="License not found"
+        )
+    return License(**license_data)
+
+@router.post("/{license_id}/release", response_model=License)
+async def release_license(
+    license_id: str,
+    change: LicenseStockChange = LicenseStockChange(),
+    current_user=Depends(get_current_admin_user)
+):
+    """Atomically give reserved units back to a license's stock (admin only).
+
+    Nothing ties a release to an earlier reservation, so letting any user call
+    it would let them mint stock.
+    """
+    license_data = await license_crud.release(license_id, change.quantity)
+    if not license_data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="License not found"
+        )
+    return License(**license_data)
+
+@router.post("/{license_id}/stock-shards", response_model=License)
+async def shard_license_stock(
+    license_id: str,
+    request: LicenseStockShardsRequest,
+    current_user=Depends(get_current_admin_user)
+):
+    """Split a license's stock across shards for flash sales (admin only)"""
+    try:
+        license_data = await license_crud.enable_stock_shards(license_id, request.shards)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=str(e)
+        )
     if not license_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -61,13 +265,65 @@ async def delete_license(license_id: str):
         )
     return {"message": "License deleted successfully"} 
 
+@router.post("/upload-url", response_model=ImageUploadURL)
+async def create_image_upload_url(
+    request: ImageUploadRequest,
+    current_user=Depends(get_current_active_user)
+):
+    """Presigned POST to upload an image straight to S3; finish with POST /licenses/{id}/image"""
+    return s3_service.presign_image_upload(request.content_type, request.sha256)
+
+@router.post("/{license_id}/image", response_model=License)
+async def complete_image_upload(
+    license_id: str,
+    upload: ImageUploadComplete,
+    background_tasks: BackgroundTasks,
+    current_user=Depends(get_current_active_user)
+):
+    """Validate a direct S3 upload and attach it to the license as its image"""
+    # La política ya lo limita, pero el objeto se vuelve a comprobar antes de publicarlo
+    try:
+        head = await s3_service.run(s3_service.check_upload, upload.key)
+    except InvalidImage as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    if head is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Upload not found"
+        )
+    key = upload.key
+    license_data = await license_crud.set_image(license_id, s3_service.public_url(key))
+    if not license_data:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="License not found"
+        )
+    background_tasks.add_task(generate_thumbnails, key)
+    return License(**license_data)
+
 @router.post("/upload-image", summary="Sube una imagen a S3 y retorna la URL pública")
 async def upload_license_image(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user=Depends(get_current_active_user)
 ):
+    # El tamaño declarado permite rechazar antes de enviar nada a S3
+    if file.size is not None and file.size > settings.S3_MAX_IMAGE_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image larger than {settings.S3_MAX_IMAGE_BYTES} bytes"
+        )
     try:
-        url = s3_service.upload_image(file.file, content_type=file.content_type)
-        return {"url": url}
+        url = await s3_service.upload_image_async(file.file, content_type=file.content_type)
+        key = s3_service.key_from_url(url)
+        background_tasks.add_task(generate_thumbnails, key)
+        return {"url": url, "thumbnails": thumbnail_urls(key)}
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except InvalidImage as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
@@ -1,15 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
+from typing import List, Optional
 from app.schemas.user import User, UserCreate, UserUpdate
-from app.crud.user import user_crud
+from app.crud.user import user_crud, FieldsChangedError
+from app.core.pagination import encode_cursor, decode_cursor
+from app.core.responses import dump_models, json_response
+from app.core.security import hash_password
+from app.api.deps import get_current_active_user
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 @router.get("/", response_model=List[User])
-async def read_users(skip: int = 0, limit: int = 10):
-    """Get all users with pagination"""
-    users = await user_crud.get_multi(skip=skip, limit=limit)
-    return [User(**user) for user in users]
+async def read_users(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """Get all users with pagination.
+
+    Pass the ``X-Next-Cursor`` header of a page as ``cursor`` to get the next one;
+    ``skip`` is kept for compatibility only.
+    """
+    start_key = None
+    if cursor:
+        start_key = decode_cursor(cursor, "users")
+        if start_key is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        skip = 0
+    users, last_key = await user_crud.get_page(limit=limit, exclusive_start_key=start_key, skip=skip)
+    next_cursor = encode_cursor(last_key, "users")
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return json_response(request, dump_models(User, users), headers)
 
 @router.post("/", response_model=User)
 async def create_user(user_in: UserCreate):
@@ -45,35 +70,48 @@ async def read_user(user_id: str):
     return User(**user_data)
 
 @router.put("/{user_id}", response_model=User)
-async def update_user(user_id: str, user_in: UserUpdate):
-    """Update a user"""
-    # Check if user exists
-    existing_user = await user_crud.get(user_id)
-    if not existing_user:
+async def update_user(user_id: str, user_in: UserUpdate, current_user=Depends(get_current_active_user)):
+    """Update a user: your own account, or any account as an admin.
+
+    Only admins may change a role.
+    """
+    is_admin = current_user.get("role") == "admin"
+    if current_user["user_id"] != user_id and not is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not allowed to update this user"
+        )
+    if "role" in user_in.model_fields_set and not is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required to change a role"
+        )
+    # Hashed once for both attempts below: bcrypt is the expensive part of the request
+    hashed_password = await hash_password(user_in.password) if user_in.password else None
+    try:
+        # Usually username and email stay the same: then the conditional write is the only call
+        user_data = await user_crud.update(user_id, user_in, unchanged=("username", "email"), hashed_password=hashed_password)
+    except FieldsChangedError as e:
+        # Only the fields actually changing need their uniqueness checked
+        lookups = {"username": user_crud.get_by_username, "email": user_crud.get_by_email}
+        changed = [
+            field for field in lookups
+            if getattr(user_in, field) and getattr(user_in, field) != e.stored.get(field)
+        ]
+        conflicts = await asyncio.gather(*(lookups[field](getattr(user_in, field)) for field in changed))
+        for field, conflict in zip(changed, conflicts):
+            if conflict and conflict["user_id"] != user_id:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Username already taken" if field == "username" else "Email already registered"
+                )
+        user_data = await user_crud.update(user_id, user_in, hashed_password=hashed_password)
+
+    if not user_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
-    
-    # Check if new username conflicts with existing user
-    if user_in.username and user_in.username != existing_user["username"]:
-        conflict_user = await user_crud.get_by_username(user_in.username)
-        if conflict_user:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Username already taken"
-            )
-    
-    # Check if new email conflicts with existing user
-    if user_in.email and user_in.email != existing_user["email"]:
-        conflict_email = await user_crud.get_by_email(user_in.email)
-        if conflict_email:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email already registered"
-            )
-    
-    user_data = await user_crud.update(user_id, user_in)
     return User(**user_data)
 
 @router.delete("/{user_id}")
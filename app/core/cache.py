@@ -0,0 +1,102 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries expire ``ttl`` seconds after being set.
+
+    Meant to be used from the event loop only, so it takes no locks. A ``ttl``
+    of 0 disables the cache.
+
+    Read-through fills take ``version()`` before reading the source and pass it
+    to ``set(..., since=...)``: a fill whose key was popped (or the cache cleared)
+    while the read was in flight is dropped instead of caching stale data.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, timer: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # Bumped by every pop and clear; the latest pop of each key is kept
+        # (bounded like the entries) to reject fills that raced it
+        self._version = 0
+        self._popped: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._forgotten = 0
+        self._cleared = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.maxsize > 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at <= self._timer():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def version(self) -> int:
+        return self._version
+
+    def _changed_since(self, key: Hashable, since: int) -> bool:
+        return max(self._cleared, self._forgotten, self._popped.get(key, 0)) > since
+
+    def set(self, key: Hashable, value: Any, since: Optional[int] = None):
+        if not self.enabled:
+            return
+        if since is not None and self._changed_since(key, since):
+            return
+        self._data[key] = (value, self._timer() + self.ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        self._version += 1
+        self._popped[key] = self._version
+        self._popped.move_to_end(key)
+        while len(self._popped) > max(self.maxsize, 1):
+            # Forgotten pops still reject every fill that started before them
+            _, self._forgotten = self._popped.popitem(last=False)
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self._version += 1
+        self._cleared = self._version
+        self._data.clear()
+        self._popped.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[1] > self._timer()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
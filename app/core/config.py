@@ -7,16 +7,97 @@ load_dotenv()
 
 class Settings(BaseSettings):
     ENV: str = os.getenv("ENV", "development")
+    # Logging: base level, per-module overrides ("app.crud=DEBUG,app.db=WARNING"),
+    # json/text output and the share of DEBUG payload records kept
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")
+    LOG_DEBUG_SAMPLE_RATE: float = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 0.1))
     DYNAMODB_REGION: str = os.getenv("DYNAMODB_REGION", "us-east-1")
     DYNAMODB_TABLE: str = os.getenv("DYNAMODB_TABLE", "Licenses")
+    DYNAMODB_STOCK_SHARDS_TABLE: str = os.getenv("DYNAMODB_STOCK_SHARDS_TABLE", "LicenseStockShards")
     DYNAMODB_ENDPOINT_URL: Optional[str] = os.getenv("DYNAMODB_ENDPOINT_URL", None)
+    # Storage backend: "dynamodb", or "memory" for process-local tables (tests, load experiments)
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "dynamodb")
+    # Max DynamoDB calls in flight per worker process
+    DYNAMODB_MAX_CONCURRENCY: int = int(os.getenv("DYNAMODB_MAX_CONCURRENCY", 32))
+    # Shared boto3 connection pool; size it to at least DYNAMODB_MAX_CONCURRENCY
+    DYNAMODB_MAX_POOL_CONNECTIONS: int = int(os.getenv("DYNAMODB_MAX_POOL_CONNECTIONS", 32))
+    DYNAMODB_CONNECT_TIMEOUT: float = float(os.getenv("DYNAMODB_CONNECT_TIMEOUT", 2))
+    DYNAMODB_READ_TIMEOUT: float = float(os.getenv("DYNAMODB_READ_TIMEOUT", 5))
+    DYNAMODB_TCP_KEEPALIVE: bool = os.getenv("DYNAMODB_TCP_KEEPALIVE", "true").lower() == "true"
+    DYNAMODB_MAX_ATTEMPTS: int = int(os.getenv("DYNAMODB_MAX_ATTEMPTS", 3))
+    DYNAMODB_RETRY_MODE: str = os.getenv("DYNAMODB_RETRY_MODE", "standard")
+    # Capacity reported by every call for the metrics: INDEXES (per table and index), TOTAL or NONE
+    DYNAMODB_RETURN_CONSUMED_CAPACITY: str = os.getenv("DYNAMODB_RETURN_CONSUMED_CAPACITY", "INDEXES")
     SECRET_KEY: str = os.getenv("SECRET_KEY", "supersecret")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+    # Password hashing: bcrypt cost, worker threads and jobs allowed to wait before answering 503
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", 12))
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", 4))
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", 64))
+    # Authenticated principals cached per worker (TTL 0 disables the cache)
+    PRINCIPAL_CACHE_TTL_SECONDS: float = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", 30))
+    PRINCIPAL_CACHE_MAX_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", 10000))
+    # Trust the signed role/active claims of tokens younger than this many seconds (0 = always read the user)
+    AUTH_TRUST_TOKEN_CLAIMS_SECONDS: int = int(os.getenv("AUTH_TRUST_TOKEN_CLAIMS_SECONDS", 0))
+    # In-process license cache (TTL 0 disables it)
+    LICENSE_CACHE_TTL_SECONDS: float = float(os.getenv("LICENSE_CACHE_TTL_SECONDS", 60))
+    LICENSE_CACHE_MAX_SIZE: int = int(os.getenv("LICENSE_CACHE_MAX_SIZE", 2048))
+    LICENSE_LIST_CACHE_TTL_SECONDS: float = float(os.getenv("LICENSE_LIST_CACHE_TTL_SECONDS", 10))
+    LICENSE_LIST_CACHE_MAX_SIZE: int = int(os.getenv("LICENSE_LIST_CACHE_MAX_SIZE", 256))
+    # Cache-Control sent with license reads and listings
+    LICENSE_CACHE_CONTROL: str = os.getenv("LICENSE_CACHE_CONTROL", "public, max-age=30")
+    LICENSE_LIST_CACHE_CONTROL: str = os.getenv("LICENSE_LIST_CACHE_CONTROL", "public, max-age=10")
+    # List responses smaller than this many bytes are sent uncompressed
+    RESPONSE_COMPRESSION_MIN_SIZE: int = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", 1024))
+    RESPONSE_GZIP_LEVEL: int = int(os.getenv("RESPONSE_GZIP_LEVEL", 6))
+    RESPONSE_BROTLI_QUALITY: int = int(os.getenv("RESPONSE_BROTLI_QUALITY", 4))
+    # BatchGetItem retries for UnprocessedKeys (exponential backoff)
+    DYNAMODB_BATCH_MAX_RETRIES: int = int(os.getenv("DYNAMODB_BATCH_MAX_RETRIES", 5))
+    DYNAMODB_BATCH_BACKOFF_SECONDS: float = float(os.getenv("DYNAMODB_BATCH_BACKOFF_SECONDS", 0.05))
+    # In-memory license search: scan segments used to build it and full rebuild period (0 = never)
+    SEARCH_SCAN_SEGMENTS: int = int(os.getenv("SEARCH_SCAN_SEGMENTS", 4))
+    SEARCH_INDEX_REFRESH_SECONDS: int = int(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", 300))
+    # Bulk license import: rows per write chunk, chunks written in parallel, errors reported
+    # and the longest line (or multi-line CSV record) accepted
+    LICENSE_IMPORT_CHUNK_SIZE: int = int(os.getenv("LICENSE_IMPORT_CHUNK_SIZE", 500))
+    LICENSE_IMPORT_WRITERS: int = int(os.getenv("LICENSE_IMPORT_WRITERS", 4))
+    LICENSE_IMPORT_MAX_ERRORS: int = int(os.getenv("LICENSE_IMPORT_MAX_ERRORS", 1000))
+    LICENSE_IMPORT_MAX_LINE_BYTES: int = int(os.getenv("LICENSE_IMPORT_MAX_LINE_BYTES", 1024 * 1024))
+    # Sharded stock: random shards tried per reservation and rebalancer period (0 = off)
+    STOCK_SHARD_RESERVE_ATTEMPTS: int = int(os.getenv("STOCK_SHARD_RESERVE_ATTEMPTS", 3))
+    STOCK_REBALANCE_SECONDS: int = int(os.getenv("STOCK_REBALANCE_SECONDS", 10))
+    # Summed stock of a sharded license reused by reads (0 sums the shards on every read)
+    STOCK_SHARD_TOTAL_TTL_SECONDS: float = float(os.getenv("STOCK_SHARD_TOTAL_TTL_SECONDS", 2))
+    # Catalog export: parallel scan segments and scanned pages buffered in memory
+    LICENSE_EXPORT_SEGMENTS: int = int(os.getenv("LICENSE_EXPORT_SEGMENTS", 8))
+    LICENSE_EXPORT_BUFFERED_PAGES: int = int(os.getenv("LICENSE_EXPORT_BUFFERED_PAGES", 8))
     # AWS S3
     AWS_REGION: str = os.getenv("AWS_REGION", "us-east-1")
     AWS_ACCESS_KEY_ID: Optional[str] = os.getenv("AWS_ACCESS_KEY_ID", None)
     AWS_SECRET_ACCESS_KEY: Optional[str] = os.getenv("AWS_SECRET_ACCESS_KEY", None)
     AWS_S3_BUCKET: Optional[str] = os.getenv("AWS_S3_BUCKET", None)
+    # Request tracing: Server-Timing header and data-store calls allowed per request (0 = no budget)
+    SERVER_TIMING_ENABLED: bool = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+    REQUEST_CALL_BUDGET: int = int(os.getenv("REQUEST_CALL_BUDGET", 0))
+    # Request profiling: share of requests profiled, profiler ("sample" or "cprofile"),
+    # sampling interval and profiles kept per worker
+    PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_MODE: str = os.getenv("PROFILE_MODE", "sample")
+    PROFILE_SAMPLE_INTERVAL_SECONDS: float = float(os.getenv("PROFILE_SAMPLE_INTERVAL_SECONDS", 0.005))
+    PROFILE_MAX_STORED: int = int(os.getenv("PROFILE_MAX_STORED", 50))
+    # Image uploads: size limit, uploads in parallel per worker and multipart transfer tuning
+    S3_MAX_IMAGE_BYTES: int = int(os.getenv("S3_MAX_IMAGE_BYTES", 10 * 1024 * 1024))
+    S3_MAX_CONCURRENT_UPLOADS: int = int(os.getenv("S3_MAX_CONCURRENT_UPLOADS", 4))
+    S3_MULTIPART_THRESHOLD: int = int(os.getenv("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024))
+    S3_MULTIPART_CHUNKSIZE: int = int(os.getenv("S3_MULTIPART_CHUNKSIZE", 8 * 1024 * 1024))
+    S3_TRANSFER_MAX_CONCURRENCY: int = int(os.getenv("S3_TRANSFER_MAX_CONCURRENCY", 4))
+    # Direct browser uploads: how long the presigned form is valid
+    S3_PRESIGNED_EXPIRES_SECONDS: int = int(os.getenv("S3_PRESIGNED_EXPIRES_SECONDS", 300))
+    # WebP thumbnail widths generated after each upload (needs Pillow) and their quality
+    S3_THUMBNAIL_WIDTHS: str = os.getenv("S3_THUMBNAIL_WIDTHS", "320,640")
+    S3_THUMBNAIL_QUALITY: int = int(os.getenv("S3_THUMBNAIL_QUALITY", 80))
 
 settings = Settings() 
\ No newline at end of file
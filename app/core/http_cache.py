@@ -0,0 +1,40 @@
+import hashlib
+from typing import Iterable, Optional
+from fastapi import Response, status
+
+def item_etag(item: dict, key_name: str, volatile: Iterable[str] = ()) -> str:
+    """Strong ETag of a stored item, derived from its key and ``update_at``.
+
+    Every write refreshes ``update_at``, so the ETag changes with the content
+    without having to serialize the item. ``volatile`` names the attributes
+    that can change without such a write, which are hashed in as well.
+    """
+    version = item.get("update_at")
+    if version is None:
+        version = repr(sorted(item.items()))
+    else:
+        version = ":".join([str(version)] + [str(item.get(name)) for name in volatile])
+    digest = hashlib.sha1(f"{item.get(key_name)}:{version}".encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+def list_etag(etags: Iterable[str], next_cursor: Optional[str] = None) -> str:
+    digest = hashlib.sha1()
+    for etag in etags:
+        digest.update(etag.encode())
+    digest.update((next_cursor or "").encode())
+    return f'"{digest.hexdigest()[:20]}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against ``etag`` (RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+def not_modified(etag: str, cache_control: str, extra_headers: Optional[dict] = None) -> Response:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if extra_headers:
+        headers.update(extra_headers)
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
@@ -0,0 +1,115 @@
+import json
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional, TextIO
+from app.core.config import settings
+
+# ID of the request being served, attached to every log record
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class DebugSamplingFilter(logging.Filter):
+    """Keep only a sample of DEBUG records that carry a ``payload``"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or not hasattr(record, "payload"):
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if hasattr(record, "payload"):
+            entry["payload"] = record.payload
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        message = super().format(record)
+        if hasattr(record, "payload"):
+            message = f"{message} {record.payload}"
+        return message
+
+class _DeferredQueueHandler(QueueHandler):
+    # The queue is in-process, so hand the record over untouched and let the
+    # listener thread do all the formatting off the request path
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for part in spec.split(","):
+        if "=" in part:
+            name, level = part.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def configure_logging(stream: Optional[TextIO] = None):
+    """Route app logs through a non-blocking queue handler; safe to call more than once"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if settings.LOG_FORMAT == "json" else TextFormatter())
+
+    queue_handler = _DeferredQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(DebugSamplingFilter(settings.LOG_DEBUG_SAMPLE_RATE))
+
+    app_logger = logging.getLogger("app")
+    for handler in list(app_logger.handlers):
+        if isinstance(handler, _DeferredQueueHandler):
+            app_logger.removeHandler(handler)
+    app_logger.setLevel(settings.LOG_LEVEL.upper())
+    app_logger.addHandler(queue_handler)
+    app_logger.propagate = False
+    for name, level in _parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _queue_handler = queue_handler
+    _listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging():
+    """Flush queued records, stop the listener thread and detach the queue handler.
+
+    App logs go back to propagating to the root logger, so nothing is queued
+    without a listener to drain it.
+    """
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        app_logger = logging.getLogger("app")
+        app_logger.removeHandler(_queue_handler)
+        app_logger.propagate = True
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,123 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+from botocore.exceptions import ClientError
+from fastapi import Request
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+)
+from prometheus_client import multiprocess
+from app.core.tracing import record_call
+
+# "<METHOD> <route template>" of the request being served, used to attribute DynamoDB capacity
+route_var: ContextVar[str] = ContextVar("route", default="-")
+
+THROTTLE_ERROR_CODES = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+    "SlowDown",
+}
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests served", ["method", "route", "status"]
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being served", ["method", "route"], multiprocess_mode="livesum"
+)
+DYNAMODB_CALL_DURATION = Histogram(
+    "dynamodb_call_duration_seconds", "DynamoDB call latency, executor wait included", ["table", "operation"]
+)
+DYNAMODB_CALL_ERRORS = Counter(
+    "dynamodb_call_errors_total", "Failed DynamoDB calls", ["table", "operation", "code"]
+)
+DYNAMODB_THROTTLES = Counter(
+    "dynamodb_throttles_total", "Throttled DynamoDB calls", ["table", "operation"]
+)
+DYNAMODB_CONSUMED_CAPACITY = Counter(
+    "dynamodb_consumed_capacity_units_total",
+    "Capacity units consumed, per table and index (empty index = base table)",
+    ["table", "index", "kind", "route"]
+)
+S3_CALL_DURATION = Histogram(
+    "s3_call_duration_seconds", "S3 API call latency", ["operation"]
+)
+S3_CALL_ERRORS = Counter(
+    "s3_call_errors_total", "Failed S3 API calls", ["operation", "code"]
+)
+
+async def track_route(request: Request):
+    """App-wide dependency counting in-flight requests per route template"""
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    token = route_var.set(f"{request.method} {route}")
+    in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(request.method, route)
+    in_flight.inc()
+    try:
+        yield
+    finally:
+        in_flight.dec()
+        route_var.reset(token)
+
+def error_code(error: Exception) -> str:
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code", "Unknown")
+    return type(error).__name__
+
+def observe_dynamodb_call(table: str, operation: str, seconds: float, error: Optional[Exception] = None):
+    DYNAMODB_CALL_DURATION.labels(table, operation).observe(seconds)
+    if error is not None:
+        code = error_code(error)
+        DYNAMODB_CALL_ERRORS.labels(table, operation, code).inc()
+        if code in THROTTLE_ERROR_CODES:
+            DYNAMODB_THROTTLES.labels(table, operation).inc()
+
+def record_consumed_capacity(consumed):
+    """Count the ``ConsumedCapacity`` of a response (one entry, or a list for batches)"""
+    if not consumed:
+        return
+    route = route_var.get()
+    for entry in consumed if isinstance(consumed, list) else [consumed]:
+        table = entry.get("TableName", "-")
+        # INDEXES mode breaks the call down per table and index, TOTAL only has CapacityUnits
+        parts = {"": entry.get("Table") or {"CapacityUnits": entry.get("CapacityUnits")}}
+        parts.update(entry.get("GlobalSecondaryIndexes", {}))
+        parts.update(entry.get("LocalSecondaryIndexes", {}))
+        for index, units in parts.items():
+            for kind, key in (("read", "ReadCapacityUnits"), ("write", "WriteCapacityUnits"), ("total", "CapacityUnits")):
+                value = units.get(key)
+                if value:
+                    DYNAMODB_CONSUMED_CAPACITY.labels(table, index, kind, route).inc(float(value))
+
+def instrument_s3_client(client):
+    """Time every S3 API call of ``client``, multipart parts included, through botocore events"""
+    def before_call(model, context, **kwargs):
+        context["metrics_started_at"] = time.perf_counter()
+
+    def after_call(model, http_response, parsed, context, **kwargs):
+        started_at = context.pop("metrics_started_at", None)
+        if started_at is not None:
+            elapsed = time.perf_counter() - started_at
+            S3_CALL_DURATION.labels(model.name).observe(elapsed)
+            record_call("s3", model.name, elapsed)
+        if http_response.status_code >= 400:
+            S3_CALL_ERRORS.labels(model.name, parsed.get("Error", {}).get("Code", str(http_response.status_code))).inc()
+
+    def after_call_error(model, exception, context, **kwargs):
+        context.pop("metrics_started_at", None)
+        S3_CALL_ERRORS.labels(model.name, type(exception).__name__).inc()
+
+    client.meta.events.register("before-call.s3", before_call)
+    client.meta.events.register("after-call.s3", after_call)
+    client.meta.events.register("after-call-error.s3", after_call_error)
+
+def render_metrics():
+    """Exposition payload and content type; aggregates all workers in multiprocess mode"""
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
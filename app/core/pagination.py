@@ -0,0 +1,55 @@
+import base64
+import hashlib
+import hmac
+import json
+from decimal import Decimal
+from typing import Optional
+from app.core.config import settings
+
+# Cursors are opaque to clients: a base64 JSON payload wrapping DynamoDB's
+# LastEvaluatedKey plus an HMAC so the key can't be tampered with. The HMAC
+# also covers a ``scope`` naming the listing (table, index, filters) the key
+# came from, so a cursor can't be replayed against a different one.
+
+def _encode_value(value):
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    raise TypeError(f"Unsupported cursor value: {type(value)}")
+
+def _decode_value(obj: dict):
+    if "__decimal__" in obj:
+        return Decimal(obj["__decimal__"])
+    return obj
+
+def _sign(payload: bytes, scope: str) -> str:
+    mac = hmac.new(settings.SECRET_KEY.encode(), payload, hashlib.sha256)
+    mac.update(b"\0" + scope.encode())
+    digest = mac.digest()
+    return base64.urlsafe_b64encode(digest[:16]).decode().rstrip("=")
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def encode_cursor(last_evaluated_key: Optional[dict], scope: str) -> Optional[str]:
+    """Wrap a DynamoDB LastEvaluatedKey of the ``scope`` listing into a signed cursor token"""
+    if not last_evaluated_key:
+        return None
+    payload = json.dumps(last_evaluated_key, default=_encode_value, separators=(",", ":"), sort_keys=True).encode()
+    body = base64.urlsafe_b64encode(payload).decode().rstrip("=")
+    return f"{body}.{_sign(payload, scope)}"
+
+def decode_cursor(cursor: str, scope: str) -> Optional[dict]:
+    """Return the ExclusiveStartKey wrapped by a cursor, or None if it is invalid
+    or was issued for another listing than ``scope``"""
+    try:
+        body, signature = cursor.split(".", 1)
+        payload = _b64decode(body)
+    except (ValueError, TypeError):
+        return None
+    if not hmac.compare_digest(signature, _sign(payload, scope)):
+        return None
+    try:
+        key = json.loads(payload, object_hook=_decode_value)
+    except ValueError:
+        return None
+    return key if isinstance(key, dict) else None
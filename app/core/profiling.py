@@ -0,0 +1,118 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import List, Optional
+from app.core.config import settings
+
+class StackSampler:
+    """Samples the stack of one thread at a fixed interval into collapsed stacks.
+
+    The event loop interleaves requests, so samples taken while another
+    request's coroutine runs are attributed to this profile as well.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self) -> str:
+        """Collapsed stacks (``frame;frame;frame count``), loadable in speedscope or flamegraph.pl"""
+        self._stop.set()
+        self._thread.join()
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+class _CProfiler:
+    def __init__(self):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self) -> str:
+        self._profile.disable()
+        output = io.StringIO()
+        pstats.Stats(self._profile, stream=output).sort_stats("cumulative").print_stats(60)
+        return output.getvalue()
+
+class ProfileStore:
+    """Last ``PROFILE_MAX_STORED`` profiles captured by this worker"""
+
+    def __init__(self, maxlen: int):
+        self._profiles = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        # cProfile allows a single active profiler per thread, so profiles never overlap
+        self.busy = False
+
+    def add(self, profile: dict):
+        with self._lock:
+            self._profiles.appendleft(profile)
+
+    def list(self) -> List[dict]:
+        return [{key: value for key, value in profile.items() if key != "output"} for profile in self._profiles]
+
+    def get(self, profile_id: str) -> Optional[dict]:
+        return next((profile for profile in self._profiles if profile["id"] == profile_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+profile_store = ProfileStore(settings.PROFILE_MAX_STORED)
+
+class RequestProfile:
+    """Profiles one request with the profiler picked by ``PROFILE_MODE``"""
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.mode = settings.PROFILE_MODE
+        if self.mode == "cprofile":
+            self._profiler = _CProfiler()
+        else:
+            self._profiler = StackSampler(threading.get_ident(), settings.PROFILE_SAMPLE_INTERVAL_SECONDS)
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        self._profiler.start()
+
+    def stop(self, status_code: int) -> dict:
+        output = self._profiler.stop()
+        profile = {
+            "id": self.id,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "method": self.method,
+            "path": self.path,
+            "status": status_code,
+            "duration_ms": round((time.perf_counter() - self._started_at) * 1000, 2),
+            "mode": self.mode,
+            "trigger": self.trigger,
+            "output": output,
+        }
+        profile_store.add(profile)
+        return profile
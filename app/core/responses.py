@@ -0,0 +1,74 @@
+import gzip
+from functools import lru_cache
+from typing import Iterable, List, Optional, Type
+from fastapi import Request, Response
+from pydantic import BaseModel, TypeAdapter
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Sent by every response whose body depends on Accept-Encoding, and by the 304s
+# revalidating them, so a shared cache keeps one entry per encoding
+COMPRESSION_VARY = {"Vary": "Accept-Encoding"}
+
+@lru_cache(maxsize=None)
+def _list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[model])
+
+def dump_models(model: Type[BaseModel], items: Iterable[dict]) -> bytes:
+    """Validate raw items against ``model`` once and serialize them to JSON bytes.
+
+    Runs entirely in pydantic-core, which also converts DynamoDB ``Decimal``
+    values, instead of building models and letting FastAPI re-validate and
+    encode them through ``jsonable_encoder``.
+    """
+    adapter = _list_adapter(model)
+    return adapter.dump_json(adapter.validate_python(list(items)))
+
+def _accepted_encodings(accept_encoding: str) -> dict:
+    encodings = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick ``br`` or ``gzip`` from an Accept-Encoding header, preferring brotli"""
+    if not accept_encoding:
+        return None
+    encodings = _accepted_encodings(accept_encoding)
+    if brotli is not None and encodings.get("br", 0) > 0:
+        return "br"
+    if encodings.get("gzip", encodings.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+def json_response(request: Request, body: bytes, headers: Optional[dict] = None) -> Response:
+    """JSON response compressed when the client accepts it and ``body`` is big enough"""
+    headers = dict(headers or {})
+    headers.update(COMPRESSION_VARY)
+    encoding = None
+    if len(body) >= settings.RESPONSE_COMPRESSION_MIN_SIZE:
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+    if encoding == "br":
+        body = brotli.compress(body, quality=settings.RESPONSE_BROTLI_QUALITY)
+    elif encoding == "gzip":
+        body = gzip.compress(body, compresslevel=settings.RESPONSE_GZIP_LEVEL)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        # The bytes differ per encoding, so the validator can only be weak
+        etag = headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,44 @@
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+class RequestTrace:
+    """Data-store calls made while serving one request"""
+
+    def __init__(self):
+        self.calls: List[Tuple[str, str, float]] = []
+
+    def record(self, store: str, operation: str, seconds: float):
+        self.calls.append((store, operation, seconds))
+
+    def totals(self) -> dict:
+        """``{store: (calls, seconds)}``"""
+        totals = {}
+        for store, _, seconds in self.calls:
+            count, total = totals.get(store, (0, 0.0))
+            totals[store] = (count + 1, total + seconds)
+        return totals
+
+    def server_timing(self, total_seconds: float) -> str:
+        entries = [
+            f'{store};dur={seconds * 1000:.1f};desc="{count} calls"'
+            for store, (count, seconds) in self.totals().items()
+        ]
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+        return ", ".join(entries)
+
+    def summary(self) -> dict:
+        return {
+            "calls": len(self.calls),
+            "by_operation": [
+                {"store": store, "operation": operation, "ms": round(seconds * 1000, 2)}
+                for store, operation, seconds in self.calls
+            ],
+        }
+
+# Trace of the request being served; tasks and executor jobs started from it share the object
+request_trace_var: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+def record_call(store: str, operation: str, seconds: float):
+    trace = request_trace_var.get()
+    if trace is not None:
+        trace.record(store, operation, seconds)
@@ -1,30 +1,92 @@
-from typing import List, Optional
-import boto3
-from boto3.dynamodb.conditions import Key
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import TypeDeserializer
+import asyncio
+import random
+import logging
 import uuid
 from datetime import datetime
+from decimal import Decimal
 from app.models.license import License
 from app.schemas.license import LicenseCreate, LicenseUpdate
 from app.core.config import settings
+from app.core.cache import TTLCache
+from app.services.search import LicenseSearchIndex, search_index
+from app.services.inventory import InsufficientStockError, ShardedInventory, TRANSACT_MAX_ITEMS
+from app.db.dynamodb import DynamoDB, dynamodb, read_page, build_update, is_conditional_check_failed, transaction_cancellation_reasons
+
+# DynamoDB BatchGetItem accepts at most 100 keys per request, BatchWriteItem 25 items
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+
+# Attributes used as GSI keys: DynamoDB rejects NULL values and empty strings for them
+INDEX_KEY_ATTRIBUTES = ("category", "price")
+EMPTY_INDEX_KEYS = (None, "")
+# listing_status value of licenses indexed in active-price-index
+ACTIVE_LISTING = "active"
+
+logger = logging.getLogger(__name__)
+
+class BatchWriteError(Exception):
+    """A batched create stopped part way; ``unwritten`` are the positions of the
+    licenses it did not write, the others were stored"""
+
+    def __init__(self, unwritten: List[int], cause: Exception):
+        self.unwritten = unwritten
+        self.cause = cause
+        super().__init__(str(cause))
+
+def _wire_int(value: Optional[dict]) -> int:
+    # Items returned with a failed condition are in the low-level wire format
+    return int(TypeDeserializer().deserialize(value)) if value else 0
+
+def _available_stock(old_item: Optional[dict]) -> Optional[int]:
+    return None if old_item is None else _wire_int(old_item.get("stock_quantity"))
+
+def _stock_update(license_id: str, delta: int, required: int = 0) -> dict:
+    """Atomic ``ADD`` on stock_quantity, conditioned on at least ``required`` units.
+
+    Licenses with sharded stock fail the condition: their stock lives in the shards.
+    """
+    condition = "attribute_exists(license_id) AND attribute_not_exists(stock_shards)"
+    values = {":delta": delta, ":now": datetime.utcnow().isoformat()}
+    if required:
+        condition += " AND stock_quantity >= :required"
+        values[":required"] = required
+    return {
+        "Key": {"license_id": license_id},
+        "UpdateExpression": "ADD stock_quantity :delta SET update_at = :now",
+        "ConditionExpression": condition,
+        "ExpressionAttributeValues": values,
+        "ReturnValuesOnConditionCheckFailure": "ALL_OLD"
+    }
 
 class LicenseCRUD:
-    def __init__(self):
-        if settings.ENV == "development" and settings.DYNAMODB_ENDPOINT_URL:
-            # Use local DynamoDB for development
-            self.dynamodb = boto3.resource(
-                'dynamodb', 
-                region_name=settings.DYNAMODB_REGION,
-                endpoint_url=settings.DYNAMODB_ENDPOINT_URL,
-                aws_access_key_id='dummy',
-                aws_secret_access_key='dummy'
-            )
+    def __init__(self, db: DynamoDB, search_index: LicenseSearchIndex):
+        self.db = db
+        self.search_index = search_index
+        self._search_build_lock = asyncio.Lock()
+        self._search_rebuild_log = None
+        self.table = db.table(settings.DYNAMODB_TABLE)
+        self.inventory = ShardedInventory(db)
+        # Read-through caches for single items and listing pages
+        self.cache = TTLCache(settings.LICENSE_CACHE_MAX_SIZE, settings.LICENSE_CACHE_TTL_SECONDS)
+        self.page_cache = TTLCache(settings.LICENSE_LIST_CACHE_MAX_SIZE, settings.LICENSE_LIST_CACHE_TTL_SECONDS)
+
+    def cache_stats(self) -> dict:
+        return {"items": self.cache.stats(), "pages": self.page_cache.stats()}
+
+    def invalidate(self, license_id: Optional[str] = None):
+        """Drop a license (or every license if no ID is given) and all cached pages"""
+        if license_id is None:
+            self.cache.clear()
+            self.inventory.totals.clear()
         else:
-            # Use AWS DynamoDB for production
-            self.dynamodb = boto3.resource('dynamodb', region_name=settings.DYNAMODB_REGION)
-        
-        self.table = self.dynamodb.Table(settings.DYNAMODB_TABLE)
+            self.cache.pop(license_id)
+            self.inventory.totals.pop(license_id)
+        self.page_cache.clear()
 
-    async def create(self, license_in: LicenseCreate) -> dict:
+    def _new_item(self, license_in: LicenseCreate) -> dict:
         license_id = str(uuid.uuid4())
         license_data = license_in.model_dump()
         license_data["license_id"] = license_id
@@ -32,77 +94,575 @@ class LicenseCRUD:
         license_data["update_at"] = datetime.utcnow().isoformat()
 
         # Convertir price a Decimal si existe
-        from decimal import Decimal
         if "price" in license_data and license_data["price"] is not None:
             license_data["price"] = Decimal(str(license_data["price"]))
 
-        self.table.put_item(Item=license_data)
+        for key in INDEX_KEY_ATTRIBUTES:
+            if license_data.get(key) in EMPTY_INDEX_KEYS:
+                license_data.pop(key, None)
+        if license_data.get("is_active"):
+            license_data["listing_status"] = ACTIVE_LISTING
         return license_data
 
+    async def create(self, license_in: LicenseCreate) -> dict:
+        license_data = self._new_item(license_in)
+        await self.table.put_item(Item=license_data)
+        self.page_cache.clear()
+        self._index_add(license_data)
+        return license_data
+
+    async def create_many(self, licenses_in: List[LicenseCreate]) -> List[dict]:
+        """Create licenses through BatchWriteItem calls; used by bulk imports.
+
+        Raises BatchWriteError when a call fails or keeps leaving items
+        unprocessed, naming only the licenses that were not written: every
+        license gets a new ID, so writing the others again would duplicate them.
+        """
+        items = [self._new_item(license_in) for license_in in licenses_in]
+        written = set()
+        try:
+            for start in range(0, len(items), BATCH_WRITE_SIZE):
+                await self._batch_write(items[start:start + BATCH_WRITE_SIZE], written)
+        except Exception as e:
+            unwritten = [position for position, item in enumerate(items) if item["license_id"] not in written]
+            raise BatchWriteError(unwritten, e) from e
+        finally:
+            self.page_cache.clear()
+            for item in items:
+                if item["license_id"] in written:
+                    self._index_add(item)
+        return items
+
+    async def _batch_write(self, items: List[dict], written: set):
+        """Put up to 25 items, retrying the unprocessed ones; adds the IDs stored to ``written``"""
+        attempt = 0
+        while items:
+            response = await self.table.batch_write_item(items)
+            unprocessed = {
+                request["PutRequest"]["Item"]["license_id"]
+                for request in response.get("UnprocessedItems", {}).get(self.table.name, [])
+            }
+            written.update(item["license_id"] for item in items if item["license_id"] not in unprocessed)
+            items = [item for item in items if item["license_id"] in unprocessed]
+            if items:
+                attempt += 1
+                if attempt > settings.DYNAMODB_BATCH_MAX_RETRIES:
+                    raise RuntimeError(f"{len(items)} licenses left unprocessed after {attempt - 1} retries")
+                # Exponential backoff with full jitter
+                await asyncio.sleep(random.uniform(0, settings.DYNAMODB_BATCH_BACKOFF_SECONDS * 2 ** attempt))
+
     async def get(self, license_id: str) -> Optional[dict]:
-        print(f"Buscando licencia con ID: {license_id}")
-        print(f"Tipo de license_id: {type(license_id)}")
-        response = self.table.get_item(Key={"license_id": license_id})
-        print(f"Respuesta de DynamoDB: {response}")
-        item = response.get("Item")
-        print(f"Item encontrado: {item}")
+        item = self.cache.get(license_id)
+        if item is None:
+            since = self.cache.version()
+            response = await self.table.get_item(Key={"license_id": license_id})
+            item = response.get("Item")
+            logger.debug("get_item %s found=%s", license_id, item is not None, extra={"payload": response})
+            if item is not None:
+                self.cache.set(license_id, item, since=since)
+        if item is not None and item.get("stock_shards"):
+            # Sharded stock is the sum of its shards, cached for a couple of seconds
+            item = {**item, "stock_quantity": await self.inventory.total(license_id, int(item["stock_shards"]))}
         return item
 
+    async def get_many(self, license_ids: List[str]) -> List[Optional[dict]]:
+        """Fetch several licenses, in request order, with None for the missing ones"""
+        found = {}
+        to_fetch = []
+        for license_id in dict.fromkeys(license_ids):
+            item = self.cache.get(license_id)
+            if item is not None:
+                found[license_id] = item
+            else:
+                to_fetch.append(license_id)
+
+        since = self.cache.version()
+        chunks = [to_fetch[i:i + BATCH_GET_SIZE] for i in range(0, len(to_fetch), BATCH_GET_SIZE)]
+        for items in await asyncio.gather(*(self._batch_get(chunk) for chunk in chunks)):
+            for item in items:
+                found[item["license_id"]] = item
+                self.cache.set(item["license_id"], item, since=since)
+        return [found.get(license_id) for license_id in license_ids]
+
+    async def _batch_get(self, license_ids: List[str]) -> List[dict]:
+        keys = [{"license_id": license_id} for license_id in license_ids]
+        items = []
+        attempt = 0
+        while keys:
+            response = await self.table.batch_get_item(keys)
+            items.extend(response.get("Responses", {}).get(self.table.name, []))
+            keys = response.get("UnprocessedKeys", {}).get(self.table.name, {}).get("Keys", [])
+            if keys:
+                attempt += 1
+                if attempt > settings.DYNAMODB_BATCH_MAX_RETRIES:
+                    raise RuntimeError(f"{len(keys)} licenses left unprocessed after {attempt - 1} retries")
+                # Exponential backoff with full jitter
+                await asyncio.sleep(random.uniform(0, settings.DYNAMODB_BATCH_BACKOFF_SECONDS * 2 ** attempt))
+        return items
+
+    async def _cached_page(self, cache_key: tuple, limit: int, exclusive_start_key: Optional[dict], **read_kwargs) -> Tuple[List[dict], Optional[dict]]:
+        cache_key += (limit, tuple(sorted((exclusive_start_key or {}).items())))
+        page = self.page_cache.get(cache_key)
+        if page is not None:
+            return page
+        # Writes that land while the page is read keep it (and its items) out of the caches
+        page_since, item_since = self.page_cache.version(), self.cache.version()
+        page = await read_page(self.table, limit, exclusive_start_key=exclusive_start_key, **read_kwargs)
+        self.page_cache.set(cache_key, page, since=page_since)
+        for item in page[0]:
+            self.cache.set(item["license_id"], item, since=item_since)
+        return page
+
+    async def get_page(self, limit: int = 10, exclusive_start_key: Optional[dict] = None, skip: int = 0) -> Tuple[List[dict], Optional[dict]]:
+        return await self._cached_page(("scan", skip), limit, exclusive_start_key, skip=skip)
+
+    async def query_page(
+        self,
+        limit: int = 10,
+        exclusive_start_key: Optional[dict] = None,
+        category: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        descending: bool = False,
+        skip: int = 0
+    ) -> Tuple[List[dict], Optional[dict]]:
+        """Browse active licenses ordered by price, through category-price-index when a
+        category is given and the sparse active-price-index otherwise"""
+        if category:
+            index_name = "category-price-index"
+            key_condition = Key("category").eq(category)
+        else:
+            index_name = "active-price-index"
+            key_condition = Key("listing_status").eq(ACTIVE_LISTING)
+        if min_price is not None and max_price is not None:
+            key_condition &= Key("price").between(Decimal(str(min_price)), Decimal(str(max_price)))
+        elif min_price is not None:
+            key_condition &= Key("price").gte(Decimal(str(min_price)))
+        elif max_price is not None:
+            key_condition &= Key("price").lte(Decimal(str(max_price)))
+
+        query_kwargs = {
+            "IndexName": index_name,
+            "KeyConditionExpression": key_condition,
+            "ScanIndexForward": not descending
+        }
+        if category:
+            query_kwargs["FilterExpression"] = Attr("is_active").eq(True)
+        cache_key = ("query", skip, category, min_price, max_price, descending)
+        return await self._cached_page(cache_key, limit, exclusive_start_key, skip=skip, operation="query", **query_kwargs)
+
     async def get_multi(self, skip: int = 0, limit: int = 10) -> List[dict]:
-        response = self.table.scan(Limit=limit)
-        items = response.get("Items", [])
-        return items[skip:skip+limit]
+        items, _ = await self.get_page(limit=limit, skip=skip)
+        return items
+
+    async def iter_all(self, segments: int = 4, max_buffered_pages: int = 8) -> AsyncIterator[List[dict]]:
+        """Yield every page of the table, read by a parallel scan over ``segments`` segments.
+
+        At most ``max_buffered_pages`` pages wait in memory; segment readers pause
+        while the consumer catches up.
+        """
+        pages = asyncio.Queue(maxsize=max_buffered_pages)
+        segment_done = object()
+
+        async def scan_segment(segment: int):
+            try:
+                scan_kwargs = {"Segment": segment, "TotalSegments": segments}
+                while True:
+                    response = await self.table.scan(**scan_kwargs)
+                    await pages.put(response.get("Items", []))
+                    if "LastEvaluatedKey" not in response:
+                        break
+                    scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+                await pages.put(segment_done)
+            except Exception as e:
+                await pages.put(e)
+
+        tasks = [asyncio.create_task(scan_segment(segment)) for segment in range(segments)]
+        remaining = segments
+        try:
+            while remaining:
+                page = await pages.get()
+                if page is segment_done:
+                    remaining -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield page
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _backfill_listing(self, item: dict) -> bool:
+        active = bool(item.get("is_active"))
+        values = {}
+        expression = ""
+        if active and "listing_status" not in item:
+            expression = "SET listing_status = :status"
+            values[":status"] = ACTIVE_LISTING
+        remove = [key for key in INDEX_KEY_ATTRIBUTES if key in item and item[key] in EMPTY_INDEX_KEYS]
+        if not active and "listing_status" in item:
+            remove.append("listing_status")
+        if remove:
+            expression += " REMOVE " + ", ".join(remove)
+        if not expression:
+            return False
+        # Skipped if the license was written meanwhile: that write set the attributes itself
+        if "update_at" in item:
+            condition = "update_at = :seen"
+            values[":seen"] = item["update_at"]
+        else:
+            condition = "attribute_exists(license_id) AND attribute_not_exists(update_at)"
+        update_kwargs = {"UpdateExpression": expression.strip(), "ConditionExpression": condition}
+        if values:
+            update_kwargs["ExpressionAttributeValues"] = values
+        try:
+            await self.table.update_item(Key={"license_id": item["license_id"]}, **update_kwargs)
+            return True
+        except Exception as e:
+            if is_conditional_check_failed(e):
+                return False
+            raise
+
+    async def backfill_listing_status(self) -> int:
+        """Give licenses stored before the price indexes existed their listing attributes.
+
+        Active licenses get ``listing_status`` (so active-price-index lists them),
+        inactive ones lose it, and empty categories, which are not valid index
+        keys, are removed. Returns how many licenses were updated.
+        """
+        updated = 0
+        try:
+            async for page in self.iter_all(segments=settings.SEARCH_SCAN_SEGMENTS):
+                updated += sum(await asyncio.gather(*(self._backfill_listing(item) for item in page)))
+        finally:
+            self.invalidate()
+        return updated
+
+    def _index_add(self, item: dict):
+        self.search_index.add(item)
+        if self._search_rebuild_log is not None:
+            self._search_rebuild_log.append((item["license_id"], item))
+
+    def _index_remove(self, license_id: str):
+        self.search_index.remove(license_id)
+        if self._search_rebuild_log is not None:
+            self._search_rebuild_log.append((license_id, None))
+
+    async def _rebuild_search_index(self):
+        # Writes made while the scan runs are replayed onto the new index
+        self._search_rebuild_log = []
+        try:
+            index = LicenseSearchIndex()
+            async for page in self.iter_all(segments=settings.SEARCH_SCAN_SEGMENTS):
+                for item in page:
+                    index.add(item)
+            for license_id, item in self._search_rebuild_log:
+                if item is None:
+                    index.remove(license_id)
+                else:
+                    index.add(item)
+            self.search_index.replace_with(index)
+        finally:
+            self._search_rebuild_log = None
+        logger.info("Search index built with %d licenses", len(index))
+
+    async def rebuild_search_index(self):
+        """Rebuild the search index from a parallel scan, swapping it in when complete"""
+        async with self._search_build_lock:
+            await self._rebuild_search_index()
+
+    async def search(self, query: str, limit: int = 20) -> List[dict]:
+        """Licenses matching ``query`` ranked by relevance, answered from memory"""
+        if not self.search_index.ready:
+            async with self._search_build_lock:
+                if not self.search_index.ready:
+                    await self._rebuild_search_index()
+        return [item for item, _ in self.search_index.search(query, limit=limit)]
 
     async def update(self, license_id: str, license_in: LicenseUpdate) -> Optional[dict]:
-        print(f"Actualizando licencia con ID: {license_id}")
+        """Write the fields set on ``license_in``; None if the license does not exist.
+
+        Raises ValueError when it sets the stock of a sharded license, whose
+        stock lives in the shards.
+        """
         update_data = license_in.model_dump(exclude_unset=True)
-        print(f"Datos de actualización originales: {update_data}")
         update_data["update_at"] = datetime.utcnow().isoformat()
         
         # Convertir todos los float a Decimal
-        from decimal import Decimal
         for key, value in update_data.items():
             if isinstance(value, float):
                 update_data[key] = Decimal(str(value))
-                print(f"{key} convertido a Decimal: {update_data[key]}")
-        print(f"Datos de actualización finales: {update_data}")
         
-        update_expression = "SET "
-        expression_attribute_values = {}
-        expression_attribute_names = {}
-        
-        for key, value in update_data.items():
-            if key != "license_id":
-                update_expression += f"#{key} = :{key}, "
-                expression_attribute_values[f":{key}"] = value
-                expression_attribute_names[f"#{key}"] = key
-        
-        update_expression = update_expression.rstrip(", ")
-        print(f"Update expression: {update_expression}")
-        print(f"Expression attribute values: {expression_attribute_values}")
-        print(f"Expression attribute names: {expression_attribute_names}")
+        # NULL or empty index keys are removed instead; listing_status follows is_active
+        remove = [key for key in INDEX_KEY_ATTRIBUTES if key in update_data and update_data[key] in EMPTY_INDEX_KEYS]
+        for key in remove:
+            del update_data[key]
+        if "is_active" in update_data:
+            if update_data["is_active"]:
+                update_data["listing_status"] = ACTIVE_LISTING
+            else:
+                remove.append("listing_status")
+
+        update_kwargs = build_update(update_data, "license_id", remove=remove)
+        if "stock_quantity" in update_data:
+            update_kwargs["ConditionExpression"] += " AND attribute_not_exists(stock_shards)"
+            update_kwargs["ReturnValuesOnConditionCheckFailure"] = "ALL_OLD"
+        logger.debug("update_item %s", license_id, extra={"payload": update_kwargs})
         
         try:
-            response = self.table.update_item(
-                Key={"license_id": license_id},
-                UpdateExpression=update_expression,
-                ExpressionAttributeValues=expression_attribute_values,
-                ExpressionAttributeNames=expression_attribute_names,
-                ReturnValues="ALL_NEW"
-            )
-            print(f"Respuesta de update_item: {response}")
-            return response.get("Attributes")
+            # Single conditional write: a missing license fails the condition instead of being created
+            response = await self.table.update_item(Key={"license_id": license_id}, **update_kwargs)
+            item = response.get("Attributes")
+            self._index_add(item)
+            return item
         except Exception as e:
-            print(f"Error updating license: {e}")
-            print(f"Tipo de error: {type(e)}")
-            return None
+            if is_conditional_check_failed(e):
+                if e.response.get("Item") is not None:
+                    raise ValueError(f"Stock of license {license_id} is sharded: restock it with /release") from None
+                return None
+            logger.exception("Error updating license %s", license_id)
+            raise
+        finally:
+            self.invalidate(license_id)
+
+    async def set_image(self, license_id: str, image_url: str) -> Optional[dict]:
+        """Point a license at a new image; None if the license does not exist"""
+        update_kwargs = build_update(
+            {"image_url": image_url, "update_at": datetime.utcnow().isoformat()}, "license_id"
+        )
+        try:
+            response = await self.table.update_item(Key={"license_id": license_id}, **update_kwargs)
+            item = response.get("Attributes")
+            self._index_add(item)
+            return item
+        except Exception as e:
+            if is_conditional_check_failed(e):
+                return None
+            logger.exception("Error setting image of license %s", license_id)
+            raise
+        finally:
+            self.invalidate(license_id)
+
+    async def _adjust_stock(self, license_id: str, delta: int, required: int = 0) -> Optional[dict]:
+        cached = self.cache.get(license_id)
+        shards = int(cached.get("stock_shards") or 0) if cached else 0
+        if not shards:
+            try:
+                response = await self.table.update_item(
+                    ReturnValues="ALL_NEW", **_stock_update(license_id, delta, required)
+                )
+                item = response.get("Attributes")
+                self._index_add(item)
+                return item
+            except Exception as e:
+                if not is_conditional_check_failed(e):
+                    logger.exception("Error adjusting stock of license %s", license_id)
+                    raise
+                old_item = e.response.get("Item")
+                if old_item is None:
+                    return None
+                shards = _wire_int(old_item.get("stock_shards"))
+                if not shards:
+                    raise InsufficientStockError({license_id: _available_stock(old_item)}) from None
+            finally:
+                self.invalidate(license_id)
+        # Flash-sale licenses keep their stock in shards
+        if delta < 0:
+            await self.inventory.reserve(license_id, shards, -delta)
+        else:
+            await self.inventory.release(license_id, shards, delta)
+        return await self.get(license_id)
+
+    async def reserve(self, license_id: str, quantity: int = 1) -> Optional[dict]:
+        """Take ``quantity`` units in a single conditional write; None if the license does not exist"""
+        return await self._adjust_stock(license_id, -quantity, required=quantity)
+
+    async def release(self, license_id: str, quantity: int = 1) -> Optional[dict]:
+        """Give back ``quantity`` previously reserved units; None if the license does not exist"""
+        return await self._adjust_stock(license_id, quantity)
+
+    async def reserve_many(self, lines: List[Tuple[str, int]]) -> Dict[str, int]:
+        """Reserve a whole cart in one TransactWriteItems call: every line or none.
+
+        Repeated licenses are merged, since a transaction may touch each item
+        only once. A line of a sharded license first takes its units from one
+        random shard; once that falls short, the shard stocks are read and the
+        line is spread over the fullest shards, like ShardedInventory.reserve.
+        The cart is retried up to ``STOCK_SHARD_RESERVE_ATTEMPTS`` times while
+        other reservations race it. Returns the reserved quantity per license.
+
+        Raises ValueError when the spread lines need more writes than a
+        transaction allows.
+        """
+        quantities: Dict[str, int] = {}
+        for license_id, quantity in lines:
+            quantities[license_id] = quantities.get(license_id, 0) + quantity
+        shards: Dict[str, int] = {}
+        for license_id in quantities:
+            cached = self.cache.get(license_id)
+            if cached and cached.get("stock_shards"):
+                shards[license_id] = int(cached["stock_shards"])
+        # Shard stocks of the lines spread over several shards
+        spread: Dict[str, List[int]] = {}
+
+        attempt = 0
+        try:
+            while True:
+                updates = []
+                owners = []
+                for license_id, quantity in quantities.items():
+                    if license_id in spread:
+                        actions = self.inventory.spread_actions(license_id, spread[license_id], quantity)
+                    elif license_id in shards:
+                        actions = [self.inventory.reserve_action(license_id, random.randrange(shards[license_id]), quantity)]
+                    else:
+                        actions = [_stock_update(license_id, -quantity, required=quantity)]
+                    if license_id in shards:
+                        actions = [{"TableName": self.inventory.table.name, **action} for action in actions]
+                    updates.extend(actions)
+                    owners.extend([license_id] * len(actions))
+                if len(updates) > TRANSACT_MAX_ITEMS:
+                    raise ValueError(f"Cart needs {len(updates)} stock writes, more than the {TRANSACT_MAX_ITEMS} a transaction allows")
+                try:
+                    await self.table.transact_update(updates)
+                    break
+                except Exception as e:
+                    reasons = transaction_cancellation_reasons(e)
+                    failed = {
+                        license_id: reason for license_id, reason in zip(owners, reasons or [])
+                        if reason.get("Code") == "ConditionalCheckFailed"
+                    }
+                    if not failed:
+                        logger.exception("Error reserving cart of %d licenses", len(quantities))
+                        raise
+                shortages = {}
+                for license_id, reason in failed.items():
+                    if license_id in shards:
+                        continue
+                    old_item = reason.get("Item")
+                    if old_item is not None and old_item.get("stock_shards"):
+                        shards[license_id] = _wire_int(old_item["stock_shards"])
+                    else:
+                        shortages[license_id] = _available_stock(old_item)
+                if shortages:
+                    raise InsufficientStockError(shortages)
+                # Sharded lines that fell short are spread according to what each shard holds now
+                short = [license_id for license_id in failed if license_id in shards]
+                stocks = await asyncio.gather(*(self.inventory.stocks(license_id, shards[license_id]) for license_id in short))
+                spread.update(zip(short, stocks))
+                shortages = {
+                    license_id: sum(spread[license_id]) for license_id in short
+                    if sum(spread[license_id]) < quantities[license_id]
+                }
+                if shortages:
+                    raise InsufficientStockError(shortages)
+                attempt += 1
+                if attempt > settings.STOCK_SHARD_RESERVE_ATTEMPTS:
+                    raise InsufficientStockError({license_id: sum(spread[license_id]) for license_id in short})
+        finally:
+            for license_id in quantities:
+                self.invalidate(license_id)
+        # Transactions return no attributes: patch the indexed copies in place
+        for license_id, quantity in quantities.items():
+            item = self.search_index.get(license_id)
+            if item is not None and license_id not in shards:
+                self._index_add({**item, "stock_quantity": item.get("stock_quantity", 0) - quantity})
+        return quantities
+
+    async def enable_stock_shards(self, license_id: str, shards: int) -> Optional[dict]:
+        """Move the stock of a license into ``shards`` shard items; None if it does not exist.
+
+        The license and its shards are written in one transaction, conditioned
+        on the stock read just before, so no reservation can slip in between.
+        Raises ValueError when the license is already sharded or its stock
+        keeps changing under us.
+        """
+        try:
+            for _ in range(settings.STOCK_SHARD_RESERVE_ATTEMPTS):
+                response = await self.table.get_item(Key={"license_id": license_id}, ConsistentRead=True)
+                item = response.get("Item")
+                if item is None:
+                    return None
+                if item.get("stock_shards"):
+                    raise ValueError(f"Stock of license {license_id} is already sharded")
+                stock = item.get("stock_quantity")
+                changes = {"stock_shards": shards, "update_at": datetime.utcnow().isoformat()}
+                license_update = {
+                    "Key": {"license_id": license_id},
+                    "UpdateExpression": "SET stock_shards = :shards, update_at = :now",
+                    "ConditionExpression": "attribute_exists(license_id) AND attribute_not_exists(stock_shards)",
+                    "ExpressionAttributeValues": {":shards": shards, ":now": changes["update_at"]},
+                    "ReturnValuesOnConditionCheckFailure": "ALL_OLD"
+                }
+                if stock is None:
+                    license_update["ConditionExpression"] += " AND attribute_not_exists(stock_quantity)"
+                else:
+                    license_update["ConditionExpression"] += " AND stock_quantity = :stock"
+                    license_update["ExpressionAttributeValues"][":stock"] = stock
+                try:
+                    # From here on reservations go to the shards, so stock_quantity is the
+                    # exact amount they have to hold
+                    await self.table.transact_update(
+                        [license_update] + self.inventory.create_actions(license_id, shards, int(stock or 0))
+                    )
+                except Exception as e:
+                    reasons = transaction_cancellation_reasons(e)
+                    if not reasons or reasons[0].get("Code") != "ConditionalCheckFailed":
+                        logger.exception("Error sharding stock of license %s", license_id)
+                        raise
+                    old_item = reasons[0].get("Item")
+                    if old_item is None:
+                        return None
+                    if old_item.get("stock_shards"):
+                        raise ValueError(f"Stock of license {license_id} is already sharded") from None
+                    # A reservation changed the stock after our read: read it again
+                    continue
+                item = {**item, **changes}
+                self._index_add(item)
+                return item
+            raise ValueError(f"Stock of license {license_id} kept changing, try again")
+        finally:
+            self.invalidate(license_id)
+
+    async def rebalance_stock_shards(self) -> int:
+        """Even out stock shards and sync the reported stock_quantity of sharded licenses.
+
+        Returns how many licenses had their reported stock updated.
+        """
+        totals = await self.inventory.rebalance()
+        updated = 0
+        for license_id, total in totals.items():
+            try:
+                response = await self.table.update_item(
+                    Key={"license_id": license_id},
+                    UpdateExpression="SET stock_quantity = :total, update_at = :now",
+                    ConditionExpression="attribute_exists(stock_shards) AND stock_quantity <> :total",
+                    ExpressionAttributeValues={":total": total, ":now": datetime.utcnow().isoformat()},
+                    ReturnValues="ALL_NEW"
+                )
+            except Exception as e:
+                # Unchanged totals fail the condition and are not rewritten
+                if is_conditional_check_failed(e):
+                    continue
+                raise
+            self._index_add(response.get("Attributes"))
+            self.invalidate(license_id)
+            updated += 1
+        return updated
 
     async def delete(self, license_id: str) -> bool:
         try:
-            self.table.delete_item(Key={"license_id": license_id})
+            response = await self.table.delete_item(Key={"license_id": license_id}, ReturnValues="ALL_OLD")
+            self._index_remove(license_id)
+            shards = (response.get("Attributes") or {}).get("stock_shards")
+            if shards:
+                await self.inventory.delete(license_id, int(shards))
             return True
         except Exception as e:
-            print(f"Error deleting license: {e}")
+            logger.exception("Error deleting license %s", license_id)
             return False
+        finally:
+            self.invalidate(license_id)
 
-license_crud = LicenseCRUD() 
\ No newline at end of file
+license_crud = LicenseCRUD(dynamodb, search_index) 
\ No newline at end of file
@@ -1,47 +1,65 @@
-from typing import List, Optional
-import boto3
+from typing import Iterable, List, Optional, Tuple
 from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+import logging
 import uuid
 from datetime import datetime
 from app.models.user import User, UserRole
 from app.schemas.user import UserCreate, UserUpdate
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.cache import TTLCache
+from app.db.dynamodb import DynamoDB, dynamodb, read_page, build_update, is_conditional_check_failed
+from app.core.security import hash_password, verify_and_update_password
+
+logger = logging.getLogger(__name__)
+
+class FieldsChangedError(Exception):
+    """An update would change fields the caller expected to stay the same"""
+
+    def __init__(self, stored: dict):
+        self.stored = stored
+        super().__init__("Stored user differs from the expected fields")
 
 class UserCRUD:
-    def __init__(self):
-        if settings.ENV == "development" and settings.DYNAMODB_ENDPOINT_URL:
-            # Use local DynamoDB for development
-            self.dynamodb = boto3.resource(
-                'dynamodb', 
-                region_name=settings.DYNAMODB_REGION,
-                endpoint_url=settings.DYNAMODB_ENDPOINT_URL,
-                aws_access_key_id='dummy',
-                aws_secret_access_key='dummy'
-            )
-        else:
-            # Use AWS DynamoDB for production
-            self.dynamodb = boto3.resource('dynamodb', region_name=settings.DYNAMODB_REGION)
-        
-        self.table = self.dynamodb.Table("Users")
+    def __init__(self, db: DynamoDB):
+        self.db = db
+        self.table = db.table("Users")
+        # Short-lived cache of users resolved from access tokens
+        self.principal_cache = TTLCache(settings.PRINCIPAL_CACHE_MAX_SIZE, settings.PRINCIPAL_CACHE_TTL_SECONDS)
 
-    async def create(self, user_in: UserCreate) -> dict:
+    async def create(self, user_in: UserCreate, role: UserRole = UserRole.user) -> dict:
         user_id = str(uuid.uuid4())
         user_data = user_in.model_dump(exclude={"password"})
         user_data["user_id"] = user_id
-        user_data["hashed_password"] = get_password_hash(user_in.password)
+        user_data["role"] = role.value
+        user_data["hashed_password"] = await hash_password(user_in.password)
         user_data["create_at"] = datetime.utcnow().isoformat()
         user_data["update_at"] = datetime.utcnow().isoformat()
         
-        self.table.put_item(Item=user_data)
+        await self.table.put_item(Item=user_data)
         return user_data
 
     async def get(self, user_id: str) -> Optional[dict]:
-        response = self.table.get_item(Key={"user_id": user_id})
+        response = await self.table.get_item(Key={"user_id": user_id})
         return response.get("Item")
 
+    async def get_principal(self, user_id: str, version: Optional[str] = None) -> Optional[dict]:
+        """User behind an access token, served from the principal cache.
+
+        ``version`` is the ``update_at`` the token was issued with; a cached entry
+        older than that (e.g. updated through another worker) is re-read.
+        """
+        user = self.principal_cache.get(user_id)
+        if user is not None and (not version or (user.get("update_at") or "") >= version):
+            return user
+        since = self.principal_cache.version()
+        user = await self.get(user_id)
+        if user is not None:
+            self.principal_cache.set(user_id, user, since=since)
+        return user
+
     async def get_by_email(self, email: str) -> Optional[dict]:
-        response = self.table.query(
+        response = await self.table.query(
             IndexName="email-index",
             KeyConditionExpression=Key("email").eq(email)
         )
@@ -49,61 +67,83 @@ class UserCRUD:
         return items[0] if items else None
 
     async def get_by_username(self, username: str) -> Optional[dict]:
-        response = self.table.query(
+        response = await self.table.query(
             IndexName="username-index",
             KeyConditionExpression=Key("username").eq(username)
         )
         items = response.get("Items", [])
         return items[0] if items else None
 
+    async def get_page(self, limit: int = 10, exclusive_start_key: Optional[dict] = None, skip: int = 0) -> Tuple[List[dict], Optional[dict]]:
+        return await read_page(self.table, limit, exclusive_start_key=exclusive_start_key, skip=skip)
+
     async def get_multi(self, skip: int = 0, limit: int = 10) -> List[dict]:
-        response = self.table.scan(Limit=limit)
-        items = response.get("Items", [])
-        return items[skip:skip+limit]
+        items, _ = await self.get_page(limit=limit, skip=skip)
+        return items
+
+    async def update(self, user_id: str, user_in: UserUpdate, unchanged: Iterable[str] = (),
+                     hashed_password: Optional[str] = None) -> Optional[dict]:
+        """Write the fields set on ``user_in``; None if the user does not exist.
 
-    async def update(self, user_id: str, user_in: UserUpdate) -> Optional[dict]:
-        update_data = user_in.model_dump(exclude_unset=True)
+        Fields named in ``unchanged`` must already hold the written value,
+        otherwise nothing is written and FieldsChangedError carries the stored user.
+        ``hashed_password`` is the hash of ``user_in.password`` when the caller
+        already has it, so that retries do not hash again.
+        """
+        update_data = user_in.model_dump(exclude_unset=True, exclude_none=True)
+        password = update_data.pop("password", None)
         update_data["update_at"] = datetime.utcnow().isoformat()
-        
-        update_expression = "SET "
-        expression_attribute_values = {}
-        expression_attribute_names = {}
-        
-        for key, value in update_data.items():
-            if key != "user_id":
-                update_expression += f"#{key} = :{key}, "
-                expression_attribute_values[f":{key}"] = value
-                expression_attribute_names[f"#{key}"] = key
-        
-        update_expression = update_expression.rstrip(", ")
+        if password:
+            update_data["hashed_password"] = hashed_password or await hash_password(password)
+            # Tokens issued before this moment stop being accepted
+            update_data["password_changed_at"] = update_data["update_at"]
+        update_kwargs = build_update(update_data, "user_id")
+        unchanged = [field for field in unchanged if field in update_data]
+        if unchanged:
+            update_kwargs["ConditionExpression"] += "".join(f" AND #{field} = :{field}" for field in unchanged)
+            update_kwargs["ReturnValuesOnConditionCheckFailure"] = "ALL_OLD"
         
         try:
-            response = self.table.update_item(
-                Key={"user_id": user_id},
-                UpdateExpression=update_expression,
-                ExpressionAttributeValues=expression_attribute_values,
-                ExpressionAttributeNames=expression_attribute_names,
-                ReturnValues="ALL_NEW"
-            )
+            # Single conditional write: a missing user fails the condition instead of being created
+            response = await self.table.update_item(Key={"user_id": user_id}, **update_kwargs)
             return response.get("Attributes")
         except Exception as e:
-            print(f"Error updating user: {e}")
-            return None
+            if is_conditional_check_failed(e):
+                stored = e.response.get("Item")
+                if unchanged and stored is not None:
+                    deserializer = TypeDeserializer()
+                    raise FieldsChangedError({key: deserializer.deserialize(value) for key, value in stored.items()}) from None
+                return None
+            logger.exception("Error updating user %s", user_id)
+            raise
+        finally:
+            self.principal_cache.pop(user_id)
 
     async def delete(self, user_id: str) -> bool:
         try:
-            self.table.delete_item(Key={"user_id": user_id})
+            await self.table.delete_item(Key={"user_id": user_id})
             return True
         except Exception as e:
-            print(f"Error deleting user: {e}")
+            logger.exception("Error deleting user %s", user_id)
             return False
+        finally:
+            self.principal_cache.pop(user_id)
 
     async def authenticate(self, username: str, password: str) -> Optional[dict]:
         user = await self.get_by_username(username)
         if not user:
             return None
-        if not verify_password(password, user["hashed_password"]):
+        valid, new_hash = await verify_and_update_password(password, user["hashed_password"])
+        if not valid:
             return None
+        if new_hash:
+            # Stored hash uses an outdated bcrypt cost: upgrade it transparently
+            await self.table.update_item(
+                Key={"user_id": user["user_id"]},
+                UpdateExpression="SET hashed_password = :hashed_password",
+                ExpressionAttributeValues={":hashed_password": new_hash}
+            )
+            user["hashed_password"] = new_hash
         return user
 
-user_crud = UserCRUD() 
\ No newline at end of file
+user_crud = UserCRUD(dynamodb) 
\ No newline at end of file
@@ -0,0 +1,3 @@
+from .base import StorageTable
+from .dynamodb import DynamoDBTable
+from .memory import MemoryStore, MemoryTable, memory_store
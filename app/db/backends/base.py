@@ -0,0 +1,60 @@
+from abc import ABC, abstractmethod
+
+class StorageTable(ABC):
+    """Async table interface shared by the storage backends.
+
+    Requests and responses keep the boto3 ``Table`` resource shapes (``Key``,
+    ``Item``, expressions, ``LastEvaluatedKey``...), and failures are raised as
+    botocore ``ClientError`` with DynamoDB error codes, so the CRUD layer is the
+    same whichever backend ``STORAGE_BACKEND`` selects. A backend missing one
+    of the methods cannot be instantiated.
+    """
+
+    name: str
+
+    @abstractmethod
+    async def get_item(self, **kwargs) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def put_item(self, **kwargs) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def update_item(self, **kwargs) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_item(self, **kwargs) -> dict:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def query(self, **kwargs) -> dict:
+        """Query the table or one of its indexes (``IndexName``), a page at a time"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def scan(self, **kwargs) -> dict:
+        """One page of a (possibly segmented) scan"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def batch_write(self, items: list) -> int:
+        """Put every item; returns how many were written"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def batch_write_item(self, items: list, **kwargs) -> dict:
+        """BatchWriteItem putting ``items`` in this table (at most 25); the ones not
+        written come back in ``UnprocessedItems``"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def batch_get_item(self, keys: list, **kwargs) -> dict:
+        """BatchGetItem restricted to this table (at most 100 keys)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def transact_update(self, updates: list) -> dict:
+        """All-or-nothing ``Update`` actions, on this table unless one names a ``TableName``"""
+        raise NotImplementedError
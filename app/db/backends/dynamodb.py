@@ -0,0 +1,93 @@
+import time
+from app.core.config import settings
+from app.core.metrics import observe_dynamodb_call, record_consumed_capacity
+from app.core.tracing import record_call
+from app.db.backends.base import StorageTable
+from app.db.executor import DynamoDBExecutor
+
+class DynamoDBTable(StorageTable):
+    """Async facade over a boto3 ``Table``; each call runs on the DynamoDB executor"""
+
+    def __init__(self, db, name: str, executor: DynamoDBExecutor):
+        self._db = db
+        self._table = None
+        self.name = name
+        self._executor = executor
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._db.connect_to_dynamodb()
+            self._table = self._db.resource.Table(self.name)
+        return self._table
+
+    async def _run(self, operation: str, fn, capacity: bool = True, **kwargs):
+        """Run a boto3 call on the executor, recording its latency, errors and consumed capacity
+        in the metrics and the request trace"""
+        if capacity and settings.DYNAMODB_RETURN_CONSUMED_CAPACITY != "NONE":
+            kwargs.setdefault("ReturnConsumedCapacity", settings.DYNAMODB_RETURN_CONSUMED_CAPACITY)
+        started_at = time.perf_counter()
+        try:
+            response = await self._executor.run(fn, **kwargs)
+        except Exception as e:
+            elapsed = time.perf_counter() - started_at
+            observe_dynamodb_call(self.name, operation, elapsed, e)
+            record_call("dynamodb", f"{self.name}.{operation}", elapsed)
+            raise
+        elapsed = time.perf_counter() - started_at
+        observe_dynamodb_call(self.name, operation, elapsed)
+        record_call("dynamodb", f"{self.name}.{operation}", elapsed)
+        if isinstance(response, dict):
+            record_consumed_capacity(response.get("ConsumedCapacity"))
+        return response
+
+    async def _call(self, operation: str, **kwargs):
+        return await self._run(operation, getattr(self.table, operation), **kwargs)
+
+    async def get_item(self, **kwargs) -> dict:
+        return await self._call("get_item", **kwargs)
+
+    async def put_item(self, **kwargs) -> dict:
+        return await self._call("put_item", **kwargs)
+
+    async def update_item(self, **kwargs) -> dict:
+        return await self._call("update_item", **kwargs)
+
+    async def delete_item(self, **kwargs) -> dict:
+        return await self._call("delete_item", **kwargs)
+
+    async def query(self, **kwargs) -> dict:
+        return await self._call("query", **kwargs)
+
+    async def scan(self, **kwargs) -> dict:
+        return await self._call("scan", **kwargs)
+
+    async def batch_write(self, items: list) -> int:
+        """Put items through a ``batch_writer`` (25-item BatchWriteItem calls, unprocessed items retried)"""
+        def write():
+            with self.table.batch_writer() as writer:
+                for item in items:
+                    writer.put_item(Item=item)
+            return len(items)
+        # batch_writer does not hand back the responses, so no capacity is reported
+        return await self._run("batch_write_item", write, capacity=False)
+
+    async def batch_write_item(self, items: list, **kwargs) -> dict:
+        """BatchWriteItem of ``PutRequest`` actions on this table (at most 25 items)"""
+        request_items = {self.name: [{"PutRequest": {"Item": item}} for item in items]}
+        return await self._run("batch_write_item", self.table.meta.client.batch_write_item, RequestItems=request_items, **kwargs)
+
+    async def batch_get_item(self, keys: list, **kwargs) -> dict:
+        """BatchGetItem restricted to this table (at most 100 keys)"""
+        request_items = {self.name: {"Keys": keys, **kwargs}}
+        return await self._run("batch_get_item", self.table.meta.client.batch_get_item, RequestItems=request_items)
+
+    async def transact_update(self, updates: list) -> dict:
+        """TransactWriteItems made of ``Update`` actions, on this table by default (at most 100).
+
+        Each update takes the same arguments as ``update_item``; the resource's
+        client serializes the plain Python values. An update may name another
+        ``TableName`` to make the transaction span tables.
+        """
+        transact_items = [{"Update": {"TableName": self.name, **update}} for update in updates]
+        return await self._run("transact_write_items", self.table.meta.client.transact_write_items, TransactItems=transact_items)
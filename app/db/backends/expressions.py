@@ -0,0 +1,439 @@
+"""Parser and evaluator for the DynamoDB expression syntax used by the in-memory backend.
+
+Covers condition, key condition, filter and update expressions: comparisons,
+BETWEEN, IN, AND/OR/NOT, the attribute_exists / attribute_not_exists /
+attribute_type / begins_with / contains / size functions, and SET (with
+``+``/``-``, if_not_exists and list_append), REMOVE, ADD and DELETE clauses.
+Reserved words are not rejected.
+"""
+
+import re
+from decimal import Decimal
+from typing import List, Optional, Tuple
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+class ExpressionError(ValueError):
+    """Invalid expression or attribute value; surfaced as a ValidationException"""
+
+# Marks an attribute missing from the item, distinct from a stored NULL (None)
+MISSING = object()
+
+def normalize(value):
+    """The value as boto3 would read it back: numbers become Decimal, floats are rejected"""
+    return _deserializer.deserialize(_serializer.serialize(value))
+
+def to_wire(item: dict) -> dict:
+    """Low-level ``{"S": ...}`` format, as in error responses"""
+    return {key: _serializer.serialize(value) for key, value in item.items()}
+
+def type_of(value) -> Optional[str]:
+    """DynamoDB type descriptor of a normalized value"""
+    if value is MISSING:
+        return None
+    try:
+        return next(iter(_serializer.serialize(value)))
+    except TypeError:
+        return None
+
+_TOKEN = re.compile(
+    r"\s*(?:(?P<op><>|<=|>=|[=<>(),.\[\]+\-])|(?P<name>#[A-Za-z0-9_]+)|(?P<value>:[A-Za-z0-9_]+)"
+    r"|(?P<number>\d+)|(?P<word>[A-Za-z_][A-Za-z0-9_]*))"
+)
+_COMPARATORS = {"=", "<>", "<", "<=", ">", ">="}
+_CONDITION_FUNCTIONS = {"attribute_exists", "attribute_not_exists", "attribute_type", "begins_with", "contains"}
+_UPDATE_CLAUSES = {"SET", "REMOVE", "ADD", "DELETE"}
+
+def _tokenize(expression: str) -> List[Tuple[str, str]]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = _TOKEN.match(expression, position)
+        if match is None or match.end() == position:
+            raise ExpressionError(f"Invalid expression: unexpected {expression[position:]!r}")
+        position = match.end()
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+    tokens.append(("end", ""))
+    return tokens
+
+class Placeholders:
+    """ExpressionAttributeNames/Values of one request, tracking which ones the expressions use"""
+
+    def __init__(self, names: Optional[dict] = None, values: Optional[dict] = None):
+        self.names = dict(names or {})
+        self.values = {key: normalize(value) for key, value in (values or {}).items()}
+        self.used_names = set()
+        self.used_values = set()
+        self._builder = ConditionExpressionBuilder()
+
+    def name(self, placeholder: str) -> str:
+        if placeholder not in self.names:
+            raise ExpressionError(f"An expression attribute name used in the document path is not defined: {placeholder}")
+        self.used_names.add(placeholder)
+        return self.names[placeholder]
+
+    def value(self, placeholder: str):
+        if placeholder not in self.values:
+            raise ExpressionError(f"An expression attribute value used in expression is not defined: {placeholder}")
+        self.used_values.add(placeholder)
+        return self.values[placeholder]
+
+    def condition(self, expression, is_key_condition: bool = False):
+        """Parse a condition given as a string or a boto3 ``Key``/``Attr`` condition"""
+        if isinstance(expression, ConditionBase):
+            built = self._builder.build_expression(expression, is_key_condition=is_key_condition)
+            self.names.update(built.attribute_name_placeholders)
+            self.values.update({key: normalize(value) for key, value in built.attribute_value_placeholders.items()})
+            expression = built.condition_expression
+        parser = _Parser(_tokenize(expression), self)
+        node = parser.condition()
+        parser.expect("end")
+        return node
+
+    def update(self, expression: str) -> list:
+        parser = _Parser(_tokenize(expression), self)
+        actions = parser.update()
+        parser.expect("end")
+        return actions
+
+    def check_unused(self):
+        unused = set(self.names) - self.used_names
+        if unused:
+            raise ExpressionError(f"Value provided in ExpressionAttributeNames unused in expressions: keys: {sorted(unused)}")
+        unused = set(self.values) - self.used_values
+        if unused:
+            raise ExpressionError(f"Value provided in ExpressionAttributeValues unused in expressions: keys: {sorted(unused)}")
+
+class _Parser:
+    def __init__(self, tokens: List[Tuple[str, str]], placeholders: Placeholders):
+        self.tokens = tokens
+        self.position = 0
+        self.placeholders = placeholders
+
+    def peek(self, offset: int = 0) -> Tuple[str, str]:
+        return self.tokens[min(self.position + offset, len(self.tokens) - 1)]
+
+    def next(self) -> Tuple[str, str]:
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept(self, text: str) -> bool:
+        kind, value = self.peek()
+        if kind in ("op", "word") and value.upper() == text.upper():
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, text: str):
+        if text == "end":
+            if self.peek()[0] != "end":
+                raise ExpressionError(f"Invalid expression: unexpected token {self.peek()[1]!r}")
+            return
+        if not self.accept(text):
+            raise ExpressionError(f"Invalid expression: expected {text!r}, found {self.peek()[1]!r}")
+
+    def _is_call(self, names) -> bool:
+        kind, value = self.peek()
+        return kind == "word" and value in names and self.peek(1) == ("op", "(")
+
+    # Conditions
+
+    def condition(self):
+        node = self._and()
+        while self.accept("OR"):
+            node = ("or", node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self.accept("AND"):
+            node = ("and", node, self._not())
+        return node
+
+    def _not(self):
+        if self.accept("NOT"):
+            return ("not", self._not())
+        return self._primary()
+
+    def _primary(self):
+        if self.accept("("):
+            node = self.condition()
+            self.expect(")")
+            return node
+        if self._is_call(_CONDITION_FUNCTIONS):
+            name = self.next()[1]
+            self.expect("(")
+            args = [self.operand()]
+            while self.accept(","):
+                args.append(self.operand())
+            self.expect(")")
+            return ("fn", name, args)
+        left = self.operand()
+        kind, value = self.peek()
+        if kind == "op" and value in _COMPARATORS:
+            self.next()
+            return ("cmp", value, left, self.operand())
+        if self.accept("BETWEEN"):
+            low = self.operand()
+            self.expect("AND")
+            return ("between", left, low, self.operand())
+        if self.accept("IN"):
+            self.expect("(")
+            options = [self.operand()]
+            while self.accept(","):
+                options.append(self.operand())
+            self.expect(")")
+            return ("in", left, options)
+        raise ExpressionError(f"Invalid expression: expected a comparison, found {value!r}")
+
+    def operand(self):
+        if self._is_call({"size"}):
+            self.next()
+            self.expect("(")
+            path = self.path()
+            self.expect(")")
+            return ("size", path)
+        if self.peek()[0] == "value":
+            return ("value", self.placeholders.value(self.next()[1]))
+        return self.path()
+
+    def path(self):
+        segments = [self._path_name()]
+        while True:
+            if self.accept("."):
+                segments.append(self._path_name())
+            elif self.accept("["):
+                kind, value = self.next()
+                if kind != "number":
+                    raise ExpressionError(f"Invalid list index {value!r}")
+                segments.append(int(value))
+                self.expect("]")
+            else:
+                return ("path", tuple(segments))
+
+    def _path_name(self) -> str:
+        kind, value = self.next()
+        if kind == "name":
+            return self.placeholders.name(value)
+        if kind == "word":
+            return value
+        raise ExpressionError(f"Invalid expression: expected an attribute name, found {value!r}")
+
+    # Update expressions
+
+    def update(self) -> list:
+        actions = []
+        seen = set()
+        while self.peek()[0] != "end":
+            kind, clause = self.next()
+            clause = clause.upper()
+            if kind != "word" or clause not in _UPDATE_CLAUSES:
+                raise ExpressionError(f"Invalid UpdateExpression: unexpected {clause!r}")
+            if clause in seen:
+                raise ExpressionError(f"Invalid UpdateExpression: The \"{clause}\" section can only be used once")
+            seen.add(clause)
+            while True:
+                path = self.path()
+                if clause == "SET":
+                    self.expect("=")
+                    actions.append(("SET", path, self._set_value()))
+                elif clause == "REMOVE":
+                    actions.append(("REMOVE", path, None))
+                else:
+                    actions.append((clause, path, self.operand()))
+                if not self.accept(","):
+                    break
+        paths = [action[1][1] for action in actions]
+        for i, path in enumerate(paths):
+            for other in paths[i + 1:]:
+                if path[:len(other)] == other or other[:len(path)] == path:
+                    raise ExpressionError("Invalid UpdateExpression: Two document paths overlap with each other")
+        return actions
+
+    def _set_value(self):
+        node = self._set_operand()
+        kind, value = self.peek()
+        if kind == "op" and value in ("+", "-"):
+            self.next()
+            return (value, node, self._set_operand())
+        return node
+
+    def _set_operand(self):
+        if self._is_call({"if_not_exists"}):
+            self.next()
+            self.expect("(")
+            path = self.path()
+            self.expect(",")
+            default = self._set_value()
+            self.expect(")")
+            return ("if_not_exists", path, default)
+        if self._is_call({"list_append"}):
+            self.next()
+            self.expect("(")
+            first = self._set_value()
+            self.expect(",")
+            second = self._set_value()
+            self.expect(")")
+            return ("list_append", first, second)
+        return self.operand()
+
+# Evaluation
+
+def get_path(item: dict, path: tuple):
+    value = item
+    for segment in path:
+        if isinstance(segment, int):
+            if not isinstance(value, list) or segment >= len(value):
+                return MISSING
+            value = value[segment]
+        else:
+            if not isinstance(value, dict) or segment not in value:
+                return MISSING
+            value = value[segment]
+    return value
+
+def _set_path(item: dict, path: tuple, value):
+    parent = get_path(item, path[:-1])
+    if parent is MISSING or not isinstance(parent, (dict, list)):
+        raise ExpressionError("The document path provided in the update expression is invalid for update")
+    if isinstance(parent, list):
+        index = path[-1]
+        if index >= len(parent):
+            parent.append(value)
+        else:
+            parent[index] = value
+    else:
+        parent[path[-1]] = value
+
+def _remove_path(item: dict, path: tuple):
+    parent = get_path(item, path[:-1])
+    if isinstance(parent, dict):
+        parent.pop(path[-1], None)
+    elif isinstance(parent, list) and isinstance(path[-1], int) and path[-1] < len(parent):
+        del parent[path[-1]]
+
+def _operand(node, item):
+    kind = node[0]
+    if kind == "value":
+        return node[1]
+    if kind == "path":
+        return get_path(item, node[1])
+    if kind == "size":
+        value = get_path(item, node[1][1])
+        if isinstance(value, (str, bytes, Binary, set, list, dict)):
+            return Decimal(len(value.value if isinstance(value, Binary) else value))
+        return MISSING
+    if kind == "if_not_exists":
+        value = get_path(item, node[1][1])
+        return _operand(node[2], item) if value is MISSING else value
+    if kind == "list_append":
+        first, second = _operand(node[1], item), _operand(node[2], item)
+        if not isinstance(first, list) or not isinstance(second, list):
+            raise ExpressionError("An operand in the update expression has an incorrect data type")
+        return first + second
+    if kind in ("+", "-"):
+        first, second = _operand(node[1], item), _operand(node[2], item)
+        if not isinstance(first, Decimal) or not isinstance(second, Decimal):
+            raise ExpressionError("An operand in the update expression has an incorrect data type")
+        return first + second if kind == "+" else first - second
+    raise ExpressionError(f"Unsupported operand {kind}")
+
+def _compare(operator: str, left, right) -> bool:
+    if left is MISSING or right is MISSING:
+        return operator == "<>" and (left is MISSING) != (right is MISSING)
+    if type_of(left) != type_of(right):
+        return operator == "<>"
+    if operator == "=":
+        return left == right
+    if operator == "<>":
+        return left != right
+    if not isinstance(left, (str, Decimal, Binary, bytes)):
+        return False
+    if isinstance(left, Binary):
+        left, right = left.value, right.value
+    return {
+        "<": left < right,
+        "<=": left <= right,
+        ">": left > right,
+        ">=": left >= right,
+    }[operator]
+
+def evaluate(node, item: dict) -> bool:
+    """Whether ``item`` satisfies a parsed condition"""
+    kind = node[0]
+    if kind == "and":
+        return evaluate(node[1], item) and evaluate(node[2], item)
+    if kind == "or":
+        return evaluate(node[1], item) or evaluate(node[2], item)
+    if kind == "not":
+        return not evaluate(node[1], item)
+    if kind == "cmp":
+        return _compare(node[1], _operand(node[2], item), _operand(node[3], item))
+    if kind == "between":
+        value = _operand(node[1], item)
+        return _compare(">=", value, _operand(node[2], item)) and _compare("<=", value, _operand(node[3], item))
+    if kind == "in":
+        value = _operand(node[1], item)
+        return any(_compare("=", value, _operand(option, item)) for option in node[2])
+    name, args = node[1], node[2]
+    value = _operand(args[0], item)
+    if name == "attribute_exists":
+        return value is not MISSING
+    if name == "attribute_not_exists":
+        return value is MISSING
+    operand = _operand(args[1], item)
+    if name == "attribute_type":
+        return type_of(value) == operand
+    if name == "begins_with":
+        if isinstance(value, str) and isinstance(operand, str):
+            return value.startswith(operand)
+        if isinstance(value, Binary) and isinstance(operand, Binary):
+            return value.value.startswith(operand.value)
+        return False
+    if name == "contains":
+        if isinstance(value, str) and isinstance(operand, str):
+            return operand in value
+        if isinstance(value, (set, list)):
+            return operand in value
+        return False
+    raise ExpressionError(f"Unsupported function {name}")
+
+def apply_update(actions: list, item: dict) -> set:
+    """Apply parsed update actions to ``item`` in place; returns the top-level attributes touched.
+
+    Every operand is read from the item as it was before the update.
+    """
+    results = [None if operand is None else _operand(operand, item) for _, _, operand in actions]
+    for (action, (_, path), _), value in zip(actions, results):
+        if action == "SET":
+            _set_path(item, path, value)
+        elif action == "REMOVE":
+            _remove_path(item, path)
+        elif action == "ADD":
+            current = get_path(item, path)
+            if current is MISSING:
+                if not isinstance(value, (Decimal, set)):
+                    raise ExpressionError("Incorrect operand type for operator or function; operator: ADD")
+                _set_path(item, path, value)
+            elif isinstance(current, Decimal) and isinstance(value, Decimal):
+                _set_path(item, path, current + value)
+            elif isinstance(current, set) and isinstance(value, set) and type_of(current) == type_of(value):
+                _set_path(item, path, current | value)
+            else:
+                raise ExpressionError("An operand in the update expression has an incorrect data type")
+        elif action == "DELETE":
+            current = get_path(item, path)
+            if current is MISSING:
+                continue
+            if not isinstance(current, set) or not isinstance(value, set) or type_of(current) != type_of(value):
+                raise ExpressionError("An operand in the update expression has an incorrect data type")
+            if current - value:
+                _set_path(item, path, current - value)
+            else:
+                _remove_path(item, path)
+    return {path[0] for _, (_, path), _ in actions}
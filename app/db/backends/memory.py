@@ -0,0 +1,482 @@
+import copy
+import threading
+import time
+import zlib
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+from botocore.exceptions import ClientError
+from app.core.tracing import record_call
+from app.db.backends.base import StorageTable
+from app.db.backends.expressions import (
+    ExpressionError, MISSING, Placeholders, apply_update, evaluate, normalize, to_wire, type_of
+)
+
+# Same limits DynamoDB enforces, so code tested in memory does not break on AWS
+BATCH_GET_MAX_KEYS = 100
+BATCH_WRITE_MAX_ITEMS = 25
+TRANSACT_MAX_ITEMS = 100
+
+def _error(code: str, message: str, operation: str, **extra) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}, **extra}, operation)
+
+def _validation_error(message: str, operation: str) -> ClientError:
+    return _error("ValidationException", message, operation)
+
+def _key_schema(key_schema: list) -> Tuple[str, Optional[str]]:
+    hash_key = next(key["AttributeName"] for key in key_schema if key["KeyType"] == "HASH")
+    range_key = next((key["AttributeName"] for key in key_schema if key["KeyType"] == "RANGE"), None)
+    return hash_key, range_key
+
+class _Index:
+    """Secondary index: items grouped by hash key value, kept in range key order on write.
+
+    Items lacking one of the index key attributes are left out, as in a sparse GSI.
+    """
+
+    def __init__(self, name: str, key_schema: list):
+        self.name = name
+        self.hash_key, self.range_key = _key_schema(key_schema)
+        # hash value -> sorted ``(range value, pk)`` positions, so a query only walks the page it returns
+        self.partitions: Dict[object, List[tuple]] = {}
+
+    def _entry(self, item: dict):
+        hash_value = item.get(self.hash_key, MISSING)
+        range_value = item.get(self.range_key, MISSING) if self.range_key else 0
+        if hash_value is MISSING or range_value is MISSING:
+            return None
+        return hash_value, range_value
+
+    def add(self, pk: tuple, item: dict):
+        entry = self._entry(item)
+        if entry is not None:
+            insort(self.partitions.setdefault(entry[0], []), (entry[1], pk))
+
+    def remove(self, pk: tuple, item: dict):
+        entry = self._entry(item)
+        if entry is not None:
+            partition = self.partitions.get(entry[0], [])
+            position = bisect_left(partition, (entry[1], pk))
+            if position < len(partition) and partition[position] == (entry[1], pk):
+                del partition[position]
+            if not partition:
+                self.partitions.pop(entry[0], None)
+
+    def ordered(self, hash_value) -> List[tuple]:
+        """``(range value, pk)`` positions of one partition, in range key order; callers must not change it"""
+        return self.partitions.get(hash_value, [])
+
+class _TableData:
+    """Items of one in-memory table plus its secondary indexes"""
+
+    def __init__(self, name: str, key_schema: list, attribute_definitions: list, indexes: list = ()):
+        self.name = name
+        self.hash_key, self.range_key = _key_schema(key_schema)
+        self.attribute_types = {
+            definition["AttributeName"]: definition["AttributeType"] for definition in attribute_definitions
+        }
+        self.indexes = {index["IndexName"]: _Index(index["IndexName"], index["KeySchema"]) for index in indexes}
+        self.items: Dict[tuple, dict] = {}
+        self._sorted_keys: Optional[List[tuple]] = None
+
+    @property
+    def key_names(self) -> Tuple[str, ...]:
+        return (self.hash_key, self.range_key) if self.range_key else (self.hash_key,)
+
+    def pk(self, key: dict, operation: str) -> tuple:
+        if set(key) != set(self.key_names):
+            raise _validation_error("The provided key element does not match the schema", operation)
+        key = {name: normalize(value) for name, value in key.items()}
+        self._check_types(key, self.key_names, operation)
+        return tuple(key[name] for name in self.key_names)
+
+    def key_of(self, item: dict) -> dict:
+        return {name: item[name] for name in self.key_names}
+
+    def sorted_keys(self) -> List[tuple]:
+        # Scans walk the keys in a stable order, so LastEvaluatedKey can be resumed from
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted(self.items)
+        return self._sorted_keys
+
+    def _check_types(self, item: dict, names, operation: str):
+        for name in names:
+            value = item.get(name, MISSING)
+            expected = self.attribute_types.get(name)
+            if value is not MISSING and expected and type_of(value) != expected:
+                raise _validation_error(
+                    f"One or more parameter values were invalid: Type mismatch for key {name} expected: {expected}",
+                    operation
+                )
+            if expected == "S" and value == "":
+                raise _validation_error(
+                    f"One or more parameter values are not valid. The AttributeValue for a key attribute "
+                    f"cannot contain an empty string value. Key: {name}",
+                    operation
+                )
+
+    def validate(self, item: dict, operation: str):
+        """Key attributes present, key and index key attributes of the declared type"""
+        for name in self.key_names:
+            if name not in item:
+                raise _validation_error(f"One or more parameter values were invalid: Missing the key {name} in the item", operation)
+        index_keys = {name for index in self.indexes.values() for name in (index.hash_key, index.range_key) if name}
+        self._check_types(item, set(self.key_names) | index_keys, operation)
+
+    def write(self, pk: tuple, item: Optional[dict]):
+        """Replace (or delete, with None) the item stored under ``pk``, keeping the indexes in step"""
+        old = self.items.get(pk)
+        if old is not None:
+            for index in self.indexes.values():
+                index.remove(pk, old)
+        if item is None:
+            if old is not None:
+                del self.items[pk]
+                self._sorted_keys = None
+            return
+        if old is None:
+            self._sorted_keys = None
+        self.items[pk] = item
+        for index in self.indexes.values():
+            index.add(pk, item)
+
+class MemoryStore:
+    """Process-local tables with DynamoDB semantics, for tests and load experiments.
+
+    Data lives only as long as the process, and every worker has its own copy.
+    """
+
+    def __init__(self):
+        self._tables: Dict[str, _TableData] = {}
+        self.lock = threading.RLock()
+
+    def create_table(self, name: str, key_schema: list, attribute_definitions: list, indexes: list = ()) -> bool:
+        """Create a table; False if it already exists"""
+        with self.lock:
+            if name in self._tables:
+                return False
+            self._tables[name] = _TableData(name, key_schema, attribute_definitions, indexes)
+            return True
+
+    def reset(self):
+        """Empty every table, keeping their definitions"""
+        with self.lock:
+            for data in self._tables.values():
+                data.items.clear()
+                data._sorted_keys = None
+                for index in data.indexes.values():
+                    index.partitions.clear()
+
+    def data(self, name: str, operation: str) -> _TableData:
+        data = self._tables.get(name)
+        if data is None:
+            raise _error("ResourceNotFoundException", "Requested resource not found", operation)
+        return data
+
+    def table(self, name: str) -> "MemoryTable":
+        return MemoryTable(self, name)
+
+def _project(item: dict, projection: Optional[str], names: Optional[dict]) -> dict:
+    if not projection:
+        return copy.deepcopy(item)
+    projected = {}
+    for path in projection.split(","):
+        name = path.strip()
+        name = (names or {}).get(name, name)
+        if name in item:
+            projected[name] = copy.deepcopy(item[name])
+    return projected
+
+class MemoryTable(StorageTable):
+    """In-memory table, answering each call straight on the event loop"""
+
+    def __init__(self, store: MemoryStore, name: str):
+        self.store = store
+        self.name = name
+
+    def _run(self, operation: str, fn, *args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            with self.store.lock:
+                return fn(*args, **kwargs)
+        except ExpressionError as e:
+            raise _validation_error(str(e), operation) from None
+        finally:
+            record_call("memory", f"{self.name}.{operation}", time.perf_counter() - started_at)
+
+    async def get_item(self, Key: dict, ProjectionExpression: Optional[str] = None,
+                       ExpressionAttributeNames: Optional[dict] = None, **kwargs) -> dict:
+        def get():
+            data = self.store.data(self.name, "GetItem")
+            item = data.items.get(data.pk(Key, "GetItem"))
+            return {} if item is None else {"Item": _project(item, ProjectionExpression, ExpressionAttributeNames)}
+        return self._run("get_item", get)
+
+    async def put_item(self, Item: dict, ConditionExpression=None, ExpressionAttributeNames: Optional[dict] = None,
+                       ExpressionAttributeValues: Optional[dict] = None, ReturnValues: str = "NONE", **kwargs) -> dict:
+        def put():
+            data = self.store.data(self.name, "PutItem")
+            item = {name: normalize(value) for name, value in Item.items()}
+            data.validate(item, "PutItem")
+            pk = data.pk(data.key_of(item), "PutItem")
+            old = data.items.get(pk)
+            self._check_condition(ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                                  old, kwargs.get("ReturnValuesOnConditionCheckFailure"), "PutItem")
+            data.write(pk, item)
+            return {"Attributes": copy.deepcopy(old)} if ReturnValues == "ALL_OLD" and old else {}
+        return self._run("put_item", put)
+
+    async def update_item(self, Key: dict, UpdateExpression: str, ConditionExpression=None,
+                          ExpressionAttributeNames: Optional[dict] = None, ExpressionAttributeValues: Optional[dict] = None,
+                          ReturnValues: str = "NONE", ReturnValuesOnConditionCheckFailure: str = "NONE", **kwargs) -> dict:
+        def update():
+            data = self.store.data(self.name, "UpdateItem")
+            pk = data.pk(Key, "UpdateItem")
+            old = data.items.get(pk)
+            new, touched = self._updated(
+                data, pk, old, UpdateExpression, ConditionExpression, ExpressionAttributeNames,
+                ExpressionAttributeValues, ReturnValuesOnConditionCheckFailure, "UpdateItem"
+            )
+            data.write(pk, new)
+            if ReturnValues == "ALL_NEW":
+                return {"Attributes": copy.deepcopy(new)}
+            if ReturnValues == "ALL_OLD":
+                return {"Attributes": copy.deepcopy(old)} if old else {}
+            if ReturnValues in ("UPDATED_NEW", "UPDATED_OLD"):
+                source = new if ReturnValues == "UPDATED_NEW" else (old or {})
+                return {"Attributes": {name: copy.deepcopy(source[name]) for name in touched if name in source}}
+            return {}
+        return self._run("update_item", update)
+
+    async def delete_item(self, Key: dict, ConditionExpression=None, ExpressionAttributeNames: Optional[dict] = None,
+                          ExpressionAttributeValues: Optional[dict] = None, ReturnValues: str = "NONE", **kwargs) -> dict:
+        def delete():
+            data = self.store.data(self.name, "DeleteItem")
+            pk = data.pk(Key, "DeleteItem")
+            old = data.items.get(pk)
+            self._check_condition(ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                                  old, kwargs.get("ReturnValuesOnConditionCheckFailure"), "DeleteItem")
+            data.write(pk, None)
+            return {"Attributes": copy.deepcopy(old)} if ReturnValues == "ALL_OLD" and old else {}
+        return self._run("delete_item", delete)
+
+    async def query(self, KeyConditionExpression, IndexName: Optional[str] = None, FilterExpression=None,
+                    ExpressionAttributeNames: Optional[dict] = None, ExpressionAttributeValues: Optional[dict] = None,
+                    ScanIndexForward: bool = True, Limit: Optional[int] = None, ExclusiveStartKey: Optional[dict] = None,
+                    ProjectionExpression: Optional[str] = None, **kwargs) -> dict:
+        def query():
+            data = self.store.data(self.name, "Query")
+            placeholders = Placeholders(ExpressionAttributeNames, ExpressionAttributeValues)
+            key_condition = placeholders.condition(KeyConditionExpression, is_key_condition=True)
+            filter_condition = placeholders.condition(FilterExpression) if FilterExpression is not None else None
+            placeholders.check_unused()
+
+            if IndexName is not None:
+                index = data.indexes.get(IndexName)
+                if index is None:
+                    raise _validation_error(f"The table does not have the specified index: {IndexName}", "Query")
+            else:
+                index = _Index("", [{"AttributeName": data.hash_key, "KeyType": "HASH"}] +
+                               ([{"AttributeName": data.range_key, "KeyType": "RANGE"}] if data.range_key else []))
+            hash_value = _hash_value(key_condition, index.hash_key)
+            if IndexName is not None:
+                positions = index.ordered(hash_value)
+            else:
+                positions = sorted(
+                    (item.get(data.range_key) if data.range_key else 0, pk)
+                    for pk, item in data.items.items() if item.get(data.hash_key) == hash_value
+                )
+            # Start right after ExclusiveStartKey and stop once the page is known to be full
+            start = _position(data, index, ExclusiveStartKey) if ExclusiveStartKey else None
+            if ScanIndexForward:
+                walk = range(bisect_right(positions, start) if start else 0, len(positions))
+            else:
+                walk = range((bisect_left(positions, start) if start else len(positions)) - 1, -1, -1)
+            matching = []
+            for offset in walk:
+                item = data.items[positions[offset][1]]
+                if evaluate(key_condition, item):
+                    matching.append(item)
+                    if Limit and len(matching) > Limit:
+                        break
+            return self._page(data, index if IndexName is not None else None, matching, filter_condition,
+                              Limit, ProjectionExpression, ExpressionAttributeNames)
+        return self._run("query", query)
+
+    async def scan(self, FilterExpression=None, ExpressionAttributeNames: Optional[dict] = None,
+                   ExpressionAttributeValues: Optional[dict] = None, Limit: Optional[int] = None,
+                   ExclusiveStartKey: Optional[dict] = None, Segment: Optional[int] = None,
+                   TotalSegments: Optional[int] = None, ProjectionExpression: Optional[str] = None, **kwargs) -> dict:
+        def scan():
+            data = self.store.data(self.name, "Scan")
+            placeholders = Placeholders(ExpressionAttributeNames, ExpressionAttributeValues)
+            filter_condition = placeholders.condition(FilterExpression) if FilterExpression is not None else None
+            placeholders.check_unused()
+            if (Segment is None) != (TotalSegments is None):
+                raise _validation_error("Segment and TotalSegments must be given together", "Scan")
+
+            keys = data.sorted_keys()
+            if ExclusiveStartKey:
+                keys = keys[bisect_right(keys, data.pk(ExclusiveStartKey, "Scan")):]
+            if TotalSegments:
+                keys = [key for key in keys if zlib.crc32(repr(key).encode()) % TotalSegments == Segment]
+            items = [data.items[key] for key in keys]
+            return self._page(data, None, items, filter_condition, Limit, ProjectionExpression, ExpressionAttributeNames)
+        return self._run("scan", scan)
+
+    async def batch_write(self, items: list) -> int:
+        def write():
+            data = self.store.data(self.name, "BatchWriteItem")
+            for raw in items:
+                item = {name: normalize(value) for name, value in raw.items()}
+                data.validate(item, "BatchWriteItem")
+                data.write(data.pk(data.key_of(item), "BatchWriteItem"), item)
+            return len(items)
+        return self._run("batch_write_item", write)
+
+    async def batch_write_item(self, items: list, **kwargs) -> dict:
+        def batch_write():
+            data = self.store.data(self.name, "BatchWriteItem")
+            if len(items) > BATCH_WRITE_MAX_ITEMS:
+                raise _validation_error("Member must have length less than or equal to 25", "BatchWriteItem")
+            # The whole request is validated before any item is written, as DynamoDB does
+            writes = []
+            for raw in items:
+                item = {name: normalize(value) for name, value in raw.items()}
+                data.validate(item, "BatchWriteItem")
+                writes.append((data.pk(data.key_of(item), "BatchWriteItem"), item))
+            if len({pk for pk, _ in writes}) != len(writes):
+                raise _validation_error("Provided list of item keys contains duplicates", "BatchWriteItem")
+            for pk, item in writes:
+                data.write(pk, item)
+            return {"UnprocessedItems": {}}
+        return self._run("batch_write_item", batch_write)
+
+    async def batch_get_item(self, keys: list, ProjectionExpression: Optional[str] = None,
+                             ExpressionAttributeNames: Optional[dict] = None, **kwargs) -> dict:
+        def batch_get():
+            data = self.store.data(self.name, "BatchGetItem")
+            if len(keys) > BATCH_GET_MAX_KEYS:
+                raise _validation_error("Too many items requested for the BatchGetItem call", "BatchGetItem")
+            pks = [data.pk(key, "BatchGetItem") for key in keys]
+            if len(set(pks)) != len(pks):
+                raise _validation_error("Provided list of item keys contains duplicates", "BatchGetItem")
+            found = [data.items[pk] for pk in pks if pk in data.items]
+            return {
+                "Responses": {self.name: [_project(item, ProjectionExpression, ExpressionAttributeNames) for item in found]},
+                "UnprocessedKeys": {},
+            }
+        return self._run("batch_get_item", batch_get)
+
+    async def transact_update(self, updates: list) -> dict:
+        def transact():
+            if len(updates) > TRANSACT_MAX_ITEMS:
+                raise _validation_error("Member must have length less than or equal to 100", "TransactWriteItems")
+            targets = []
+            for update in updates:
+                data = self.store.data(update.get("TableName", self.name), "TransactWriteItems")
+                targets.append((data, data.pk(update["Key"], "TransactWriteItems")))
+            if len({(data.name, pk) for data, pk in targets}) != len(targets):
+                raise _validation_error(
+                    "Transaction request cannot include multiple operations on one item", "TransactWriteItems"
+                )
+
+            # Every condition is checked before anything is written
+            results = []
+            reasons = []
+            for update, (data, pk) in zip(updates, targets):
+                old = data.items.get(pk)
+                try:
+                    results.append(self._updated(
+                        data, pk, old, update["UpdateExpression"], update.get("ConditionExpression"),
+                        update.get("ExpressionAttributeNames"), update.get("ExpressionAttributeValues"),
+                        update.get("ReturnValuesOnConditionCheckFailure", "NONE"), "TransactWriteItems"
+                    )[0])
+                    reasons.append({"Code": "None"})
+                except ClientError as e:
+                    if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                        raise
+                    reason = {"Code": "ConditionalCheckFailed", "Message": "The conditional request failed"}
+                    if "Item" in e.response:
+                        reason["Item"] = e.response["Item"]
+                    reasons.append(reason)
+            if len(results) != len(updates):
+                codes = ", ".join(reason["Code"] for reason in reasons)
+                raise _error(
+                    "TransactionCanceledException",
+                    f"Transaction cancelled, please refer cancellation reasons for specific reasons [{codes}]",
+                    "TransactWriteItems",
+                    CancellationReasons=reasons
+                )
+            for (data, pk), new in zip(targets, results):
+                data.write(pk, new)
+            return {}
+        return self._run("transact_write_items", transact)
+
+    def _check_condition(self, condition, names, values, old: Optional[dict], return_on_failure: Optional[str], operation: str):
+        placeholders = Placeholders(names, values)
+        node = placeholders.condition(condition) if condition is not None else None
+        placeholders.check_unused()
+        if node is not None and not evaluate(node, old or {}):
+            extra = {"Item": to_wire(old)} if return_on_failure == "ALL_OLD" and old else {}
+            raise _error("ConditionalCheckFailedException", "The conditional request failed", operation, **extra)
+
+    def _updated(self, data: _TableData, pk: tuple, old: Optional[dict], update_expression: str, condition,
+                 names, values, return_on_failure: str, operation: str) -> Tuple[dict, set]:
+        """The item as ``update_expression`` leaves it, once ``condition`` holds on the current one"""
+        placeholders = Placeholders(names, values)
+        actions = placeholders.update(update_expression)
+        node = placeholders.condition(condition) if condition is not None else None
+        placeholders.check_unused()
+        if node is not None and not evaluate(node, old or {}):
+            extra = {"Item": to_wire(old)} if return_on_failure == "ALL_OLD" and old else {}
+            raise _error("ConditionalCheckFailedException", "The conditional request failed", operation, **extra)
+
+        new = copy.deepcopy(old) if old is not None else dict(zip(data.key_names, pk))
+        touched = apply_update(actions, new)
+        for name in data.key_names:
+            if name in touched:
+                raise _validation_error(
+                    f"One or more parameter values were invalid: Cannot update attribute {name}. "
+                    f"This attribute is part of the key",
+                    operation
+                )
+        data.validate(new, operation)
+        return new, touched
+
+    def _page(self, data: _TableData, index: Optional[_Index], items: List[dict], filter_condition,
+              limit: Optional[int], projection: Optional[str], names: Optional[dict]) -> dict:
+        # Limit caps the items read, before the filter drops any
+        evaluated = items[:limit] if limit else items
+        kept = [item for item in evaluated if filter_condition is None or evaluate(filter_condition, item)]
+        response = {
+            "Items": [_project(item, projection, names) for item in kept],
+            "Count": len(kept),
+            "ScannedCount": len(evaluated),
+        }
+        if limit and len(items) > limit:
+            last = evaluated[-1]
+            last_key = data.key_of(last)
+            if index is not None:
+                last_key.update({name: last[name] for name in (index.hash_key, index.range_key) if name})
+            response["LastEvaluatedKey"] = copy.deepcopy(last_key)
+        return response
+
+def _hash_value(key_condition, hash_key: str):
+    """Value the key condition pins the partition key to"""
+    node = key_condition
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node[0] == "and":
+            stack.extend(node[1:])
+        elif node[0] == "cmp" and node[1] == "=" and node[2] == ("path", (hash_key,)) and node[3][0] == "value":
+            return node[3][1]
+    raise ExpressionError(f"Query condition missed key schema element: {hash_key}")
+
+def _position(data: _TableData, index: _Index, start_key: dict) -> tuple:
+    start_key = {name: normalize(value) for name, value in start_key.items()}
+    pk = tuple(start_key.get(name) for name in data.key_names)
+    range_value = start_key.get(index.range_key) if index.range_key else 0
+    return range_value, pk
+
+memory_store = MemoryStore()
@@ -1,108 +1,310 @@
+import logging
+import threading
 import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from typing import Iterable, List, Optional, Tuple
 from app.core.config import settings
+from app.db.backends import DynamoDBTable, StorageTable, memory_store
+from app.db.executor import DynamoDBExecutor, dynamodb_executor
+
+logger = logging.getLogger(__name__)
+
+LICENSE_KEY_SCHEMA = [
+    {'AttributeName': 'license_id', 'KeyType': 'HASH'}
+]
+# Secondary indexes of the Licenses table. ``listing_status`` is only written on
+# active licenses, which keeps active-price-index sparse. All of them share the
+# "active" partition: sorted browsing needs one global price order, and the
+# writes landing there (license edits, unsharded reservations) stay well under
+# a partition's throughput. See README.
+LICENSE_ATTRIBUTE_DEFINITIONS = [
+    {'AttributeName': 'license_id', 'AttributeType': 'S'},
+    {'AttributeName': 'category', 'AttributeType': 'S'},
+    {'AttributeName': 'price', 'AttributeType': 'N'},
+    {'AttributeName': 'listing_status', 'AttributeType': 'S'}
+]
+LICENSE_INDEXES = [
+    {
+        'IndexName': 'category-price-index',
+        'KeySchema': [
+            {'AttributeName': 'category', 'KeyType': 'HASH'},
+            {'AttributeName': 'price', 'KeyType': 'RANGE'}
+        ],
+        'Projection': {
+            'ProjectionType': 'ALL'
+        },
+        'ProvisionedThroughput': {
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5
+        }
+    },
+    {
+        'IndexName': 'active-price-index',
+        'KeySchema': [
+            {'AttributeName': 'listing_status', 'KeyType': 'HASH'},
+            {'AttributeName': 'price', 'KeyType': 'RANGE'}
+        ],
+        'Projection': {
+            'ProjectionType': 'ALL'
+        },
+        'ProvisionedThroughput': {
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5
+        }
+    }
+]
+
+# Stock shards are keyed "<license_id>#<shard>" so each lands on its own partition
+STOCK_SHARDS_KEY_SCHEMA = [
+    {'AttributeName': 'shard_id', 'KeyType': 'HASH'}
+]
+STOCK_SHARDS_ATTRIBUTE_DEFINITIONS = [
+    {'AttributeName': 'shard_id', 'AttributeType': 'S'}
+]
+
+USER_KEY_SCHEMA = [
+    {'AttributeName': 'user_id', 'KeyType': 'HASH'}
+]
+USER_ATTRIBUTE_DEFINITIONS = [
+    {'AttributeName': 'user_id', 'AttributeType': 'S'},
+    {'AttributeName': 'username', 'AttributeType': 'S'},
+    {'AttributeName': 'email', 'AttributeType': 'S'}
+]
+USER_INDEXES = [
+    {
+        'IndexName': 'username-index',
+        'KeySchema': [
+            {'AttributeName': 'username', 'KeyType': 'HASH'}
+        ],
+        'Projection': {
+            'ProjectionType': 'ALL'
+        },
+        'ProvisionedThroughput': {
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5
+        }
+    },
+    {
+        'IndexName': 'email-index',
+        'KeySchema': [
+            {'AttributeName': 'email', 'KeyType': 'HASH'}
+        ],
+        'Projection': {
+            'ProjectionType': 'ALL'
+        },
+        'ProvisionedThroughput': {
+            'ReadCapacityUnits': 5,
+            'WriteCapacityUnits': 5
+        }
+    }
+]
+
+async def read_page(table, limit: int, exclusive_start_key: Optional[dict] = None, skip: int = 0, operation: str = "scan", **request_kwargs) -> Tuple[List[dict], Optional[dict]]:
+    """Read one page of a table scan (or query, with ``operation="query"``).
+
+    Returns the items and the LastEvaluatedKey to resume from. ``skip`` is only
+    kept for the legacy offset pagination and costs extra reads.
+    """
+    items = []
+    start_key = exclusive_start_key
+    while True:
+        page_kwargs = dict(request_kwargs, Limit=skip + limit - len(items))
+        if start_key:
+            page_kwargs["ExclusiveStartKey"] = start_key
+        response = await getattr(table, operation)(**page_kwargs)
+        page = response.get("Items", [])
+        if skip:
+            skipped = min(skip, len(page))
+            page = page[skipped:]
+            skip -= skipped
+        items.extend(page)
+        start_key = response.get("LastEvaluatedKey")
+        if start_key is None or len(items) >= limit:
+            return items, start_key
+
+def build_update(data: dict, key_name: str, remove: Iterable[str] = ()) -> dict:
+    """UpdateItem keyword arguments that SET every attribute in ``data`` (and REMOVE
+    the ``remove`` ones) on an existing item"""
+    names = {}
+    values = {}
+    assignments = []
+    for key, value in data.items():
+        if key != key_name:
+            assignments.append(f"#{key} = :{key}")
+            names[f"#{key}"] = key
+            values[f":{key}"] = value
+    update_expression = "SET " + ", ".join(assignments)
+    removals = [key for key in remove if key != key_name]
+    if removals:
+        names.update({f"#{key}": key for key in removals})
+        update_expression += " REMOVE " + ", ".join(f"#{key}" for key in removals)
+    return {
+        "UpdateExpression": update_expression,
+        "ExpressionAttributeNames": names,
+        "ExpressionAttributeValues": values,
+        "ConditionExpression": f"attribute_exists({key_name})",
+        "ReturnValues": "ALL_NEW"
+    }
+
+def is_conditional_check_failed(error: Exception) -> bool:
+    return isinstance(error, ClientError) and \
+        error.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+
+def transaction_cancellation_reasons(error: Exception) -> Optional[list]:
+    """Per-action CancellationReasons of a cancelled transaction, None for any other error"""
+    if isinstance(error, ClientError) and \
+            error.response.get("Error", {}).get("Code") == "TransactionCanceledException":
+        return error.response.get("CancellationReasons", [])
+    return None
 
 class DynamoDB:
+    """Owns the single boto3 session and connection pool shared by every table"""
+    session = None
     client = None
     resource = None
 
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def _config(self) -> Config:
+        return Config(
+            region_name=settings.DYNAMODB_REGION,
+            max_pool_connections=settings.DYNAMODB_MAX_POOL_CONNECTIONS,
+            connect_timeout=settings.DYNAMODB_CONNECT_TIMEOUT,
+            read_timeout=settings.DYNAMODB_READ_TIMEOUT,
+            tcp_keepalive=settings.DYNAMODB_TCP_KEEPALIVE,
+            retries={
+                "max_attempts": settings.DYNAMODB_MAX_ATTEMPTS,
+                "mode": settings.DYNAMODB_RETRY_MODE
+            }
+        )
+
     def connect_to_dynamodb(self):
-        if settings.ENV == "development" and settings.DYNAMODB_ENDPOINT_URL:
-            # Use local DynamoDB for development
-            self.client = boto3.client(
-                'dynamodb', 
-                region_name=settings.DYNAMODB_REGION,
-                endpoint_url=settings.DYNAMODB_ENDPOINT_URL,
-                aws_access_key_id='dummy',
-                aws_secret_access_key='dummy'
-            )
-            self.resource = boto3.resource(
-                'dynamodb', 
-                region_name=settings.DYNAMODB_REGION,
-                endpoint_url=settings.DYNAMODB_ENDPOINT_URL,
-                aws_access_key_id='dummy',
-                aws_secret_access_key='dummy'
+        if settings.STORAGE_BACKEND == "memory":
+            return
+        with self._lock:
+            if self.resource is not None:
+                return
+            resource_kwargs = {"config": self._config()}
+            if settings.ENV == "development" and settings.DYNAMODB_ENDPOINT_URL:
+                # Use local DynamoDB for development
+                self.session = boto3.session.Session(
+                    region_name=settings.DYNAMODB_REGION,
+                    aws_access_key_id='dummy',
+                    aws_secret_access_key='dummy'
+                )
+                resource_kwargs["endpoint_url"] = settings.DYNAMODB_ENDPOINT_URL
+            else:
+                # Use AWS DynamoDB for production
+                self.session = boto3.session.Session(region_name=settings.DYNAMODB_REGION)
+            self.resource = self.session.resource('dynamodb', **resource_kwargs)
+            # The resource's client shares its connection pool
+            self.client = self.resource.meta.client
+
+        logger.info("Connected to DynamoDB")
+
+    def table(self, name: str, executor: Optional[DynamoDBExecutor] = None) -> StorageTable:
+        """Async handle on a table of the configured STORAGE_BACKEND; the DynamoDB
+        connection is opened on first use"""
+        if settings.STORAGE_BACKEND == "memory":
+            return memory_store.table(name)
+        return DynamoDBTable(self, name, executor or dynamodb_executor)
+
+    def add_missing_license_indexes(self):
+        """Add the license GSIs to a table created before they existed.
+
+        DynamoDB builds one new index per UpdateTable call, so a table missing
+        both gets the second one on a later startup.
+        """
+        try:
+            description = self.client.describe_table(TableName=settings.DYNAMODB_TABLE)["Table"]
+            existing = {index["IndexName"] for index in description.get("GlobalSecondaryIndexes", [])}
+            missing = [index for index in LICENSE_INDEXES if index["IndexName"] not in existing]
+            if not missing:
+                return
+            index = missing[0]
+            index_attributes = {key["AttributeName"] for key in index["KeySchema"]}
+            self.client.update_table(
+                TableName=settings.DYNAMODB_TABLE,
+                AttributeDefinitions=[
+                    definition for definition in LICENSE_ATTRIBUTE_DEFINITIONS
+                    if definition["AttributeName"] in index_attributes
+                ],
+                GlobalSecondaryIndexUpdates=[{"Create": index}]
             )
-        else:
-            # Use AWS DynamoDB for production
-            self.client = boto3.client('dynamodb', region_name=settings.DYNAMODB_REGION)
-            self.resource = boto3.resource('dynamodb', region_name=settings.DYNAMODB_REGION)
-        
-        print("Connected to DynamoDB.")
+            logger.info("Creating index %s on %s", index["IndexName"], settings.DYNAMODB_TABLE)
+        except Exception as e:
+            logger.error("Error adding indexes to %s: %s", settings.DYNAMODB_TABLE, e)
+
+    def _create_memory_tables(self):
+        memory_store.create_table(settings.DYNAMODB_TABLE, LICENSE_KEY_SCHEMA, LICENSE_ATTRIBUTE_DEFINITIONS, LICENSE_INDEXES)
+        memory_store.create_table(
+            settings.DYNAMODB_STOCK_SHARDS_TABLE, STOCK_SHARDS_KEY_SCHEMA, STOCK_SHARDS_ATTRIBUTE_DEFINITIONS
+        )
+        memory_store.create_table("Users", USER_KEY_SCHEMA, USER_ATTRIBUTE_DEFINITIONS, USER_INDEXES)
+        logger.info("Created in-memory tables")
 
     def create_tables(self):
         """Create DynamoDB tables if they don't exist"""
+        if settings.STORAGE_BACKEND == "memory":
+            self._create_memory_tables()
+            return
         try:
             # Create Licenses table
             licenses_table = self.resource.create_table(
                 TableName=settings.DYNAMODB_TABLE,
-                KeySchema=[
-                    {'AttributeName': 'license_id', 'KeyType': 'HASH'}
-                ],
-                AttributeDefinitions=[
-                    {'AttributeName': 'license_id', 'AttributeType': 'S'}
-                ],
+                KeySchema=LICENSE_KEY_SCHEMA,
+                AttributeDefinitions=LICENSE_ATTRIBUTE_DEFINITIONS,
+                GlobalSecondaryIndexes=LICENSE_INDEXES,
+                ProvisionedThroughput={
+                    'ReadCapacityUnits': 5,
+                    'WriteCapacityUnits': 5
+                }
+            )
+            logger.info("Created table: %s", settings.DYNAMODB_TABLE)
+        except Exception as e:
+            if "Table already exists" in str(e):
+                logger.info("Table %s already exists", settings.DYNAMODB_TABLE)
+                self.add_missing_license_indexes()
+            else:
+                logger.error("Error creating table %s: %s", settings.DYNAMODB_TABLE, e)
+
+        try:
+            # Stock shards of flash-sale licenses, one partition per shard
+            self.resource.create_table(
+                TableName=settings.DYNAMODB_STOCK_SHARDS_TABLE,
+                KeySchema=STOCK_SHARDS_KEY_SCHEMA,
+                AttributeDefinitions=STOCK_SHARDS_ATTRIBUTE_DEFINITIONS,
                 ProvisionedThroughput={
                     'ReadCapacityUnits': 5,
                     'WriteCapacityUnits': 5
                 }
             )
-            print(f"Created table: {settings.DYNAMODB_TABLE}")
+            logger.info("Created table: %s", settings.DYNAMODB_STOCK_SHARDS_TABLE)
         except Exception as e:
             if "Table already exists" in str(e):
-                print(f"Table {settings.DYNAMODB_TABLE} already exists.")
+                logger.info("Table %s already exists", settings.DYNAMODB_STOCK_SHARDS_TABLE)
             else:
-                print(f"Error creating table: {e}")
+                logger.error("Error creating table %s: %s", settings.DYNAMODB_STOCK_SHARDS_TABLE, e)
 
         try:
             # Create Users table
             users_table = self.resource.create_table(
                 TableName="Users",
-                KeySchema=[
-                    {'AttributeName': 'user_id', 'KeyType': 'HASH'}
-                ],
-                AttributeDefinitions=[
-                    {'AttributeName': 'user_id', 'AttributeType': 'S'},
-                    {'AttributeName': 'username', 'AttributeType': 'S'},
-                    {'AttributeName': 'email', 'AttributeType': 'S'}
-                ],
-                GlobalSecondaryIndexes=[
-                    {
-                        'IndexName': 'username-index',
-                        'KeySchema': [
-                            {'AttributeName': 'username', 'KeyType': 'HASH'}
-                        ],
-                        'Projection': {
-                            'ProjectionType': 'ALL'
-                        },
-                        'ProvisionedThroughput': {
-                            'ReadCapacityUnits': 5,
-                            'WriteCapacityUnits': 5
-                        }
-                    },
-                    {
-                        'IndexName': 'email-index',
-                        'KeySchema': [
-                            {'AttributeName': 'email', 'KeyType': 'HASH'}
-                        ],
-                        'Projection': {
-                            'ProjectionType': 'ALL'
-                        },
-                        'ProvisionedThroughput': {
-                            'ReadCapacityUnits': 5,
-                            'WriteCapacityUnits': 5
-                        }
-                    }
-                ],
+                KeySchema=USER_KEY_SCHEMA,
+                AttributeDefinitions=USER_ATTRIBUTE_DEFINITIONS,
+                GlobalSecondaryIndexes=USER_INDEXES,
                 ProvisionedThroughput={
                     'ReadCapacityUnits': 5,
                     'WriteCapacityUnits': 5
                 }
             )
-            print("Created table: Users")
+            logger.info("Created table: Users")
         except Exception as e:
             if "Table already exists" in str(e):
-                print("Table Users already exists.")
+                logger.info("Table Users already exists")
             else:
-                print(f"Error creating Users table: {e}")
+                logger.error("Error creating Users table: %s", e)
 
 dynamodb = DynamoDB() 
\ No newline at end of file
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+
+class DynamoDBExecutor:
+    """Bounded thread pool that runs blocking boto3 calls off the event loop"""
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers,
+                        thread_name_prefix="dynamodb"
+                    )
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn`` on the pool and await its result"""
+        loop = asyncio.get_running_loop()
+        submitted_at = time.perf_counter()
+        started_at = submitted_at
+
+        def call():
+            nonlocal started_at
+            started_at = time.perf_counter()
+            return fn(*args, **kwargs)
+
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return await loop.run_in_executor(self._get_executor(), call)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            finished_at = time.perf_counter()
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_wait_seconds += started_at - submitted_at
+            self.total_run_seconds += finished_at - started_at
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "completed": self.completed,
+            "failed": self.failed,
+            "total_wait_seconds": round(self.total_wait_seconds, 6),
+            "total_run_seconds": round(self.total_run_seconds, 6),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+dynamodb_executor = DynamoDBExecutor(settings.DYNAMODB_MAX_CONCURRENCY)
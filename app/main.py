@@ -1,10 +1,37 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import random
+import uuid
+import time
+from typing import Optional
+from fastapi import Depends, FastAPI, Request, Response, status
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import license_router, user_router, auth_router
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Receive, Scope, Send
+from app.api import license_router, user_router, auth_router, admin_router
+from app.api.deps import get_admin_from_authorization
 from app.db.dynamodb import dynamodb
+from app.db.executor import dynamodb_executor
+from app.crud.license import license_crud
 from app.core.config import settings
+from app.core.logging import configure_logging, shutdown_logging, request_id_var
+from app.core.security import PasswordHasherBusy, password_hasher
+from app.core.tracing import RequestTrace, request_trace_var
+from app.core.profiling import RequestProfile, profile_store
+from app.core.metrics import (
+    HTTP_REQUESTS, HTTP_REQUEST_DURATION, render_metrics, track_route
+)
+from app.services.s3_service import s3_service
+
+configure_logging()
 
-app = FastAPI(title="LapsusINt Store Backend", version="1.0.0")
+app = FastAPI(
+    title="LapsusINt Store Backend",
+    version="1.0.0",
+    # Runs once the route is known: in-flight gauge and route label of DynamoDB capacity
+    dependencies=[Depends(track_route)]
+)
 
 # Configure CORS
 app.add_middleware(
@@ -22,26 +49,171 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Request-ID", "ETag", "Server-Timing", "X-Call-Budget-Exceeded", "X-Profile-ID"],
 )
 
+logger = logging.getLogger("app.main")
+
+def _tracing_enabled() -> bool:
+    return settings.SERVER_TIMING_ENABLED or settings.REQUEST_CALL_BUDGET > 0 or logger.isEnabledFor(logging.DEBUG)
+
+def _trace_headers(scope, trace: RequestTrace, started_at: float, headers: MutableHeaders):
+    if settings.SERVER_TIMING_ENABLED:
+        headers["Server-Timing"] = trace.server_timing(time.perf_counter() - started_at)
+    calls = len(trace.calls)
+    if settings.REQUEST_CALL_BUDGET and calls > settings.REQUEST_CALL_BUDGET:
+        headers["X-Call-Budget-Exceeded"] = f"{calls}/{settings.REQUEST_CALL_BUDGET}"
+        logger.warning(
+            "%s %s made %d data-store calls (budget %d)",
+            scope["method"], scope["path"], calls, settings.REQUEST_CALL_BUDGET,
+            extra={"payload": trace.summary()}
+        )
+    elif calls:
+        logger.debug("%s %s made %d data-store calls", scope["method"], scope["path"], calls, extra={"payload": trace.summary()})
+
+async def _start_profile(scope, headers: Headers) -> Optional[RequestProfile]:
+    """Profile requests sent by an admin with ``X-Profile`` or picked by PROFILE_SAMPLE_RATE"""
+    trigger = None
+    if "x-profile" in headers:
+        if await get_admin_from_authorization(headers.get("authorization")):
+            trigger = "header"
+    elif settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE:
+        trigger = "sample"
+    if trigger is None or profile_store.busy:
+        return None
+    profile = RequestProfile(scope["method"], scope["path"], trigger)
+    profile_store.busy = True
+    profile.start()
+    return profile
+
+def _route_template(scope) -> str:
+    # Templates keep label cardinality bounded: /licenses/{license_id}, not every ID
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+class RequestContextMiddleware:
+    """Request ID, metrics, profiling and data-store tracing as one pure ASGI middleware.
+
+    Each ``@app.middleware("http")`` layer ran the rest of the app in a task of
+    its own and re-streamed the response; here the headers are added to the
+    response start message instead. Tracing and profiling are skipped unless
+    their settings (or the ``X-Profile`` header) ask for them.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        # Set first, so every log written while serving the request carries it
+        request_id = headers.get("x-request-id") or uuid.uuid4().hex
+        request_id_token = request_id_var.set(request_id)
+        started_at = time.perf_counter()
+        status_code = 500
+        trace = RequestTrace() if _tracing_enabled() else None
+        trace_token = request_trace_var.set(trace)
+        profile = None
+        try:
+            profile = await _start_profile(scope, headers)
+
+            async def send_with_headers(message):
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    response_headers = MutableHeaders(scope=message)
+                    if trace is not None:
+                        _trace_headers(scope, trace, started_at, response_headers)
+                    if profile is not None:
+                        response_headers["X-Profile-ID"] = profile.id
+                    response_headers["X-Request-ID"] = request_id
+                await send(message)
+
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            if profile is not None:
+                profile.stop(status_code)
+                profile_store.busy = False
+            request_trace_var.reset(trace_token)
+            route = _route_template(scope)
+            HTTP_REQUEST_DURATION.labels(scope["method"], route).observe(time.perf_counter() - started_at)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status_code)).inc()
+            request_id_var.reset(request_id_token)
+
+# Added after CORS, so it is the outermost middleware
+app.add_middleware(RequestContextMiddleware)
+
 app.include_router(license_router)
 app.include_router(user_router)
 app.include_router(auth_router)
+app.include_router(admin_router)
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Too many authentication requests, try again shortly"},
+        headers={"Retry-After": "1"}
+    )
+
+async def refresh_search_index():
+    """Build the search index, then rebuild it periodically to pick up other workers' writes"""
+    while True:
+        try:
+            await license_crud.rebuild_search_index()
+        except Exception:
+            logger.exception("Error building the search index")
+        if settings.SEARCH_INDEX_REFRESH_SECONDS <= 0:
+            return
+        await asyncio.sleep(settings.SEARCH_INDEX_REFRESH_SECONDS)
+
+async def rebalance_stock_shards():
+    """Periodically even out sharded stock and refresh the totals shown in listings"""
+    while settings.STOCK_REBALANCE_SECONDS > 0:
+        await asyncio.sleep(settings.STOCK_REBALANCE_SECONDS)
+        try:
+            await license_crud.rebalance_stock_shards()
+        except Exception:
+            logger.exception("Error rebalancing stock shards")
+
+background_tasks = set()
 
 @app.on_event("startup")
 async def startup_db_client():
+    # Again after a previous shutdown (e.g. a second TestClient lifespan)
+    configure_logging()
     dynamodb.connect_to_dynamodb()
     dynamodb.create_tables()
+    for job in (refresh_search_index, rebalance_stock_shards):
+        background_tasks.add(asyncio.create_task(job()))
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    # DynamoDB doesn't need explicit connection closing
-    pass
+    for task in background_tasks:
+        task.cancel()
+    # DynamoDB doesn't need explicit connection closing, only the worker threads
+    dynamodb_executor.shutdown()
+    password_hasher.shutdown()
+    s3_service.shutdown()
+    shutdown_logging()
 
 @app.get("/")
 def root():
     return {"message": "Welcome to LapsusINt Store Backend API"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "service": "LapsusINt Store Backend"} 
\ No newline at end of file
+    return {
+        "status": "healthy",
+        "service": "LapsusINt Store Backend",
+        "dynamodb": dynamodb_executor.stats(),
+        "license_cache": license_crud.cache_stats(),
+        "password_hasher": password_hasher.stats()
+    } 
\ No newline at end of file
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import Optional, Union
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Union
 from datetime import datetime
 
 class LicenseBase(BaseModel):
@@ -27,6 +27,8 @@ class LicenseInDBBase(LicenseBase):
     license_id: str
     create_at: Optional[Union[str, datetime]] = None
     update_at: Optional[Union[str, datetime]] = None
+    # Number of stock shards, for flash-sale licenses
+    stock_shards: Optional[int] = None
 
     class Config:
         from_attributes = True
@@ -34,4 +36,41 @@ class LicenseInDBBase(LicenseBase):
         extra = "ignore"
 
 class License(LicenseInDBBase):
-    pass 
\ No newline at end of file
+    pass
+
+class LicenseBatchGetRequest(BaseModel):
+    license_ids: List[str] = Field(..., min_length=1, max_length=500)
+
+class LicenseBatchGetResponse(BaseModel):
+    # Same order as the requested IDs, None where a license was not found
+    licenses: List[Optional[License]]
+    missing: List[str]
+
+class LicenseStockChange(BaseModel):
+    quantity: int = Field(1, ge=1)
+
+class CartItem(BaseModel):
+    license_id: str
+    quantity: int = Field(1, ge=1)
+
+class CartCheckoutRequest(BaseModel):
+    # A transaction touches at most 100 items
+    items: List[CartItem] = Field(..., min_length=1, max_length=100)
+
+class LicenseStockShardsRequest(BaseModel):
+    # The license and its shards are written in one transaction of at most 100 items
+    shards: int = Field(..., ge=2, le=99)
+
+class ImageUploadRequest(BaseModel):
+    content_type: str = Field(..., pattern="^image/(jpeg|png|webp|gif)$")
+    # Hex SHA-256 of the file: the upload is stored under it and S3 checks it
+    sha256: str = Field(..., pattern="^[0-9a-f]{64}$")
+
+class ImageUploadURL(BaseModel):
+    key: str
+    url: str
+    fields: Dict[str, str]
+    expires_in: int
+
+class ImageUploadComplete(BaseModel):
+    key: str
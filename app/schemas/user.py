@@ -11,16 +11,19 @@ class UserRole(str, Enum):
 class UserBase(BaseModel):
     username: str
     email: EmailStr
-    role: UserRole = UserRole.user
     is_active: Optional[bool] = True
 
 class UserCreate(UserBase):
+    # No role: a role sent on sign-up is ignored and the account is a plain user
     password: str
 
 class UserUpdate(UserBase):
     password: Optional[str] = None
+    # Only admins may change it
+    role: Optional[UserRole] = None
 
 class UserInDBBase(UserBase):
+    role: UserRole = UserRole.user
     user_id: str
     create_at: datetime
     update_at: datetime
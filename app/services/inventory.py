@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import random
+from typing import Dict, List, Optional
+from app.core.config import settings
+from app.core.cache import TTLCache
+from app.db.dynamodb import DynamoDB, is_conditional_check_failed, transaction_cancellation_reasons
+
+# A transaction touches at most 100 items. Sharding writes the license and all
+# of its shards in one, which caps the shards per license
+TRANSACT_MAX_ITEMS = 100
+MAX_STOCK_SHARDS = TRANSACT_MAX_ITEMS - 1
+
+logger = logging.getLogger(__name__)
+
+class InsufficientStockError(Exception):
+    """A reservation would have taken the stock of one or more licenses below zero"""
+
+    def __init__(self, shortages: Dict[str, Optional[int]]):
+        # license_id -> units available, None when the license does not exist
+        self.shortages = shortages
+        super().__init__(f"Insufficient stock for {', '.join(shortages)}")
+
+def split_evenly(total: int, shards: int) -> List[int]:
+    share, remainder = divmod(total, shards)
+    return [share + (1 if shard < remainder else 0) for shard in range(shards)]
+
+class ShardedInventory:
+    """Stock of flash-sale licenses split across shard items.
+
+    Every shard has its own partition key, so concurrent reservations of one
+    license are spread over ``shards`` partitions instead of throttling on one.
+    Summed totals are cached for ``STOCK_SHARD_TOTAL_TTL_SECONDS``: this worker's
+    own reservations drop them, those of other workers show up once they expire.
+    """
+
+    def __init__(self, db: DynamoDB):
+        self.table = db.table(settings.DYNAMODB_STOCK_SHARDS_TABLE)
+        self.totals = TTLCache(settings.LICENSE_CACHE_MAX_SIZE, settings.STOCK_SHARD_TOTAL_TTL_SECONDS)
+
+    @staticmethod
+    def shard_id(license_id: str, shard: int) -> str:
+        return f"{license_id}#{shard}"
+
+    def reserve_action(self, license_id: str, shard: int, quantity: int) -> dict:
+        """UpdateItem arguments taking ``quantity`` units from one shard if it holds them"""
+        return {
+            "Key": {"shard_id": self.shard_id(license_id, shard)},
+            "UpdateExpression": "ADD stock_quantity :delta",
+            "ConditionExpression": "attribute_exists(shard_id) AND stock_quantity >= :required",
+            "ExpressionAttributeValues": {":delta": -quantity, ":required": quantity}
+        }
+
+    def spread_actions(self, license_id: str, stocks: List[int], quantity: int) -> List[dict]:
+        """reserve_action of each shard needed to take ``quantity`` units from the
+        fullest shards, given the units ``stocks`` each shard holds"""
+        if sum(stocks) < quantity:
+            raise InsufficientStockError({license_id: sum(stocks)})
+        actions = []
+        remaining = quantity
+        for shard in sorted(range(len(stocks)), key=lambda shard: stocks[shard], reverse=True):
+            take = min(stocks[shard], remaining)
+            if take:
+                actions.append(self.reserve_action(license_id, shard, take))
+                remaining -= take
+            if not remaining:
+                break
+        return actions
+
+    def create_actions(self, license_id: str, shards: int, stock: int) -> List[dict]:
+        """UpdateItem arguments writing the shards of a license with ``stock`` split evenly between them"""
+        return [
+            {
+                "TableName": self.table.name,
+                "Key": {"shard_id": self.shard_id(license_id, shard)},
+                # "shard" is a reserved word
+                "UpdateExpression": "SET license_id = :license_id, #shard = :shard, stock_quantity = :stock",
+                "ExpressionAttributeNames": {"#shard": "shard"},
+                "ExpressionAttributeValues": {":license_id": license_id, ":shard": shard, ":stock": units}
+            }
+            for shard, units in enumerate(split_evenly(stock, shards))
+        ]
+
+    async def delete(self, license_id: str, shards: int):
+        await asyncio.gather(*(
+            self.table.delete_item(Key={"shard_id": self.shard_id(license_id, shard)}) for shard in range(shards)
+        ))
+
+    async def stocks(self, license_id: str, shards: int) -> List[int]:
+        """Units held by each shard, in shard order"""
+        keys = [{"shard_id": self.shard_id(license_id, shard)} for shard in range(shards)]
+        found = {}
+        while keys:
+            response = await self.table.batch_get_item(keys, ConsistentRead=True)
+            for item in response.get("Responses", {}).get(self.table.name, []):
+                found[item["shard_id"]] = int(item.get("stock_quantity", 0))
+            keys = response.get("UnprocessedKeys", {}).get(self.table.name, {}).get("Keys", [])
+        return [found.get(self.shard_id(license_id, shard), 0) for shard in range(shards)]
+
+    async def total(self, license_id: str, shards: int) -> int:
+        total = self.totals.get(license_id)
+        if total is None:
+            since = self.totals.version()
+            total = sum(await self.stocks(license_id, shards))
+            self.totals.set(license_id, total, since=since)
+        return total
+
+    async def reserve(self, license_id: str, shards: int, quantity: int):
+        """Take ``quantity`` units from a random shard, trying a few before falling back
+        to a transaction over the shards that still hold stock"""
+        self.totals.pop(license_id)
+        for shard in random.sample(range(shards), min(shards, settings.STOCK_SHARD_RESERVE_ATTEMPTS)):
+            try:
+                await self.table.update_item(**self.reserve_action(license_id, shard, quantity))
+                return
+            except Exception as e:
+                if not is_conditional_check_failed(e):
+                    raise
+
+        # No single shard tried holds enough: take it from the fullest ones at once
+        stocks = await self.stocks(license_id, shards)
+        try:
+            await self.table.transact_update(self.spread_actions(license_id, stocks, quantity))
+        except Exception as e:
+            if transaction_cancellation_reasons(e) is None:
+                raise
+            raise InsufficientStockError({license_id: sum(stocks)}) from None
+
+    async def release(self, license_id: str, shards: int, quantity: int):
+        self.totals.pop(license_id)
+        await self.table.update_item(
+            Key={"shard_id": self.shard_id(license_id, random.randrange(shards))},
+            UpdateExpression="ADD stock_quantity :delta",
+            ConditionExpression="attribute_exists(shard_id)",
+            ExpressionAttributeValues={":delta": quantity}
+        )
+
+    async def _rebalance_license(self, license_id: str, stocks: Dict[int, int]):
+        targets = split_evenly(sum(stocks.values()), max(stocks) + 1)
+        # Only shards that ran dry or nearly so are refilled; small imbalances are fine
+        if min(stocks.get(shard, 0) for shard in range(len(targets))) * 2 >= min(targets):
+            return
+        actions = []
+        for shard, target in enumerate(targets):
+            delta = target - stocks.get(shard, 0)
+            action = {
+                "Key": {"shard_id": self.shard_id(license_id, shard)},
+                "UpdateExpression": "ADD stock_quantity :delta",
+                "ExpressionAttributeValues": {":delta": delta}
+            }
+            if delta < 0:
+                # Donors must still hold what is moved away from them
+                action["ConditionExpression"] = "stock_quantity >= :required"
+                action["ExpressionAttributeValues"][":required"] = -delta
+            if delta:
+                actions.append(action)
+        try:
+            await self.table.transact_update(actions)
+        except Exception as e:
+            if transaction_cancellation_reasons(e) is None:
+                raise
+            # Reservations raced the move; the next round will try again
+            logger.info("Stock rebalance of license %s cancelled", license_id)
+
+    async def rebalance(self) -> Dict[str, int]:
+        """Even out the shards of every sharded license; returns the stock total of each"""
+        shard_stocks: Dict[str, Dict[int, int]] = {}
+        scan_kwargs = {}
+        while True:
+            response = await self.table.scan(ConsistentRead=True, **scan_kwargs)
+            for item in response.get("Items", []):
+                shard_stocks.setdefault(item["license_id"], {})[int(item["shard"])] = int(item.get("stock_quantity", 0))
+            if "LastEvaluatedKey" not in response:
+                break
+            scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        results = await asyncio.gather(*(
+            self._rebalance_license(license_id, stocks) for license_id, stocks in shard_stocks.items()
+        ), return_exceptions=True)
+        for license_id, result in zip(shard_stocks, results):
+            if isinstance(result, Exception):
+                logger.error("Error rebalancing stock of license %s: %s", license_id, result)
+        return {license_id: sum(stocks.values()) for license_id, stocks in shard_stocks.items()}
@@ -0,0 +1,52 @@
+import csv
+import io
+import logging
+from typing import AsyncIterator, List
+from pydantic import TypeAdapter, ValidationError
+from app.schemas.license import License
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FIELDS = list(License.model_fields)
+
+_license_adapter = TypeAdapter(License)
+
+def _valid_licenses(page: List[dict]) -> List[License]:
+    licenses = []
+    for item in page:
+        try:
+            licenses.append(_license_adapter.validate_python(item))
+        except ValidationError as e:
+            logger.warning("Skipping invalid license %s in export: %s", item.get("license_id"), e.error_count())
+    return licenses
+
+def _ndjson_page(licenses: List[License]) -> bytes:
+    return b"".join(_license_adapter.dump_json(license) + b"\n" for license in licenses)
+
+def _csv_page(licenses: List[License], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, lineterminator="\n")
+    if header:
+        writer.writeheader()
+    for license in licenses:
+        writer.writerow(license.model_dump(mode="json"))
+    return buffer.getvalue().encode()
+
+async def export_licenses(crud, fmt: str = "ndjson") -> AsyncIterator[bytes]:
+    """Stream the whole license catalog as NDJSON or CSV, one chunk per scanned page.
+
+    The table is read by a parallel segmented scan; memory stays bounded by
+    ``LICENSE_EXPORT_BUFFERED_PAGES`` whatever the size of the catalog.
+    """
+    if fmt == "csv":
+        # Header goes out even when the table is empty
+        yield _csv_page([], header=True)
+    async for page in crud.iter_all(
+        segments=settings.LICENSE_EXPORT_SEGMENTS,
+        max_buffered_pages=settings.LICENSE_EXPORT_BUFFERED_PAGES
+    ):
+        licenses = _valid_licenses(page)
+        if not licenses:
+            continue
+        yield _csv_page(licenses, header=False) if fmt == "csv" else _ndjson_page(licenses)
@@ -0,0 +1,161 @@
+import asyncio
+import csv
+import json
+from typing import AsyncIterator, List, Optional, Tuple, Union
+from pydantic import ValidationError
+from app.crud.license import BatchWriteError
+from app.schemas.license import LicenseCreate
+from app.core.config import settings
+
+def _decode_line(line: bytes, max_line_bytes: int) -> Union[str, ValueError]:
+    if len(line) > max_line_bytes:
+        return ValueError(f"Line longer than {max_line_bytes} bytes")
+    try:
+        return line.decode("utf-8-sig").rstrip("\r")
+    except UnicodeDecodeError as e:
+        return ValueError(f"Invalid UTF-8 at byte {e.start}")
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_line_bytes: Optional[int] = None) -> AsyncIterator[Union[str, ValueError]]:
+    """Split a stream of byte chunks into decoded lines without buffering the body.
+
+    Lines that are not UTF-8 or longer than ``max_line_bytes`` come out as a
+    ValueError in their place; the rest of an overlong line is dropped as it arrives.
+    """
+    max_line_bytes = max_line_bytes or settings.LICENSE_IMPORT_MAX_LINE_BYTES
+    buffer = b""
+    overlong = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if overlong:
+                # End of the line already reported as too long
+                overlong = False
+                continue
+            yield _decode_line(line, max_line_bytes)
+        if len(buffer) > max_line_bytes:
+            if not overlong:
+                yield ValueError(f"Line longer than {max_line_bytes} bytes")
+                overlong = True
+            buffer = b""
+    if buffer and not overlong:
+        yield _decode_line(buffer, max_line_bytes)
+
+async def iter_ndjson_rows(lines: AsyncIterator[Union[str, ValueError]]) -> AsyncIterator[Tuple[int, object]]:
+    row_number = 0
+    async for line in lines:
+        if isinstance(line, ValueError):
+            row_number += 1
+            yield row_number, line
+            continue
+        if not line.strip():
+            continue
+        row_number += 1
+        try:
+            yield row_number, json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f"Invalid JSON: {e}")
+
+async def iter_csv_rows(lines: AsyncIterator[Union[str, ValueError]]) -> AsyncIterator[Tuple[int, object]]:
+    header = None
+    pending = ""
+    row_number = 0
+    async for line in lines:
+        if isinstance(line, ValueError):
+            pending = ""
+            row_number += 1
+            yield row_number, line
+            continue
+        # Quoted fields may span lines: wait until the quotes are balanced
+        pending = f"{pending}\n{line}" if pending else line
+        if pending.count('"') % 2:
+            # An unbalanced quote must not buffer the rest of the body
+            if len(pending) > settings.LICENSE_IMPORT_MAX_LINE_BYTES:
+                pending = ""
+                row_number += 1
+                yield row_number, ValueError(f"Quoted field longer than {settings.LICENSE_IMPORT_MAX_LINE_BYTES} bytes")
+            continue
+        record, pending = pending, ""
+        if not record.strip():
+            continue
+        values = next(csv.reader([record]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        row_number += 1
+        if len(values) != len(header):
+            yield row_number, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        # Empty cells fall back to the schema defaults
+        yield row_number, {name: value for name, value in zip(header, values) if value != ""}
+    if pending:
+        yield row_number + 1, ValueError("Unterminated quoted field")
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc']) or 'row'}: {err['msg']}"
+        for err in error.errors()
+    )
+
+async def import_licenses(chunks: AsyncIterator[bytes], fmt: str, crud) -> dict:
+    """Validate and write a streamed NDJSON/CSV catalog, returning a per-row report.
+
+    At most ``LICENSE_IMPORT_WRITERS`` chunks of ``LICENSE_IMPORT_CHUNK_SIZE`` rows
+    are held in memory at any time.
+    """
+    rows = iter_csv_rows(iter_lines(chunks)) if fmt == "csv" else iter_ndjson_rows(iter_lines(chunks))
+    report = {"imported": 0, "failed": 0, "errors": [], "errors_truncated": False}
+    writers = asyncio.Semaphore(settings.LICENSE_IMPORT_WRITERS)
+    tasks = set()
+
+    def add_error(row_number: int, message: str):
+        report["failed"] += 1
+        if len(report["errors"]) < settings.LICENSE_IMPORT_MAX_ERRORS:
+            report["errors"].append({"row": row_number, "error": message})
+        else:
+            report["errors_truncated"] = True
+
+    async def write(batch: List[Tuple[int, LicenseCreate]]):
+        try:
+            await crud.create_many([license_in for _, license_in in batch])
+            report["imported"] += len(batch)
+        except BatchWriteError as e:
+            # Rows already written count as imported, so a retry of the failed ones does not duplicate them
+            report["imported"] += len(batch) - len(e.unwritten)
+            for position in e.unwritten:
+                add_error(batch[position][0], f"Write failed: {e.cause}")
+        except Exception as e:
+            for row_number, _ in batch:
+                add_error(row_number, f"Write failed: {e}")
+        finally:
+            writers.release()
+
+    async def flush(batch):
+        # Blocks the reader while every writer is busy, which bounds memory
+        await writers.acquire()
+        task = asyncio.create_task(write(batch))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    batch = []
+    async for row_number, row in rows:
+        if isinstance(row, Exception):
+            add_error(row_number, str(row))
+            continue
+        if not isinstance(row, dict):
+            add_error(row_number, "Row must be an object")
+            continue
+        try:
+            batch.append((row_number, LicenseCreate(**row)))
+        except ValidationError as e:
+            add_error(row_number, _validation_message(e))
+            continue
+        if len(batch) >= settings.LICENSE_IMPORT_CHUNK_SIZE:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+    if tasks:
+        await asyncio.gather(*tasks)
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
@@ -1,8 +1,110 @@
+import asyncio
+import base64
+import contextvars
+import hashlib
+import re
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import NoCredentialsError, ClientError
+from concurrent.futures import ThreadPoolExecutor
 from app.core.config import settings
+from app.core.metrics import instrument_s3_client
 import uuid
 
+# Image types accepted for license images and the extension stored with them
+IMAGE_CONTENT_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+
+# images/<sha256>.<ext>: where uploads are stored, through the API or presigned
+CONTENT_KEY_PATTERN = re.compile(r"images/(?P<sha256>[0-9a-f]{64})\.(?P<extension>jpg|png|webp|gif)")
+
+# Content-addressed objects never change, so clients and CDNs may cache them forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+def sniff_image_type(head: bytes):
+    """Image content type from the first bytes of a file, None if not a known image"""
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+def _hash_image(stream):
+    """``images/<sha256>.<ext>`` key of a stream read to its end, and its sniffed type.
+
+    Raises InvalidImage when the content is not a known image type.
+    """
+    head = stream.read(16)
+    content_type = sniff_image_type(head)
+    if content_type is None:
+        raise InvalidImage("Uploaded file is not a JPEG, PNG, WebP or GIF image")
+    digest = hashlib.sha256(head)
+    for chunk in iter(lambda: stream.read(_HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    return f"images/{digest.hexdigest()}.{IMAGE_CONTENT_TYPES[content_type]}", content_type
+
+class ImageTooLarge(Exception):
+    """The uploaded image exceeds ``S3_MAX_IMAGE_BYTES``"""
+
+class InvalidImage(Exception):
+    """The uploaded content is not one of ``IMAGE_CONTENT_TYPES``, whatever type it was declared with"""
+
+class _LimitedReader:
+    """Read-through wrapper that fails once more than ``limit`` bytes were read.
+
+    Used for streams that cannot be measured up front; the upload is aborted
+    as soon as the limit is crossed. ``head`` holds bytes already read from
+    the stream (to sniff its type), served again before the rest.
+    """
+
+    def __init__(self, file_obj, limit: int):
+        self._file = file_obj
+        self._limit = limit
+        self.bytes_read = 0
+        self.head = b""
+
+    def peek_head(self, size: int) -> bytes:
+        self.head = self._file.read(size)
+        return self.head
+
+    def read(self, size: int = -1) -> bytes:
+        if self.head:
+            if size is None or size < 0:
+                chunk, self.head = self.head + self._file.read(), b""
+            else:
+                chunk, self.head = self.head[:size], self.head[size:]
+                if len(chunk) < size:
+                    chunk += self._file.read(size - len(chunk))
+        else:
+            chunk = self._file.read(size)
+        self.bytes_read += len(chunk)
+        if self.bytes_read > self._limit:
+            raise ImageTooLarge(f"Image larger than {self._limit} bytes")
+        return chunk
+
+def _size_limited(file_obj, limit: int):
+    """``file_obj`` itself when its size can be checked up front, else a counting reader"""
+    seekable = getattr(file_obj, "seekable", None)
+    if seekable is None or not seekable():
+        return _LimitedReader(file_obj, limit)
+    position = file_obj.tell()
+    size = file_obj.seek(0, 2) - position
+    file_obj.seek(position)
+    if size > limit:
+        raise ImageTooLarge(f"Image larger than {limit} bytes")
+    return file_obj
+
 class S3Service:
     def __init__(self):
         aws_region = getattr(settings, 'AWS_REGION', 'us-east-1')
@@ -16,7 +118,27 @@ class S3Service:
             region_name=aws_region,
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
+            # Enough connections for every part of every concurrent upload
+            config=Config(
+                max_pool_connections=settings.S3_MAX_CONCURRENT_UPLOADS * settings.S3_TRANSFER_MAX_CONCURRENCY
+            ),
+        )
+        instrument_s3_client(self.s3_client)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.S3_TRANSFER_MAX_CONCURRENCY,
+            use_threads=True,
         )
+        self._executor = None
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.S3_MAX_CONCURRENT_UPLOADS,
+                thread_name_prefix="s3-upload"
+            )
+        return self._executor
 
     def upload_image(self, file_obj, filename: str = None, content_type: str = None) -> str:
         """
@@ -26,21 +148,135 @@ class S3Service:
         :param content_type: tipo de contenido opcional
         :return: URL pública de la imagen subida
         """
-        if not filename:
-            filename = f"images/{uuid.uuid4()}.jpg"
+        file_obj = _size_limited(file_obj, settings.S3_MAX_IMAGE_BYTES)
+        extra_args = {'ACL': 'public-read'}
         try:
-            extra_args = {'ACL': 'public-read'}
+            if not filename:
+                # El tipo sale del contenido, nunca del declarado por el cliente:
+                # nada que no sea una imagen se publica en el bucket
+                if isinstance(file_obj, _LimitedReader):
+                    content_type = sniff_image_type(file_obj.peek_head(16))
+                    if content_type is None:
+                        raise InvalidImage("Uploaded file is not a JPEG, PNG, WebP or GIF image")
+                    # Sin poder leerlo dos veces no hay hash: nombre único como antes
+                    filename = f"images/{uuid.uuid4()}.{IMAGE_CONTENT_TYPES[content_type]}"
+                else:
+                    filename, content_type = self._content_key(file_obj)
+                    extra_args['CacheControl'] = IMMUTABLE_CACHE_CONTROL
+                    # Mismo contenido, misma clave: si ya existe no se vuelve a subir
+                    if self.head_image(filename) is not None:
+                        return self.public_url(filename)
             if content_type:
                 extra_args['ContentType'] = content_type
+            # Partes en paralelo por encima de S3_MULTIPART_THRESHOLD; el spool de
+            # UploadFile se sube tal cual, sin copiarlo a memoria
             self.s3_client.upload_fileobj(
                 file_obj,
                 self.bucket_name,
                 filename,
-                ExtraArgs=extra_args
+                ExtraArgs=extra_args,
+                Config=self.transfer_config
             )
-            url = f"https://{self.bucket_name}.s3.amazonaws.com/{filename}"
-            return url
+            return self.public_url(filename)
         except (NoCredentialsError, ClientError) as e:
             raise Exception(f"Error al subir la imagen a S3: {e}")
 
-s3_service = S3Service() 
\ No newline at end of file
+    def _content_key(self, file_obj):
+        """``images/<sha256>.<ext>`` key and sniffed content type of a seekable file"""
+        position = file_obj.tell()
+        try:
+            return _hash_image(file_obj)
+        finally:
+            file_obj.seek(position)
+
+    def public_url(self, key: str) -> str:
+        return f"https://{self.bucket_name}.s3.amazonaws.com/{key}"
+
+    def key_from_url(self, url: str) -> str:
+        return url[len(self.public_url("")):]
+
+    def presign_image_upload(self, content_type: str, sha256: str) -> dict:
+        """Presigned POST letting a client upload one image straight to S3.
+
+        The client sends the SHA-256 of the file, so the key is the same
+        content-hash key an upload through the API would get. The policy pins
+        the key, the content type, the size range and the checksum, which S3
+        verifies against the uploaded bytes: the client cannot upload
+        anything else with it.
+        """
+        key = f"images/{sha256}.{IMAGE_CONTENT_TYPES[content_type]}"
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        fields = {
+            "acl": "public-read",
+            "Content-Type": content_type,
+            "Cache-Control": IMMUTABLE_CACHE_CONTROL,
+            "x-amz-checksum-sha256": checksum,
+        }
+        post = self.s3_client.generate_presigned_post(
+            Bucket=self.bucket_name,
+            Key=key,
+            Fields=fields,
+            Conditions=[{name: value} for name, value in fields.items()] + [
+                ["content-length-range", 1, settings.S3_MAX_IMAGE_BYTES],
+            ],
+            ExpiresIn=settings.S3_PRESIGNED_EXPIRES_SECONDS
+        )
+        return {"key": key, "url": post["url"], "fields": post["fields"], "expires_in": settings.S3_PRESIGNED_EXPIRES_SECONDS}
+
+    def check_upload(self, key: str):
+        """Metadata of a presigned upload once it is known to be the image its key names.
+
+        Only the object's metadata and first bytes are read, never the whole
+        image. Returns None if there is no such object and raises InvalidImage
+        (after deleting the object) when it is not a valid image.
+        """
+        match = CONTENT_KEY_PATTERN.fullmatch(key)
+        if match is None:
+            raise InvalidImage("Invalid upload key")
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket_name, Key=key, ChecksumMode="ENABLED")
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        content_type = head.get("ContentType")
+        checksum = head.get("ChecksumSHA256")
+        expected = base64.b64encode(bytes.fromhex(match.group("sha256"))).decode()
+        first_bytes = self.s3_client.get_object(Bucket=self.bucket_name, Key=key, Range="bytes=0-15")["Body"].read()
+        valid = (
+            IMAGE_CONTENT_TYPES.get(content_type) == match.group("extension")
+            and sniff_image_type(first_bytes) == content_type
+            and head.get("ContentLength", 0) <= settings.S3_MAX_IMAGE_BYTES
+            # Multipart uploads through the API carry a checksum of checksums ("...-N")
+            and (checksum is None or "-" in checksum or checksum == expected)
+        )
+        if not valid:
+            self.s3_client.delete_object(Bucket=self.bucket_name, Key=key)
+            raise InvalidImage("Uploaded object is not a valid image")
+        return head
+
+    def head_image(self, key: str):
+        """Metadata of an uploaded object, or None if it does not exist"""
+        try:
+            return self.s3_client.head_object(Bucket=self.bucket_name, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    async def run(self, fn, *args):
+        """Run a blocking S3 call on the upload pool, keeping the event loop free"""
+        loop = asyncio.get_running_loop()
+        # The copied context carries the request trace into the S3 call events
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._get_executor(), context.run, fn, *args)
+
+    async def upload_image_async(self, file_obj, filename: str = None, content_type: str = None) -> str:
+        return await self.run(self.upload_image, file_obj, filename, content_type)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+s3_service = S3Service()
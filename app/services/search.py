@@ -0,0 +1,131 @@
+import math
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+# Fields searched and how much a token found in each one counts
+SEARCH_FIELDS = {
+    "product_name": 3,
+    "supported_launchers": 2,
+    "supported_platforms": 1,
+    "description": 1,
+}
+# Score factor for query terms that only match as a prefix
+PREFIX_MATCH_WEIGHT = 0.7
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase, accent-free alphanumeric tokens"""
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode()
+    return _TOKEN_RE.findall(text.lower())
+
+class LicenseSearchIndex:
+    """In-memory inverted index over active licenses, ranked with BM25.
+
+    Every query term also matches indexed tokens it is a prefix of, so partial
+    words typed by customers ("cyber", "battle") still find results.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self):
+        self.ready = False
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._vocabulary: List[str] = []
+        self._doc_lengths: Dict[str, int] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._docs: Dict[str, dict] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def get(self, license_id: str):
+        return self._docs.get(license_id)
+
+    def add(self, item: dict):
+        """Index or re-index a license; inactive licenses are dropped from the index"""
+        license_id = item["license_id"]
+        self.remove(license_id)
+        if not item.get("is_active", True):
+            return
+        terms = Counter()
+        for field, weight in SEARCH_FIELDS.items():
+            for token in tokenize(item.get(field)):
+                terms[token] += weight
+        length = sum(terms.values())
+        for token, frequency in terms.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                insort(self._vocabulary, token)
+            postings[license_id] = frequency
+        self._doc_terms[license_id] = terms
+        self._doc_lengths[license_id] = length
+        self._docs[license_id] = item
+        self._total_length += length
+
+    def remove(self, license_id: str):
+        terms = self._doc_terms.pop(license_id, None)
+        if terms is None:
+            return
+        for token in terms:
+            postings = self._postings[token]
+            postings.pop(license_id, None)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+        self._total_length -= self._doc_lengths.pop(license_id)
+        self._docs.pop(license_id, None)
+
+    def build(self, items: Iterable[dict]):
+        """Replace the whole index with ``items``"""
+        index = LicenseSearchIndex()
+        for item in items:
+            index.add(item)
+        self.replace_with(index)
+
+    def replace_with(self, other: "LicenseSearchIndex"):
+        """Atomically take over the contents of an index built separately"""
+        self.__dict__.update(other.__dict__)
+        self.ready = True
+
+    def _expand(self, term: str) -> List[Tuple[str, float]]:
+        matches = []
+        position = bisect_left(self._vocabulary, term)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(term):
+            token = self._vocabulary[position]
+            matches.append((token, 1.0 if token == term else PREFIX_MATCH_WEIGHT))
+            position += 1
+        return matches
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[dict, float]]:
+        """Licenses matching ``query`` with their scores, best first"""
+        doc_count = len(self._docs)
+        if not doc_count:
+            return []
+        average_length = self._total_length / doc_count
+        scores: Dict[str, float] = {}
+        for term in dict.fromkeys(tokenize(query)):
+            # A document scores once per query term, on its best matching token
+            term_scores: Dict[str, float] = {}
+            for token, weight in self._expand(term):
+                postings = self._postings[token]
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for license_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[license_id] / average_length)
+                    score = weight * idf * frequency * (self.k1 + 1) / (frequency + norm)
+                    if score > term_scores.get(license_id, 0.0):
+                        term_scores[license_id] = score
+            for license_id, score in term_scores.items():
+                scores[license_id] = scores.get(license_id, 0.0) + score
+        ranked = sorted(scores.items(), key=lambda entry: entry[1], reverse=True)[:limit]
+        return [(self._docs[license_id], score) for license_id, score in ranked]
+
+search_index = LicenseSearchIndex()
@@ -0,0 +1,64 @@
+import io
+import logging
+import posixpath
+from typing import Dict, List
+from app.core.config import settings
+from app.services.s3_service import s3_service, IMMUTABLE_CACHE_CONTROL
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional: without it no thumbnails are generated
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+def thumbnail_widths() -> List[int]:
+    return [int(width) for width in settings.S3_THUMBNAIL_WIDTHS.split(",") if width.strip()]
+
+def thumbnail_key(key: str, width: int) -> str:
+    """``images/<hash>.png`` -> ``images/<hash>/w320.webp``"""
+    return f"{posixpath.splitext(key)[0]}/w{width}.webp"
+
+def thumbnail_urls(key: str) -> Dict[int, str]:
+    """Public URLs the thumbnails of ``key`` are (or will shortly be) served from"""
+    if Image is None:
+        return {}
+    return {width: s3_service.public_url(thumbnail_key(key, width)) for width in thumbnail_widths()}
+
+def render_thumbnails(data: bytes, widths: List[int]) -> Dict[int, bytes]:
+    """WebP variants of an image, never wider than the original"""
+    variants = {}
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for width in widths:
+            variant = image.copy()
+            variant.thumbnail((width, width * 4))
+            buffer = io.BytesIO()
+            variant.save(buffer, "WEBP", quality=settings.S3_THUMBNAIL_QUALITY)
+            variants[width] = buffer.getvalue()
+    return variants
+
+def _generate(key: str):
+    widths = thumbnail_widths()
+    # Keys are content hashes: an existing variant means the work is already done
+    if s3_service.head_image(thumbnail_key(key, widths[-1])) is not None:
+        return
+    data = s3_service.s3_client.get_object(Bucket=s3_service.bucket_name, Key=key)["Body"].read()
+    for width, body in render_thumbnails(data, widths).items():
+        s3_service.s3_client.put_object(
+            Bucket=s3_service.bucket_name,
+            Key=thumbnail_key(key, width),
+            Body=body,
+            ACL="public-read",
+            ContentType="image/webp",
+            CacheControl=IMMUTABLE_CACHE_CONTROL
+        )
+
+async def generate_thumbnails(key: str):
+    """Background stage writing the WebP thumbnail variants of an uploaded image"""
+    if Image is None or not thumbnail_widths():
+        return
+    try:
+        await s3_service.run(_generate, key)
+    except Exception:
+        logger.exception("Error generating thumbnails for %s", key)
@@ -0,0 +1,96 @@
+"""Scenarios and the concurrent load driver"""
+
+import asyncio
+import os
+import random
+import struct
+import time
+import zlib
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.stack import ADMIN_PASSWORD, ADMIN_USERNAME
+
+class Context:
+    """State the scenarios share: seeded IDs, an admin token and a seeded RNG"""
+
+    def __init__(self, license_ids: List[str], rng: random.Random):
+        self.license_ids = license_ids
+        self.rng = rng
+        self.headers: Dict[str, str] = {}
+
+    def license_id(self) -> str:
+        return self.rng.choice(self.license_ids)
+
+def png_bytes(rng: random.Random, size: int = 64) -> bytes:
+    """A small random RGB PNG; random pixels keep content-hash dedup from skipping the upload"""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\x00" + rng.randbytes(size * 3) for _ in range(size))
+    header = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+async def login(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.post("/auth/login", data={"username": ADMIN_USERNAME, "password": ADMIN_PASSWORD})
+
+async def list_licenses(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get("/licenses/", params={"limit": 20}, headers=ctx.headers)
+
+async def read_license(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    return await client.get(f"/licenses/{ctx.license_id()}", headers=ctx.headers)
+
+async def update_license(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    # LicenseUpdate requires the name and price; unset fields are left untouched
+    license_id = ctx.license_id()
+    body = {"product_name": f"Benchmark License {license_id[:8]}", "price": round(ctx.rng.uniform(1, 100), 2)}
+    return await client.put(f"/licenses/{license_id}", json=body, headers=ctx.headers)
+
+async def upload_image(client: httpx.AsyncClient, ctx: Context) -> httpx.Response:
+    files = {"file": ("benchmark.png", png_bytes(ctx.rng), "image/png")}
+    return await client.post("/licenses/upload-image", files=files, headers=ctx.headers)
+
+Scenario = Callable[[httpx.AsyncClient, Context], Awaitable[httpx.Response]]
+
+SCENARIOS: Dict[str, Scenario] = {
+    "auth_login": login,
+    "license_list": list_licenses,
+    "license_read": read_license,
+    "license_update": update_license,
+    "image_upload": upload_image,
+}
+
+async def authenticate(client: httpx.AsyncClient, ctx: Context):
+    response = await login(client, ctx)
+    response.raise_for_status()
+    ctx.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+async def run_scenario(
+    client: httpx.AsyncClient, ctx: Context, scenario: Scenario, requests: int, concurrency: int
+) -> Tuple[List[float], List[int], float]:
+    """Send ``requests`` calls from ``concurrency`` workers.
+
+    Returns per-request latencies in seconds, status codes (0 for transport
+    errors) and the wall time of the whole run.
+    """
+    latencies: List[float] = []
+    statuses: List[int] = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            started_at = time.perf_counter()
+            try:
+                status = (await scenario(client, ctx)).status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies.append(time.perf_counter() - started_at)
+            statuses.append(status)
+
+    started_at = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started_at
+
+def client_for(base_url: str, concurrency: int) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(base_url=base_url, limits=limits, timeout=float(os.getenv("BENCHMARK_TIMEOUT", 30)))
@@ -0,0 +1,16 @@
+"""The API on the in-memory storage backend, seeded at startup from BENCHMARK_ITEMS and BENCHMARK_SEED.
+
+Each worker seeds its own copy; the seed makes the license IDs identical everywhere.
+"""
+
+import os
+from app.core.config import settings
+from app.db.backends import memory_store
+from app.main import app
+from benchmarks.stack import admin_item, license_items
+
+@app.on_event("startup")
+async def seed_memory_store():
+    items = license_items(int(os.environ["BENCHMARK_ITEMS"]), int(os.environ["BENCHMARK_SEED"]))
+    await memory_store.table(settings.DYNAMODB_TABLE).batch_write(items)
+    await memory_store.table("Users").put_item(Item=admin_item())
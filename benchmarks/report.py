@@ -0,0 +1,56 @@
+"""Latency summaries and the comparison against a stored baseline"""
+
+import math
+from collections import Counter
+from typing import Dict, List
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def summarize(latencies: List[float], statuses: List[int], wall_seconds: float) -> dict:
+    ok = sorted(latency for latency, status in zip(latencies, statuses) if 200 <= status < 300)
+    return {
+        "requests": len(statuses),
+        "errors": len(statuses) - len(ok),
+        "requests_per_second": round(len(ok) / wall_seconds, 2) if wall_seconds else 0.0,
+        "p50_ms": round(percentile(ok, 50) * 1000, 2),
+        "p95_ms": round(percentile(ok, 95) * 1000, 2),
+        "p99_ms": round(percentile(ok, 99) * 1000, 2),
+        "mean_ms": round(sum(ok) / len(ok) * 1000, 2) if ok else 0.0,
+        "max_ms": round(ok[-1] * 1000, 2) if ok else 0.0,
+        # Status code of each failed request, 0 for transport errors
+        "error_statuses": dict(Counter(str(status) for status in statuses if not 200 <= status < 300)),
+    }
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Regressions of ``results`` against ``baseline``, as readable lines.
+
+    Latency percentiles may grow and throughput may drop by ``tolerance``
+    (a fraction) before counting as a regression; any new error does.
+    """
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            if base[key] and current[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {current[key]} > baseline {base[key]}")
+        if current["requests_per_second"] < base["requests_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: requests_per_second {current['requests_per_second']} < baseline {base['requests_per_second']}"
+            )
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {current['errors']} > baseline {base['errors']}")
+    return regressions
+
+def format_table(results: Dict[str, dict]) -> str:
+    columns = ("requests", "errors", "requests_per_second", "p50_ms", "p95_ms", "p99_ms")
+    rows = [("scenario",) + columns]
+    rows += [(name,) + tuple(str(summary[column]) for column in columns) for name, summary in results.items()]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark the API against a local DynamoDB/S3 stand-in.
+
+    python -m benchmarks.run --items 1000 --requests 500 --concurrency 32 \\
+        --output results.json --baseline benchmarks/baseline.json
+
+Exits with status 1 when a scenario regressed against the baseline.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+from contextlib import ExitStack
+from datetime import datetime, timezone
+
+from benchmarks.load import SCENARIOS, Context, authenticate, client_for, run_scenario
+from benchmarks.report import compare, format_table, summarize
+from benchmarks.stack import ROOT, api_server, create_bucket, license_items, moto_server, seed, stack_env
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=1000, help="licenses to seed")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per scenario")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma separated, from: " + ", ".join(SCENARIOS))
+    parser.add_argument("--storage", choices=("dynamodb", "memory"), default="dynamodb",
+                        help="STORAGE_BACKEND of the API; memory keeps the tables in the API process")
+    parser.add_argument("--endpoint-url", help="existing DynamoDB endpoint (e.g. DynamoDB Local); a moto server is started otherwise")
+    parser.add_argument("--s3-endpoint-url", help="S3 endpoint when --endpoint-url does not serve S3")
+    parser.add_argument("--seed", type=int, default=42, help="RNG seed for data and request mix")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown before failing")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results to --baseline instead of comparing")
+    return parser.parse_args(argv)
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+async def run_all(base_url: str, ctx: Context, names, args) -> dict:
+    results = {}
+    async with client_for(base_url, args.concurrency) as client:
+        await authenticate(client, ctx)
+        for name in names:
+            scenario = SCENARIOS[name]
+            await run_scenario(client, ctx, scenario, args.warmup, args.concurrency)
+            latencies, statuses, wall = await run_scenario(client, ctx, scenario, args.requests, args.concurrency)
+            results[name] = summarize(latencies, statuses, wall)
+            print(f"{name}: done", file=sys.stderr)
+    return results
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+
+    with ExitStack() as stack:
+        # The memory backend still needs the stand-in for S3
+        endpoint_url = args.endpoint_url or stack.enter_context(moto_server())
+        env = stack_env(endpoint_url, args.s3_endpoint_url)
+        create_bucket(env)
+        if args.storage == "memory":
+            env.update(STORAGE_BACKEND="memory", BENCHMARK_ITEMS=str(args.items), BENCHMARK_SEED=str(args.seed))
+            license_ids = [item["license_id"] for item in license_items(args.items, args.seed)]
+            app = "benchmarks.memory_app:app"
+        else:
+            print(f"Seeding {args.items} licenses into {endpoint_url}", file=sys.stderr)
+            license_ids = seed(env, args.items, args.seed)
+            app = "app.main:app"
+        base_url = stack.enter_context(api_server(env, args.workers, app))
+        # The request mix has its own RNG, independent of the seeded data
+        ctx = Context(license_ids, random.Random(args.seed + 1))
+        results = asyncio.run(run_all(base_url, ctx, names, args))
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "storage": args.storage,
+            "stand_in": "external" if args.endpoint_url else "moto",
+            "items": args.items,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+        },
+        "scenarios": results,
+    }
+    print(format_table(results), file=sys.stderr)
+
+    payload = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+
+    if not args.baseline:
+        return 0
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(payload + "\n")
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    # Numbers are only comparable when the load shape matches
+    for key in ("items", "requests", "concurrency", "workers", "storage", "stand_in"):
+        if baseline["meta"].get(key) != report["meta"][key]:
+            print(f"Warning: {key} differs from the baseline ({baseline['meta'].get(key)} vs {report['meta'][key]})", file=sys.stderr)
+    regressions = compare(results, baseline["scenarios"], args.tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Local stack the benchmarks run against: a DynamoDB/S3 stand-in plus the API itself"""
+
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from decimal import Decimal
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CATEGORIES = ["Gaming", "Sports", "FPS", "Action-Adventure", "Software"]
+ADMIN_USERNAME = "bench-admin"
+ADMIN_PASSWORD = "bench-admin-password"
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def wait_until_up(url: str, process: subprocess.Popen = None, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode}")
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up in {timeout} seconds")
+
+def stack_env(endpoint_url: str, s3_endpoint_url: str = None) -> dict:
+    """Environment shared by the seeding code and the API process"""
+    return {
+        **os.environ,
+        "ENV": "development",
+        "PYTHONPATH": ROOT,
+        "DYNAMODB_ENDPOINT_URL": endpoint_url,
+        "AWS_ENDPOINT_URL_S3": s3_endpoint_url or endpoint_url,
+        "DYNAMODB_REGION": os.getenv("DYNAMODB_REGION", "us-east-1"),
+        "AWS_REGION": os.getenv("AWS_REGION", "us-east-1"),
+        "AWS_ACCESS_KEY_ID": os.getenv("AWS_ACCESS_KEY_ID", "dummy"),
+        "AWS_SECRET_ACCESS_KEY": os.getenv("AWS_SECRET_ACCESS_KEY", "dummy"),
+        "AWS_S3_BUCKET": os.getenv("AWS_S3_BUCKET", "benchmark-bucket"),
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+
+@contextmanager
+def moto_server():
+    """moto server in a subprocess on a free port, yields its endpoint URL"""
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "moto.server", "-H", "127.0.0.1", "-p", str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(url, process)
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+@contextmanager
+def api_server(env: dict, workers: int = 1, app: str = "app.main:app"):
+    """The API under uvicorn, yields its base URL"""
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", app,
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+        ],
+        cwd=ROOT,
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(f"{url}/health", process, timeout=60)
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+def license_items(items: int, seed: int) -> list:
+    """The seeded licenses; the same seed gives the same IDs in every process"""
+    rng = random.Random(seed)
+    now = datetime.utcnow().isoformat()
+    return [
+        {
+            "license_id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "product_name": f"Benchmark License {n}",
+            "description": f"Seeded license {n} for the benchmark suite",
+            "price": Decimal(str(round(rng.uniform(1, 100), 2))),
+            "supported_platforms": "Windows",
+            "supported_launchers": "Steam",
+            "recommendations": "",
+            "product_version": "1.0",
+            "has_spoofer": False,
+            "language": "English",
+            "stock_quantity": 1000,
+            "is_active": True,
+            "listing_status": "active",
+            "image_url": "https://example.com/benchmark.png",
+            "category": rng.choice(CATEGORIES),
+            "create_at": now,
+            "update_at": now,
+        }
+        for n in range(items)
+    ]
+
+def admin_item() -> dict:
+    from app.core.security import get_password_hash
+    now = datetime.utcnow().isoformat()
+    return {
+        "user_id": str(uuid.uuid4()),
+        "username": ADMIN_USERNAME,
+        "email": "bench-admin@example.com",
+        "hashed_password": get_password_hash(ADMIN_PASSWORD),
+        "role": "admin",
+        "is_active": True,
+        "create_at": now,
+        "update_at": now,
+    }
+
+def create_bucket(env: dict):
+    import boto3
+    boto3.client(
+        "s3",
+        region_name=env["AWS_REGION"],
+        endpoint_url=env["AWS_ENDPOINT_URL_S3"],
+        aws_access_key_id=env["AWS_ACCESS_KEY_ID"],
+        aws_secret_access_key=env["AWS_SECRET_ACCESS_KEY"],
+    ).create_bucket(Bucket=env["AWS_S3_BUCKET"])
+
+def seed(env: dict, items: int, seed: int) -> list:
+    """Create the tables, write ``items`` licenses and the admin account to DynamoDB.
+
+    Returns the seeded license IDs.
+    """
+    os.environ.update(env)
+    # Settings are read at import time, so the app is only imported once the env is set
+    from app.db.dynamodb import DynamoDB
+    from app.core.config import settings
+
+    db = DynamoDB()
+    db.connect_to_dynamodb()
+    db.create_tables()
+    licenses = license_items(items, seed)
+    with db.resource.Table(settings.DYNAMODB_TABLE).batch_writer() as batch:
+        for item in licenses:
+            batch.put_item(Item=item)
+    db.resource.Table("Users").put_item(Item=admin_item())
+    return [item["license_id"] for item in licenses]
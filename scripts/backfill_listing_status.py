@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Backfill listing_status on licenses written before the price indexes existed,
+so sorted listings (active-price-index) include them. Safe to run more than once.
+
+    python scripts/backfill_listing_status.py
+"""
+
+import asyncio
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def main():
+    """Scan the licenses table and fix the listing attributes of old licenses"""
+    from dotenv import load_dotenv
+
+    # Load environment variables before the app reads its settings
+    load_dotenv()
+    from app.db.dynamodb import dynamodb
+    from app.db.executor import dynamodb_executor
+    from app.crud.license import license_crud
+
+    print("🚀 Backfilling listing_status...")
+    try:
+        dynamodb.connect_to_dynamodb()
+        updated = asyncio.run(license_crud.backfill_listing_status())
+        print(f"🎉 Updated {updated} licenses")
+    except Exception as e:
+        print(f"❌ Error during backfill: {e}")
+        sys.exit(1)
+    finally:
+        dynamodb_executor.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,13 @@
 Script to populate DynamoDB with test data for LapsusINt Store Backend
 """
 
-import boto3
 import uuid
 from datetime import datetime
 from app.core.security import get_password_hash
 from app.models.user import UserRole
+from app.db.dynamodb import (
+    DynamoDB, LICENSE_ATTRIBUTE_DEFINITIONS, LICENSE_INDEXES, STOCK_SHARDS_KEY_SCHEMA, STOCK_SHARDS_ATTRIBUTE_DEFINITIONS
+)
 import os
 from decimal import Decimal
 
@@ -130,25 +132,10 @@ USERS_DATA = [
 ]
 
 def connect_to_dynamodb():
-    """Connect to DynamoDB (local or AWS)"""
-    # Check if we're in development mode
-    if os.getenv("ENV") == "development" and os.getenv("DYNAMODB_ENDPOINT_URL"):
-        # Local DynamoDB
-        dynamodb = boto3.resource(
-            'dynamodb',
-            region_name=os.getenv("DYNAMODB_REGION", "us-east-1"),
-            endpoint_url=os.getenv("DYNAMODB_ENDPOINT_URL"),
-            aws_access_key_id='dummy',
-            aws_secret_access_key='dummy'
-        )
-    else:
-        # AWS DynamoDB
-        dynamodb = boto3.resource(
-            'dynamodb',
-            region_name=os.getenv("DYNAMODB_REGION", "us-east-1")
-        )
-    
-    return dynamodb
+    """Connect to DynamoDB (local or AWS) through the app's shared connection manager"""
+    db = DynamoDB()
+    db.connect_to_dynamodb()
+    return db.resource
 
 def create_licenses_table(dynamodb):
     table_name = os.getenv("DYNAMODB_TABLE", "Licenses")
@@ -160,9 +147,27 @@ def create_licenses_table(dynamodb):
             KeySchema=[
                 {'AttributeName': 'license_id', 'KeyType': 'HASH'}
             ],
-            AttributeDefinitions=[
-                {'AttributeName': 'license_id', 'AttributeType': 'S'}
-            ],
+            AttributeDefinitions=LICENSE_ATTRIBUTE_DEFINITIONS,
+            GlobalSecondaryIndexes=LICENSE_INDEXES,
+            ProvisionedThroughput={
+                'ReadCapacityUnits': 5,
+                'WriteCapacityUnits': 5
+            }
+        )
+        table.wait_until_exists()
+        print(f"✅ Table {table_name} created.")
+    else:
+        print(f"ℹ️  Table {table_name} already exists.")
+
+def create_stock_shards_table(dynamodb):
+    table_name = os.getenv("DYNAMODB_STOCK_SHARDS_TABLE", "LicenseStockShards")
+    existing_tables = dynamodb.meta.client.list_tables()["TableNames"]
+    if table_name not in existing_tables:
+        print(f"🛠️  Creating table: {table_name}")
+        table = dynamodb.create_table(
+            TableName=table_name,
+            KeySchema=STOCK_SHARDS_KEY_SCHEMA,
+            AttributeDefinitions=STOCK_SHARDS_ATTRIBUTE_DEFINITIONS,
             ProvisionedThroughput={
                 'ReadCapacityUnits': 5,
                 'WriteCapacityUnits': 5
@@ -252,6 +257,9 @@ def seed_licenses(dynamodb):
             "create_at": datetime.utcnow().isoformat(),
             "update_at": datetime.utcnow().isoformat()
         }
+        if license_data["is_active"]:
+            # Lists the license in the sparse active-price-index
+            item["listing_status"] = "active"
         
         try:
             table.put_item(Item=item)
@@ -300,6 +308,7 @@ def main():
         
         # Create tables if they don't exist
         create_licenses_table(dynamodb)
+        create_stock_shards_table(dynamodb)
         create_users_table(dynamodb)
         
         # Seed data
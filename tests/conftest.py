@@ -2,6 +2,11 @@ import os
 import pytest
 import boto3
 from time import sleep
+from app.core.config import settings
+from app.db.dynamodb import (
+    LICENSE_ATTRIBUTE_DEFINITIONS, LICENSE_INDEXES, STOCK_SHARDS_KEY_SCHEMA, STOCK_SHARDS_ATTRIBUTE_DEFINITIONS,
+    dynamodb as app_dynamodb
+)
 
 def wait_for_table(dynamodb, table_name, timeout=10):
     table = dynamodb.Table(table_name)
@@ -14,6 +19,12 @@ def wait_for_table(dynamodb, table_name, timeout=10):
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_dynamodb_tables():
+    if settings.STORAGE_BACKEND == "memory":
+        # Process-local tables: no DynamoDB Local needed
+        app_dynamodb.create_tables()
+        yield
+        return
+
     # Connect to local DynamoDB
     dynamodb = boto3.resource(
         'dynamodb',
@@ -30,9 +41,8 @@ def setup_dynamodb_tables():
             KeySchema=[
                 {'AttributeName': 'license_id', 'KeyType': 'HASH'}
             ],
-            AttributeDefinitions=[
-                {'AttributeName': 'license_id', 'AttributeType': 'S'}
-            ],
+            AttributeDefinitions=LICENSE_ATTRIBUTE_DEFINITIONS,
+            GlobalSecondaryIndexes=LICENSE_INDEXES,
             ProvisionedThroughput={
                 'ReadCapacityUnits': 5,
                 'WriteCapacityUnits': 5
@@ -46,6 +56,26 @@ def setup_dynamodb_tables():
             print(f"Error creating Licenses table: {e}")
     wait_for_table(dynamodb, os.getenv("DYNAMODB_TABLE", "Licenses"))
 
+    # Create stock shards table
+    shards_table = os.getenv("DYNAMODB_STOCK_SHARDS_TABLE", "LicenseStockShards")
+    try:
+        dynamodb.create_table(
+            TableName=shards_table,
+            KeySchema=STOCK_SHARDS_KEY_SCHEMA,
+            AttributeDefinitions=STOCK_SHARDS_ATTRIBUTE_DEFINITIONS,
+            ProvisionedThroughput={
+                'ReadCapacityUnits': 5,
+                'WriteCapacityUnits': 5
+            }
+        )
+        print(f"Created table: {shards_table}")
+    except Exception as e:
+        if "Table already exists" in str(e):
+            print(f"Table {shards_table} already exists.")
+        else:
+            print(f"Error creating {shards_table} table: {e}")
+    wait_for_table(dynamodb, shards_table)
+
     # Create Users table
     try:
         dynamodb.create_table(
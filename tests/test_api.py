@@ -1,7 +1,12 @@
+import base64
+import csv
+import io
+import json
 import os
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+from app.core.config import settings
 
 client = TestClient(app)
 
@@ -46,8 +51,630 @@ def test_get_users():
     assert response.status_code == 200
     assert isinstance(response.json(), list)
 
+def register_and_login(username: str, password: str = "pytestpass") -> dict:
+    client.post("/auth/register", json={"username": username, "email": f"{username}@example.com", "password": password})
+    response = client.post("/auth/login", data={"username": username, "password": password})
+    assert response.status_code == 200
+    return response.json()
+
+# Test tokens are revoked by a password change
+def test_token_revoked_after_password_change():
+    login = register_and_login("pytestrevoke")
+    user, headers = login["user"], {"Authorization": f"Bearer {login['access_token']}"}
+    # Authenticated (404 for the unknown license) rather than 401
+    assert client.post("/licenses/does-not-exist/reserve", headers=headers).status_code == 404
+
+    user_data = {"username": user["username"], "email": user["email"]}
+    response = client.put(f"/users/{user['user_id']}", json={**user_data, "password": "pytestnewpass"}, headers=headers)
+    assert response.status_code == 200
+    assert client.post("/licenses/does-not-exist/reserve", headers=headers).status_code == 401
+
+    new_login = client.post("/auth/login", data={"username": user["username"], "password": "pytestnewpass"}).json()
+    new_headers = {"Authorization": f"Bearer {new_login['access_token']}"}
+    assert client.post("/licenses/does-not-exist/reserve", headers=new_headers).status_code == 404
+    client.put(f"/users/{user['user_id']}", json={**user_data, "password": "pytestpass"}, headers=new_headers)
+    assert client.post("/licenses/does-not-exist/reserve", headers=new_headers).status_code == 401
+
+# Test role changes apply to tokens already issued
+def test_role_change_takes_effect(monkeypatch):
+    from app.crud.user import user_crud
+    login = register_and_login("pytestpromote")
+    user, headers = login["user"], {"Authorization": f"Bearer {login['access_token']}"}
+    user_data = {"username": user["username"], "email": user["email"]}
+    admin_headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    assert client.get("/admin/profiles", headers=headers).status_code == 403
+
+    assert client.put(f"/users/{user['user_id']}", json={**user_data, "role": "admin"}, headers=admin_headers).status_code == 200
+    assert client.get("/admin/profiles", headers=headers).status_code == 200
+    assert client.put(f"/users/{user['user_id']}", json={**user_data, "role": "user"}, headers=admin_headers).status_code == 200
+    assert client.get("/admin/profiles", headers=headers).status_code == 403
+
+    # A cached principal older than the token's version is read again (updated through another worker)
+    stale = user_crud.principal_cache.get(user["user_id"])
+    assert client.put(f"/users/{user['user_id']}", json={**user_data, "role": "admin"}, headers=admin_headers).status_code == 200
+    user_crud.principal_cache.set(user["user_id"], stale)
+    new_token = client.post("/auth/login", data={"username": user["username"], "password": "pytestpass"}).json()["access_token"]
+    assert client.get("/admin/profiles", headers={"Authorization": f"Bearer {new_token}"}).status_code == 200
+
+    # Within AUTH_TRUST_TOKEN_CLAIMS_SECONDS the signed claims are used without reading the user
+    monkeypatch.setattr(settings, "AUTH_TRUST_TOKEN_CLAIMS_SECONDS", 60)
+    assert client.put(f"/users/{user['user_id']}", json={**user_data, "role": "user"}, headers=admin_headers).status_code == 200
+    response = client.get("/admin/profiles", headers={"Authorization": f"Bearer {new_token}"})
+    assert response.status_code == 200
+    assert "calls" not in response.headers["server-timing"]
+    monkeypatch.setattr(settings, "AUTH_TRUST_TOKEN_CLAIMS_SECONDS", 0)
+    assert client.get("/admin/profiles", headers={"Authorization": f"Bearer {new_token}"}).status_code == 403
+
 # Test get licenses (public)
 def test_get_licenses():
     response = client.get("/licenses/")
     assert response.status_code == 200
-    assert isinstance(response.json(), list) 
\ No newline at end of file
+    assert isinstance(response.json(), list) 
+# Test cursor pagination on licenses (public)
+def test_get_licenses_cursor_pagination():
+    for i in range(3):
+        response = client.post("/licenses/", json={"product_name": f"Cursor Test {i}", "price": 1.5})
+        assert response.status_code == 200
+
+    seen = []
+    response = client.get("/licenses/", params={"limit": 1})
+    assert response.status_code == 200
+    while "x-next-cursor" in response.headers:
+        page = response.json()
+        assert len(page) <= 1
+        seen.extend(license["license_id"] for license in page)
+        response = client.get("/licenses/", params={"limit": 1, "cursor": response.headers["x-next-cursor"]})
+        assert response.status_code == 200
+    seen.extend(license["license_id"] for license in response.json())
+    assert len(seen) == len(set(seen))
+    assert len(seen) >= 3
+
+def test_get_licenses_invalid_cursor():
+    response = client.get("/licenses/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+# Test batch license fetch keeps request order and reports misses
+def test_batch_get_licenses():
+    ids = []
+    for i in range(2):
+        response = client.post("/licenses/", json={"product_name": f"Batch Test {i}", "price": 2.5})
+        assert response.status_code == 200
+        ids.append(response.json()["license_id"])
+
+    requested = [ids[1], "does-not-exist", ids[0]]
+    response = client.post("/licenses/batch-get", json={"license_ids": requested})
+    assert response.status_code == 200
+    data = response.json()
+    assert [license and license["license_id"] for license in data["licenses"]] == [ids[1], None, ids[0]]
+    assert data["missing"] == ["does-not-exist"]
+
+def get_admin_token():
+    import asyncio
+    from app.crud.user import user_crud
+    from app.models.user import UserRole
+    from app.schemas.user import UserCreate
+    # Admins cannot sign up through the API: the account is created directly
+    if asyncio.run(user_crud.get_by_username("pytestadmin")) is None:
+        user_in = UserCreate(username="pytestadmin", email="pytestadmin@example.com", password="pytestadminpass")
+        asyncio.run(user_crud.create(user_in, role=UserRole.admin))
+    response = client.post("/auth/login", data={"username": "pytestadmin", "password": "pytestadminpass"})
+    assert response.status_code == 200
+    return response.json()["access_token"]
+
+# Test roles cannot be granted by the users themselves
+def test_role_escalation_rejected():
+    response = client.post("/auth/register", json={
+        "username": "pytestevil", "email": "pytestevil@example.com", "password": "pytestpass", "role": "admin"
+    })
+    assert response.status_code in (200, 400)  # 400 if already exists
+    login = register_and_login("pytestevil")
+    assert login["user"]["role"] == "user"
+    user, headers = login["user"], {"Authorization": f"Bearer {login['access_token']}"}
+    assert client.get("/admin/profiles", headers=headers).status_code == 403
+    assert client.get("/licenses/export", headers=headers).status_code == 403
+
+    user_data = {"username": user["username"], "email": user["email"], "role": "admin"}
+    assert client.put(f"/users/{user['user_id']}", json=user_data).status_code in (401, 403)
+    assert client.put(f"/users/{user['user_id']}", json=user_data, headers=headers).status_code == 403
+    other = register_and_login("pytestvictim")["user"]
+    response = client.put(f"/users/{other['user_id']}", json={"username": "pytestvictim", "email": other["email"]}, headers=headers)
+    assert response.status_code == 403
+    assert client.get("/admin/profiles", headers=headers).status_code == 403
+
+# Test bulk license import (admin only)
+def test_import_licenses_ndjson():
+    headers = {"Authorization": f"Bearer {get_admin_token()}", "Content-Type": "application/x-ndjson"}
+    body = "\n".join([
+        '{"product_name": "Import Test A", "price": 10}',
+        '{"product_name": "Import Test B"}',
+        'not json',
+        '{"product_name": "Import Test C", "price": "12.5", "category": "Gaming"}',
+    ])
+    response = client.post("/licenses/import", content=body, headers=headers)
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 2
+    assert report["failed"] == 2
+    assert [error["row"] for error in report["errors"]] == [2, 3]
+
+def test_import_licenses_csv():
+    headers = {"Authorization": f"Bearer {get_admin_token()}", "Content-Type": "text/csv"}
+    body = 'product_name,price,description\nImport CSV A,5,"multi\nline"\nImport CSV B,,\n'
+    response = client.post("/licenses/import", content=body, headers=headers)
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 1
+    assert report["errors"][0]["row"] == 2
+
+def test_import_licenses_bad_lines(monkeypatch):
+    monkeypatch.setattr(settings, "LICENSE_IMPORT_MAX_LINE_BYTES", 100)
+    headers = {"Authorization": f"Bearer {get_admin_token()}", "Content-Type": "application/x-ndjson"}
+    body = b"\n".join([
+        b'{"product_name": "Import Bad Bytes \xff", "price": 1}',
+        b'{"product_name": "' + b"x" * 200 + b'", "price": 1}',
+        b'{"product_name": "Import After Bad Lines", "price": 1}',
+    ])
+    response = client.post("/licenses/import", content=body, headers=headers)
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] == 1
+    assert [error["row"] for error in report["errors"]] == [1, 2]
+
+    # An unbalanced quote is cut off instead of buffering the rest of the body
+    headers["Content-Type"] = "text/csv"
+    body = 'product_name,price\n"Import Open Quote,1\n' + "more,1\n" * 50
+    report = client.post("/licenses/import", content=body, headers=headers).json()
+    assert report["errors"][0]["error"].startswith("Quoted field longer than")
+
+def test_import_licenses_partial_batch_failure(monkeypatch):
+    from app.crud.license import license_crud
+    monkeypatch.setattr(settings, "DYNAMODB_BATCH_MAX_RETRIES", 1)
+    monkeypatch.setattr(settings, "DYNAMODB_BATCH_BACKOFF_SECONDS", 0)
+    batch_write_item = license_crud.table.batch_write_item
+
+    async def throttled(items, **kwargs):
+        # One license is throttled every time, the rest of the batch is written
+        stuck = [item for item in items if item["product_name"] == "Import Throttled"]
+        if len(stuck) < len(items):
+            await batch_write_item([item for item in items if item not in stuck], **kwargs)
+        return {"UnprocessedItems": {license_crud.table.name: [{"PutRequest": {"Item": item}} for item in stuck]}}
+
+    monkeypatch.setattr(license_crud.table, "batch_write_item", throttled)
+    headers = {"Authorization": f"Bearer {get_admin_token()}", "Content-Type": "application/x-ndjson"}
+    body = "\n".join([
+        '{"product_name": "Import Written A", "price": 1}',
+        '{"product_name": "Import Throttled", "price": 1}',
+        '{"product_name": "Import Written B", "price": 1}',
+    ])
+    report = client.post("/licenses/import", content=body, headers=headers).json()
+    # Only the row left unwritten is reported, so re-importing it does not duplicate the others
+    assert report["imported"] == 2
+    assert report["failed"] == 1
+    assert [error["row"] for error in report["errors"]] == [2]
+    assert report["errors"][0]["error"].startswith("Write failed: 1 licenses left unprocessed")
+
+def test_import_licenses_requires_admin():
+    token = test_register_and_login()
+    response = client.post("/licenses/import", content="", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+# Test updates return the written license and 404 on unknown IDs
+def test_update_license():
+    response = client.post("/licenses/", json={"product_name": "Update Test", "price": 3})
+    license_id = response.json()["license_id"]
+    response = client.put(f"/licenses/{license_id}", json={"product_name": "Update Test", "price": 4.5, "stock_quantity": 7})
+    assert response.status_code == 200
+    assert response.json()["price"] == 4.5
+    assert response.json()["stock_quantity"] == 7
+
+    response = client.put("/licenses/does-not-exist", json={"product_name": "Ghost", "price": 1})
+    assert response.status_code == 404
+    response = client.get("/licenses/does-not-exist")
+    assert response.status_code == 404
+
+def test_update_user_not_found():
+    user_data = {"username": "ghostuser", "email": "ghostuser@example.com"}
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    response = client.put("/users/does-not-exist", json=user_data, headers=headers)
+    assert response.status_code == 404
+
+def test_update_user_uniqueness_checks(monkeypatch):
+    test_register_and_login()
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    user_data = {"username": "pytestrename", "email": "pytestrename@example.com", "password": "secret"}
+    response = client.post("/users/", json=user_data)
+    if response.status_code == 400:
+        # Left over from an earlier run against the same tables
+        response = client.post("/auth/login", data={"username": "pytestrename", "password": "secret"})
+        user_id = response.json()["user"]["user_id"]
+    else:
+        user_id = response.json()["user_id"]
+
+    # Same username and email: no uniqueness lookups, just the conditional write
+    response = client.put(f"/users/{user_id}", json={"username": "pytestrename", "email": "pytestrename@example.com", "role": "dev"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["role"] == "dev"
+    assert 'desc="1 calls"' in response.headers["server-timing"]
+
+    response = client.put(f"/users/{user_id}", json={"username": "pytestrename", "email": "pytestuser@example.com"}, headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email already registered"
+    response = client.put(f"/users/{user_id}", json={"username": "pytestuser", "email": "pytestrename@example.com"}, headers=headers)
+    assert response.json()["detail"] == "Username already taken"
+
+    response = client.put(f"/users/{user_id}", json={"username": "pytestrename", "email": "pytestrename2@example.com"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["email"] == "pytestrename2@example.com"
+    client.put(f"/users/{user_id}", json={"username": "pytestrename", "email": "pytestrename@example.com"}, headers=headers)
+
+    # A new email and password together still hash the password once, despite the retry
+    from app.core import security
+    hashed = []
+    get_password_hash = security.get_password_hash
+    monkeypatch.setattr(security, "get_password_hash", lambda password: hashed.append(password) or get_password_hash(password))
+    user_data = {"username": "pytestrename", "email": "pytestrename3@example.com", "password": "secret"}
+    response = client.put(f"/users/{user_id}", json=user_data, headers=headers)
+    assert response.status_code == 200
+    assert hashed == ["secret"]
+    client.put(f"/users/{user_id}", json={"username": "pytestrename", "email": "pytestrename@example.com"}, headers=headers)
+
+# Test category and price filtering through the secondary indexes
+def test_filter_licenses_by_category_and_price():
+    category = "Pytest Category"
+    for price in (30, 10, 20):
+        response = client.post("/licenses/", json={"product_name": f"Filter Test {price}", "price": price, "category": category})
+        assert response.status_code == 200
+    response = client.post("/licenses/", json={"product_name": "Filter Test inactive", "price": 15, "category": category, "is_active": False})
+    assert response.status_code == 200
+
+    response = client.get("/licenses/", params={"category": category, "sort": "price"})
+    assert response.status_code == 200
+    assert [license["price"] for license in response.json()] == [10, 20, 30]
+
+    response = client.get("/licenses/", params={"category": category, "min_price": 15, "max_price": 30, "sort": "-price"})
+    assert [license["price"] for license in response.json()] == [30, 20]
+
+    response = client.get("/licenses/", params={"min_price": 19.5, "max_price": 20.5})
+    assert response.status_code == 200
+    assert all(19.5 <= license["price"] <= 20.5 and license["is_active"] for license in response.json())
+
+    # Cursors only resume the listing they were issued for
+    response = client.get("/licenses/", params={"category": category, "sort": "price", "limit": 1})
+    query_cursor = response.headers["x-next-cursor"]
+    response = client.get("/licenses/", params={"category": category, "sort": "price", "limit": 1, "cursor": query_cursor})
+    assert response.json()[0]["price"] == 20
+    assert client.get("/licenses/", params={"cursor": query_cursor}).status_code == 400
+    assert client.get("/licenses/", params={"category": category, "sort": "-price", "cursor": query_cursor}).status_code == 400
+    scan_cursor = client.get("/licenses/", params={"limit": 1}).headers["x-next-cursor"]
+    assert client.get("/licenses/", params={"category": category, "cursor": scan_cursor}).status_code == 400
+
+    response = client.get("/licenses/", params={"min_price": 30, "max_price": 10})
+    assert response.status_code == 400
+
+    # An empty category is stored as no category rather than an invalid index key
+    response = client.post("/licenses/", json={"product_name": "Filter Test no category", "price": 5, "category": ""})
+    assert response.status_code == 200
+    assert response.json()["category"] is None
+    response = client.put(f"/licenses/{response.json()['license_id']}", json={"product_name": "Filter Test no category", "price": 6, "category": ""})
+    assert response.status_code == 200
+    assert response.json()["category"] is None
+
+# Test the backfill of licenses stored before the price indexes
+def test_backfill_listing_status():
+    import asyncio
+    from app.crud.license import license_crud
+    item = {"license_id": "pytest-legacy-license", "product_name": "Legacy", "price": 777, "is_active": True, "update_at": "2024-01-01T00:00:00"}
+    asyncio.run(license_crud.table.put_item(Item=item))
+    params = {"min_price": 777, "max_price": 777}
+    assert client.get("/licenses/", params=params).json() == []
+
+    assert asyncio.run(license_crud.backfill_listing_status()) >= 1
+    assert [license["license_id"] for license in client.get("/licenses/", params=params).json()] == [item["license_id"]]
+    assert asyncio.run(license_crud.backfill_listing_status()) == 0
+    client.delete(f"/licenses/{item['license_id']}")
+
+# Test full-text search over the license catalog
+def test_search_licenses():
+    response = client.post("/licenses/", json={
+        "product_name": "Pytest Quasarquest Deluxe",
+        "description": "Search test license",
+        "price": 9.99,
+        "supported_launchers": "Zyxlauncher"
+    })
+    assert response.status_code == 200
+    license_id = response.json()["license_id"]
+
+    response = client.get("/licenses/search", params={"q": "quasarq"})
+    assert response.status_code == 200
+    assert license_id in [license["license_id"] for license in response.json()]
+
+    response = client.get("/licenses/search", params={"q": "zyxlauncher deluxe"})
+    assert response.json()[0]["license_id"] == license_id
+
+    client.delete(f"/licenses/{license_id}")
+    response = client.get("/licenses/search", params={"q": "quasarquest"})
+    assert license_id not in [license["license_id"] for license in response.json()]
+
+# Test conditional GETs with ETags
+def test_license_etag_not_modified():
+    response = client.post("/licenses/", json={"product_name": "ETag Test", "price": 5})
+    license_id = response.json()["license_id"]
+
+    response = client.get(f"/licenses/{license_id}")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert "cache-control" in response.headers
+
+    response = client.get(f"/licenses/{license_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    client.put(f"/licenses/{license_id}", json={"product_name": "ETag Test", "price": 6})
+    response = client.get(f"/licenses/{license_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+def test_license_list_etag_not_modified():
+    response = client.get("/licenses/", params={"limit": 5})
+    etag = response.headers["etag"]
+    assert "Accept-Encoding" in response.headers["vary"]
+    response = client.get("/licenses/", params={"limit": 5}, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    # A shared cache must not hand a compressed body to a client that did not ask for it
+    assert "Accept-Encoding" in response.headers["vary"]
+
+# Test compressed list responses
+def test_list_licenses_compression(monkeypatch):
+    monkeypatch.setattr(settings, "RESPONSE_COMPRESSION_MIN_SIZE", 1)
+    client.post("/licenses/", json={"product_name": "Compressed Test", "price": 9.5})
+
+    response = client.get("/licenses/", params={"limit": 20}, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"].startswith("W/")
+    assert all(isinstance(license["price"], float) for license in response.json())
+
+    response = client.get("/licenses/", params={"limit": 20}, headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert isinstance(response.json(), list)
+
+# Test streaming catalog export
+def test_export_licenses():
+    client.post("/licenses/", json={"product_name": "Export Test", "price": 11})
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+
+    response = client.get("/licenses/export", headers=headers)
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert any(row["product_name"] == "Export Test" for row in rows)
+
+    response = client.get("/licenses/export", params={"format": "csv"}, headers=headers)
+    assert response.status_code == 200
+    records = list(csv.reader(io.StringIO(response.text)))
+    assert records[0][0] == "product_name"
+    assert len(records) == len(rows) + 1
+
+    token = test_register_and_login()
+    response = client.get("/licenses/export", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 403
+
+# Test atomic stock reservations
+def test_reserve_and_release_license():
+    headers = {"Authorization": f"Bearer {test_register_and_login()}"}
+    response = client.post("/licenses/", json={"product_name": "Stock Test", "price": 2, "stock_quantity": 3})
+    license_id = response.json()["license_id"]
+
+    response = client.post(f"/licenses/{license_id}/reserve", json={"quantity": 2}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["stock_quantity"] == 1
+
+    response = client.post(f"/licenses/{license_id}/reserve", json={"quantity": 2}, headers=headers)
+    assert response.status_code == 409
+    assert response.json()["detail"]["shortages"] == [{"license_id": license_id, "available": 1}]
+
+    # Only admins give stock back
+    response = client.post(f"/licenses/{license_id}/release", json={"quantity": 2}, headers=headers)
+    assert response.status_code == 403
+    admin_headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    response = client.post(f"/licenses/{license_id}/release", json={"quantity": 2}, headers=admin_headers)
+    assert response.json()["stock_quantity"] == 3
+
+    response = client.post("/licenses/does-not-exist/reserve", headers=headers)
+    assert response.status_code == 404
+
+def test_checkout_cart():
+    headers = {"Authorization": f"Bearer {test_register_and_login()}"}
+    first = client.post("/licenses/", json={"product_name": "Cart A", "price": 2, "stock_quantity": 2}).json()["license_id"]
+    second = client.post("/licenses/", json={"product_name": "Cart B", "price": 2, "stock_quantity": 1}).json()["license_id"]
+
+    cart = {"items": [{"license_id": first, "quantity": 1}, {"license_id": second}, {"license_id": first}]}
+    response = client.post("/licenses/checkout", json=cart, headers=headers)
+    assert response.status_code == 200
+    assert {line["license_id"]: line["quantity"] for line in response.json()["reserved"]} == {first: 2, second: 1}
+
+    # Nothing is taken when one line cannot be served
+    response = client.post("/licenses/", json={"product_name": "Cart C", "price": 2, "stock_quantity": 5})
+    third = response.json()["license_id"]
+    cart = {"items": [{"license_id": third, "quantity": 1}, {"license_id": second}]}
+    response = client.post("/licenses/checkout", json=cart, headers=headers)
+    assert response.status_code == 409
+    assert response.json()["detail"]["shortages"] == [{"license_id": second, "available": 0}]
+    assert client.get(f"/licenses/{third}").json()["stock_quantity"] == 5
+
+# Test sharded stock for flash-sale licenses
+def test_sharded_stock():
+    admin_headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    headers = {"Authorization": f"Bearer {test_register_and_login()}"}
+    response = client.post("/licenses/", json={"product_name": "Flash Sale", "price": 1, "stock_quantity": 10})
+    license_id = response.json()["license_id"]
+
+    # Its stock lives in the shards from now on: a PUT cannot overwrite it
+    response = client.put(f"/licenses/{license_id}", json={"product_name": "Flash Sale", "price": 1, "stock_quantity": 50})
+    assert response.status_code == 200
+    assert response.json()["stock_quantity"] == 50
+    response = client.put(f"/licenses/{license_id}", json={"product_name": "Flash Sale", "price": 1, "stock_quantity": 10})
+    assert response.status_code == 200
+
+    # The license and its shards must fit in one transaction
+    response = client.post(f"/licenses/{license_id}/stock-shards", json={"shards": 100}, headers=admin_headers)
+    assert response.status_code == 422
+    response = client.post(f"/licenses/{license_id}/stock-shards", json={"shards": 4}, headers=admin_headers)
+    assert response.status_code == 200
+    assert response.json()["stock_shards"] == 4
+    response = client.post(f"/licenses/{license_id}/stock-shards", json={"shards": 4}, headers=admin_headers)
+    assert response.status_code == 409
+    response = client.put(f"/licenses/{license_id}", json={"product_name": "Flash Sale", "price": 1, "stock_quantity": 50})
+    assert response.status_code == 409
+    response = client.put(f"/licenses/{license_id}", json={"product_name": "Flash Sale Renamed", "price": 1})
+    assert response.status_code == 200
+    assert response.json()["stock_quantity"] == 10
+
+    # Any single shard holds 2 or 3 units, so 4 units need the multi-shard fallback
+    response = client.post(f"/licenses/{license_id}/reserve", json={"quantity": 4}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["stock_quantity"] == 6
+    response = client.post(f"/licenses/{license_id}/reserve", json={"quantity": 1}, headers=headers)
+    assert response.json()["stock_quantity"] == 5
+    response = client.post(f"/licenses/{license_id}/reserve", json={"quantity": 6}, headers=headers)
+    assert response.status_code == 409
+    assert response.json()["detail"]["shortages"] == [{"license_id": license_id, "available": 5}]
+
+    response = client.post("/licenses/checkout", json={"items": [{"license_id": license_id}]}, headers=headers)
+    assert response.status_code == 200
+    # Shard writes leave update_at alone, yet the ETag follows the stock
+    response = client.get(f"/licenses/{license_id}")
+    etag = response.headers["etag"]
+    assert client.get(f"/licenses/{license_id}", headers={"If-None-Match": etag}).status_code == 304
+    response = client.post(f"/licenses/{license_id}/release", json={"quantity": 2}, headers=admin_headers)
+    assert response.json()["stock_quantity"] == 6
+    response = client.get(f"/licenses/{license_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["stock_quantity"] == 6
+
+    # Stock changed by another worker shows once the cached total expires
+    import asyncio
+    from app.crud.license import license_crud
+    inventory = license_crud.inventory
+    asyncio.run(inventory.table.update_item(
+        Key={"shard_id": inventory.shard_id(license_id, 0)},
+        UpdateExpression="ADD stock_quantity :delta",
+        ExpressionAttributeValues={":delta": 1}
+    ))
+    assert client.get(f"/licenses/{license_id}").json()["stock_quantity"] == 6
+    inventory.totals.clear()
+    assert client.get(f"/licenses/{license_id}").json()["stock_quantity"] == 7
+
+# Test checkout lines of sharded licenses spread over several shards
+def test_checkout_sharded_stock():
+    admin_headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    headers = {"Authorization": f"Bearer {test_register_and_login()}"}
+    response = client.post("/licenses/", json={"product_name": "Flash Cart", "price": 1, "stock_quantity": 9})
+    license_id = response.json()["license_id"]
+    response = client.post(f"/licenses/{license_id}/stock-shards", json={"shards": 4}, headers=admin_headers)
+    assert response.status_code == 200
+
+    # No shard holds more than 3 of the 9 units
+    response = client.post("/licenses/checkout", json={"items": [{"license_id": license_id, "quantity": 4}]}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["reserved"] == [{"license_id": license_id, "quantity": 4}]
+    response = client.post("/licenses/checkout", json={"items": [{"license_id": license_id, "quantity": 5}]}, headers=headers)
+    assert response.status_code == 200
+    response = client.post("/licenses/checkout", json={"items": [{"license_id": license_id}]}, headers=headers)
+    assert response.status_code == 409
+    assert response.json()["detail"]["shortages"] == [{"license_id": license_id, "available": 0}]
+
+# Test oversized image uploads are rejected before reaching S3
+def test_upload_image_too_large(monkeypatch):
+    monkeypatch.setattr(settings, "S3_MAX_IMAGE_BYTES", 10)
+    headers = {"Authorization": f"Bearer {test_register_and_login()}"}
+    files = {"file": ("cover.png", b"x" * 11, "image/png")}
+    response = client.post("/licenses/upload-image", files=files, headers=headers)
+    assert response.status_code == 413
+
+# Test uploads are typed by their content, not by the declared type
+def test_upload_image_not_an_image():
+    headers = {"Authorization": f"Bearer {test_register_and_login()}"}
+    files = {"file": ("cover.png", b"<html></html>", "text/html")}
+    response = client.post("/licenses/upload-image", files=files, headers=headers)
+    assert response.status_code == 400
+
+# Test presigned direct uploads
+def test_image_upload_url():
+    headers = {"Authorization": f"Bearer {test_register_and_login()}"}
+    sha256 = "ab" * 32
+    response = client.post("/licenses/upload-url", json={"content_type": "image/png", "sha256": sha256}, headers=headers)
+    assert response.status_code == 200
+    upload = response.json()
+    assert upload["key"] == f"images/{sha256}.png"
+    assert upload["fields"]["Content-Type"] == "image/png"
+    # S3 checks the bytes against the base64 of the same digest
+    assert upload["fields"]["x-amz-checksum-sha256"] == base64.b64encode(bytes.fromhex(sha256)).decode()
+    assert "policy" in upload["fields"]
+
+    response = client.post("/licenses/upload-url", json={"content_type": "text/html", "sha256": sha256}, headers=headers)
+    assert response.status_code == 422
+    response = client.post("/licenses/upload-url", json={"content_type": "image/png"}, headers=headers)
+    assert response.status_code == 422
+
+    response = client.post("/licenses/some-license/image", json={"key": "images/other.png"}, headers=headers)
+    assert response.status_code == 400
+
+# Test Prometheus metrics
+def test_metrics():
+    license_id = client.post("/licenses/", json={"product_name": "Metrics Test", "price": 1}).json()["license_id"]
+    client.get(f"/licenses/{license_id}")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/licenses/{license_id}"}' in body
+    if settings.STORAGE_BACKEND == "dynamodb":
+        assert 'dynamodb_call_duration_seconds_count{operation="put_item",table="Licenses"}' in body
+    assert "http_requests_in_flight" in body
+
+# Test per-request data-store call tracing
+def test_server_timing_and_call_budget(monkeypatch):
+    license_id = client.post("/licenses/", json={"product_name": "Trace Test", "price": 1}).json()["license_id"]
+    # Updates are a single conditional write
+    response = client.put(f"/licenses/{license_id}", json={"product_name": "Trace Test", "price": 2})
+    store = "memory" if settings.STORAGE_BACKEND == "memory" else "dynamodb"
+    assert f'{store};dur=' in response.headers["server-timing"]
+    assert 'desc="1 calls"' in response.headers["server-timing"]
+    assert "x-call-budget-exceeded" not in response.headers
+
+    monkeypatch.setattr(settings, "REQUEST_CALL_BUDGET", 1)
+    response = client.post("/licenses/batch-get", json={"license_ids": [license_id, "missing-1"]})
+    assert "x-call-budget-exceeded" not in response.headers
+    # Registration checks username and email before writing: three calls
+    response = client.post("/users/", json={"username": "budgetuser", "email": "budget@example.com", "password": "secret"})
+    assert response.headers["x-call-budget-exceeded"] == "3/1"
+
+    # With both off, requests are not traced at all
+    from app.core import tracing
+    monkeypatch.setattr(settings, "SERVER_TIMING_ENABLED", False)
+    monkeypatch.setattr(settings, "REQUEST_CALL_BUDGET", 0)
+    traces = []
+    monkeypatch.setattr(tracing.RequestTrace, "record", lambda trace, *args: traces.append(args))
+    response = client.put(f"/licenses/{license_id}", json={"product_name": "Trace Test", "price": 3})
+    assert response.status_code == 200
+    assert "server-timing" not in response.headers
+    assert traces == []
+    assert "x-request-id" in response.headers
+
+# Test on-demand request profiling
+def test_profile_request():
+    headers = {"Authorization": f"Bearer {get_admin_token()}"}
+    response = client.get("/licenses/", headers={**headers, "X-Profile": "1"})
+    assert response.status_code == 200
+    profile_id = response.headers["x-profile-id"]
+
+    profiles = client.get("/admin/profiles", headers=headers).json()
+    assert profiles[0]["id"] == profile_id
+    assert profiles[0]["path"] == "/licenses/"
+    response = client.get(f"/admin/profiles/{profile_id}", headers=headers)
+    assert response.status_code == 200
+
+    # Non-admins cannot trigger profiles
+    user_headers = {"Authorization": f"Bearer {test_register_and_login()}", "X-Profile": "1"}
+    response = client.get("/licenses/", headers=user_headers)
+    assert "x-profile-id" not in response.headers
+    assert client.get("/admin/profiles", headers=user_headers).status_code == 403
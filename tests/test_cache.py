@@ -0,0 +1,57 @@
+from app.core.cache import TTLCache
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_cache_hit_miss_and_expiry():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=5, timer=timer)
+    assert cache.get("a") is None
+    cache.set("a", {"license_id": "a"})
+    assert cache.get("a") == {"license_id": "a"}
+    timer.now = 6
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["expirations"] == 1
+
+def test_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.stats()["evictions"] == 1
+
+def test_cache_disabled_with_zero_ttl():
+    cache = TTLCache(maxsize=10, ttl=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+def test_cache_drops_fills_that_raced_an_invalidation():
+    cache = TTLCache(maxsize=1, ttl=60)
+    since = cache.version()
+    cache.pop("a")
+    cache.set("a", "stale", since=since)
+    assert cache.get("a") is None
+    cache.set("a", "fresh", since=cache.version())
+    assert cache.get("a") == "fresh"
+
+    # Still rejected once the pop itself was pushed out of the bounded log
+    since = cache.version()
+    cache.pop("a")
+    cache.pop("b")
+    cache.set("a", "stale", since=since)
+    assert "a" not in cache
+
+    since = cache.version()
+    cache.clear()
+    cache.set("b", "stale", since=since)
+    assert "b" not in cache
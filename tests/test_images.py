@@ -0,0 +1,126 @@
+import base64
+import hashlib
+import io
+import boto3
+import pytest
+from app.core.config import settings
+from app.services import thumbnails
+from app.services.s3_service import s3_service, sniff_image_type, InvalidImage, IMMUTABLE_CACHE_CONTROL
+
+moto = pytest.importorskip("moto")
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 32
+
+@pytest.fixture
+def s3(monkeypatch):
+    """In-process S3 with the service's bucket"""
+    with moto.mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=s3_service.bucket_name)
+        monkeypatch.setattr(s3_service, "s3_client", client)
+        yield client
+
+def content_key(data: bytes, extension: str) -> str:
+    return f"images/{hashlib.sha256(data).hexdigest()}.{extension}"
+
+def test_sniff_image_type():
+    assert sniff_image_type(PNG) == "image/png"
+    assert sniff_image_type(b"\xff\xd8\xff\xe0") == "image/jpeg"
+    assert sniff_image_type(b"GIF89a") == "image/gif"
+    assert sniff_image_type(b"RIFF\0\0\0\0WEBPVP8 ") == "image/webp"
+    assert sniff_image_type(b"<html>") is None
+
+def test_upload_uses_content_hash_key(s3):
+    # The sniffed type wins over the declared one
+    url = s3_service.upload_image(io.BytesIO(PNG), content_type="application/octet-stream")
+    key = content_key(PNG, "png")
+    assert url == s3_service.public_url(key)
+    head = s3.head_object(Bucket=s3_service.bucket_name, Key=key)
+    assert head["ContentType"] == "image/png"
+    assert head["CacheControl"] == IMMUTABLE_CACHE_CONTROL
+
+def test_upload_skips_existing_content(s3, monkeypatch):
+    url = s3_service.upload_image(io.BytesIO(PNG), content_type="image/png")
+
+    def fail(*args, **kwargs):
+        raise AssertionError("the same content was uploaded twice")
+
+    monkeypatch.setattr(s3, "upload_fileobj", fail)
+    assert s3_service.upload_image(io.BytesIO(PNG), content_type="image/png") == url
+
+class Stream(io.RawIOBase):
+    """Readable stream that cannot seek, like a request body read as it arrives"""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._data.readinto(buffer)
+
+def test_upload_unseekable_stream_gets_unique_key(s3):
+    url = s3_service.upload_image(Stream(PNG), content_type="application/octet-stream")
+    key = s3_service.key_from_url(url)
+    assert key.startswith("images/") and key.endswith(".png") and key != content_key(PNG, "png")
+    # The bytes read to sniff the type are still uploaded
+    assert s3.get_object(Bucket=s3_service.bucket_name, Key=key)["Body"].read() == PNG
+
+def test_upload_rejects_content_that_is_not_an_image(s3):
+    html = b"<html><script>alert(1)</script></html>"
+    for stream in (io.BytesIO(html), Stream(html)):
+        with pytest.raises(InvalidImage):
+            s3_service.upload_image(stream, content_type="image/png")
+    assert s3.list_objects_v2(Bucket=s3_service.bucket_name)["KeyCount"] == 0
+
+def test_presigned_upload_is_checked_without_downloading_it(s3, monkeypatch):
+    sha256 = hashlib.sha256(PNG).hexdigest()
+    upload = s3_service.presign_image_upload("image/png", sha256)
+    assert upload["key"] == content_key(PNG, "png")
+    checksum = upload["fields"]["x-amz-checksum-sha256"]
+    assert checksum == base64.b64encode(hashlib.sha256(PNG).digest()).decode()
+
+    # What S3 stores for the form once it verified the checksum
+    s3.put_object(
+        Bucket=s3_service.bucket_name, Key=upload["key"], Body=PNG,
+        ContentType="image/png", ChecksumSHA256=checksum
+    )
+    ranges = []
+    get_object = s3.get_object
+    monkeypatch.setattr(s3, "get_object", lambda **kwargs: ranges.append(kwargs.get("Range")) or get_object(**kwargs))
+    assert s3_service.check_upload(upload["key"])["ContentType"] == "image/png"
+    assert ranges == ["bytes=0-15"]
+
+    assert s3_service.check_upload(content_key(b"missing", "png")) is None
+    with pytest.raises(InvalidImage):
+        s3_service.check_upload("uploads/other.png")
+
+    # Content that is not the declared image is rejected and removed
+    html = b"<html></html>"
+    key = content_key(html, "png")
+    s3.put_object(Bucket=s3_service.bucket_name, Key=key, Body=html, ContentType="image/png")
+    with pytest.raises(InvalidImage):
+        s3_service.check_upload(key)
+    assert s3_service.head_image(key) is None
+
+def test_thumbnails(s3, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    monkeypatch.setattr(settings, "S3_THUMBNAIL_WIDTHS", "320,640")
+    buffer = io.BytesIO()
+    Image.new("RGB", (1000, 500), "red").save(buffer, "PNG")
+    url = s3_service.upload_image(io.BytesIO(buffer.getvalue()), content_type="image/png")
+    key = s3_service.key_from_url(url)
+
+    thumbnails._generate(key)
+    for width in (320, 640):
+        thumbnail = s3.get_object(Bucket=s3_service.bucket_name, Key=thumbnails.thumbnail_key(key, width))
+        assert thumbnail["ContentType"] == "image/webp"
+        assert thumbnail["CacheControl"] == IMMUTABLE_CACHE_CONTROL
+        with Image.open(io.BytesIO(thumbnail["Body"].read())) as image:
+            assert image.size == (width, width // 2)
+
+    # Variants already written are not rendered again
+    monkeypatch.setattr(thumbnails, "render_thumbnails", None)
+    thumbnails._generate(key)
+    assert thumbnails.thumbnail_urls(key)[320] == s3_service.public_url(thumbnails.thumbnail_key(key, 320))
@@ -0,0 +1,58 @@
+import io
+import json
+import logging
+import logging.handlers
+import uuid
+from fastapi.testclient import TestClient
+from app.main import app
+from app.core.config import settings
+from app.core.logging import configure_logging, shutdown_logging
+
+client = TestClient(app)
+
+def capture_logs() -> io.StringIO:
+    shutdown_logging()
+    stream = io.StringIO()
+    configure_logging(stream)
+    return stream
+
+def test_shutdown_detaches_queue_handler():
+    stream = capture_logs()
+    try:
+        logging.getLogger("app.test").warning("queued record")
+        shutdown_logging()
+        assert json.loads(stream.getvalue())["message"] == "queued record"
+
+        # Nothing is left queueing records without a listener
+        app_logger = logging.getLogger("app")
+        assert not any(isinstance(handler, logging.handlers.QueueHandler) for handler in app_logger.handlers)
+        assert app_logger.propagate
+
+        # And logging can be set up again, as on a second startup
+        stream = capture_logs()
+        logging.getLogger("app.test").warning("after restart")
+        shutdown_logging()
+        assert json.loads(stream.getvalue())["message"] == "after restart"
+    finally:
+        shutdown_logging()
+        configure_logging()
+
+def test_middleware_logs_carry_request_id(monkeypatch):
+    monkeypatch.setattr(settings, "REQUEST_CALL_BUDGET", 1)
+    stream = capture_logs()
+    try:
+        username = f"logtest{uuid.uuid4().hex[:8]}"
+        response = client.post(
+            "/users/",
+            json={"username": username, "email": f"{username}@example.com", "password": "secret"},
+            headers={"X-Request-ID": "log-test-request"}
+        )
+        assert response.headers["x-request-id"] == "log-test-request"
+        assert "x-call-budget-exceeded" in response.headers
+        shutdown_logging()
+        records = [json.loads(line) for line in stream.getvalue().splitlines()]
+        warning = next(record for record in records if "data-store calls (budget 1)" in record["message"])
+        assert warning["request_id"] == "log-test-request"
+    finally:
+        shutdown_logging()
+        configure_logging()
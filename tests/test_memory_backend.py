@@ -0,0 +1,140 @@
+import asyncio
+from decimal import Decimal
+import pytest
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from app.db.backends import MemoryStore
+from app.db.dynamodb import (
+    LICENSE_KEY_SCHEMA, LICENSE_ATTRIBUTE_DEFINITIONS, LICENSE_INDEXES,
+    USER_KEY_SCHEMA, USER_ATTRIBUTE_DEFINITIONS, USER_INDEXES
+)
+
+def make_store() -> MemoryStore:
+    store = MemoryStore()
+    store.create_table("Licenses", LICENSE_KEY_SCHEMA, LICENSE_ATTRIBUTE_DEFINITIONS, LICENSE_INDEXES)
+    store.create_table("Users", USER_KEY_SCHEMA, USER_ATTRIBUTE_DEFINITIONS, USER_INDEXES)
+    return store
+
+def test_index_queries_and_pagination():
+    async def scenario():
+        table = make_store().table("Licenses")
+        await table.batch_write([
+            {"license_id": f"l{n}", "category": "Gaming", "price": Decimal(n), "listing_status": "active"}
+            for n in (3, 1, 2)
+        ] + [{"license_id": "hidden", "category": "Gaming", "price": Decimal(5)}])
+
+        # Sparse index: the license without listing_status is left out
+        response = await table.query(
+            IndexName="active-price-index", KeyConditionExpression=Key("listing_status").eq("active"), Limit=2
+        )
+        assert [item["license_id"] for item in response["Items"]] == ["l1", "l2"]
+        response = await table.query(
+            IndexName="active-price-index", KeyConditionExpression=Key("listing_status").eq("active"),
+            Limit=2, ExclusiveStartKey=response["LastEvaluatedKey"]
+        )
+        assert [item["license_id"] for item in response["Items"]] == ["l3"]
+        assert "LastEvaluatedKey" not in response
+
+        response = await table.query(
+            IndexName="category-price-index",
+            KeyConditionExpression=Key("category").eq("Gaming") & Key("price").gte(Decimal(2)),
+            ScanIndexForward=False
+        )
+        assert [item["license_id"] for item in response["Items"]] == ["hidden", "l3", "l2"]
+
+        # Segmented scans cover every item exactly once
+        seen = []
+        for segment in range(3):
+            seen += [item["license_id"] for item in (await table.scan(Segment=segment, TotalSegments=3))["Items"]]
+        assert sorted(seen) == ["hidden", "l1", "l2", "l3"]
+
+    asyncio.run(scenario())
+
+def test_index_stays_ordered_across_updates():
+    async def scenario():
+        table = make_store().table("Licenses")
+        await table.batch_write([
+            {"license_id": f"l{n}", "category": "Gaming", "price": Decimal(n)} for n in range(5)
+        ])
+        # Repricing moves the item inside its partition, a new category moves it to another one
+        await table.update_item(
+            Key={"license_id": "l0"}, UpdateExpression="SET price = :p",
+            ExpressionAttributeValues={":p": Decimal(10)}
+        )
+        await table.update_item(
+            Key={"license_id": "l2"}, UpdateExpression="SET category = :c",
+            ExpressionAttributeValues={":c": "Office"}
+        )
+        await table.delete_item(Key={"license_id": "l3"})
+
+        pages, start = [], {}
+        while True:
+            response = await table.query(
+                IndexName="category-price-index", KeyConditionExpression=Key("category").eq("Gaming"),
+                ScanIndexForward=False, Limit=1, **start
+            )
+            pages += [item["license_id"] for item in response["Items"]]
+            if "LastEvaluatedKey" not in response:
+                break
+            start = {"ExclusiveStartKey": response["LastEvaluatedKey"]}
+        assert pages == ["l0", "l4", "l1"]
+
+    asyncio.run(scenario())
+
+def test_user_lookups_by_index():
+    async def scenario():
+        table = make_store().table("Users")
+        await table.put_item(Item={"user_id": "u1", "username": "alice", "email": "alice@example.com"})
+        response = await table.query(IndexName="email-index", KeyConditionExpression=Key("email").eq("alice@example.com"))
+        assert response["Items"][0]["user_id"] == "u1"
+        response = await table.query(IndexName="username-index", KeyConditionExpression=Key("username").eq("bob"))
+        assert response["Items"] == []
+
+    asyncio.run(scenario())
+
+def test_conditional_writes_and_transactions():
+    async def scenario():
+        table = make_store().table("Licenses")
+        await table.put_item(Item={"license_id": "a", "stock_quantity": 2})
+        reserve = {
+            "UpdateExpression": "ADD stock_quantity :delta",
+            "ConditionExpression": "stock_quantity >= :required",
+            "ExpressionAttributeValues": {":delta": -3, ":required": 3},
+            "ReturnValuesOnConditionCheckFailure": "ALL_OLD",
+        }
+        with pytest.raises(ClientError) as error:
+            await table.update_item(Key={"license_id": "a"}, **reserve)
+        assert error.value.response["Error"]["Code"] == "ConditionalCheckFailedException"
+        # Like DynamoDB, the old item comes back in the wire format
+        assert error.value.response["Item"]["stock_quantity"] == {"N": "2"}
+
+        await table.put_item(Item={"license_id": "b", "stock_quantity": 5})
+        with pytest.raises(ClientError) as error:
+            await table.transact_update([{"Key": {"license_id": "b"}, **reserve}, {"Key": {"license_id": "a"}, **reserve}])
+        reasons = error.value.response["CancellationReasons"]
+        assert [reason["Code"] for reason in reasons] == ["None", "ConditionalCheckFailed"]
+        # Nothing was written
+        assert (await table.get_item(Key={"license_id": "b"}))["Item"]["stock_quantity"] == 5
+
+        # Index keys keep their declared type, and unused values are rejected
+        with pytest.raises(ClientError) as error:
+            await table.put_item(Item={"license_id": "c", "price": "free"})
+        assert error.value.response["Error"]["Code"] == "ValidationException"
+        with pytest.raises(ClientError) as error:
+            await table.update_item(
+                Key={"license_id": "a"}, UpdateExpression="SET price = :price",
+                ExpressionAttributeValues={":price": 1, ":unused": 2}
+            )
+        assert error.value.response["Error"]["Code"] == "ValidationException"
+
+    asyncio.run(scenario())
+
+def test_incomplete_backend_fails_on_creation():
+    from app.db.backends import StorageTable
+
+    class ReadOnlyTable(StorageTable):
+        async def get_item(self, **kwargs) -> dict:
+            return {}
+
+    with pytest.raises(TypeError):
+        ReadOnlyTable()
@@ -0,0 +1,20 @@
+import asyncio
+import threading
+import pytest
+from app.core.security import PasswordHasher, PasswordHasherBusy
+
+def test_password_hasher_rejects_when_saturated():
+    hasher = PasswordHasher(workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.ensure_future(hasher.run(release.wait))
+        await asyncio.sleep(0)
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.run(release.wait)
+        release.set()
+        assert await first is True
+
+    asyncio.run(scenario())
+    assert hasher.stats()["rejected"] == 1
+    hasher.shutdown()